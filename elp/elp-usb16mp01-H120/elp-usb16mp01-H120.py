@@ -16,7 +16,7 @@ import numpy as np
 import threading
 import time
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 import queue
 import argparse
 from collections import deque
@@ -31,6 +31,17 @@ from functools import wraps
 # Flask imports for web server
 from flask import Flask, Response, render_template, request, redirect, url_for, session, send_file, jsonify
 
+# Cached timestamp overlay renderer, the one module shared with the ESP32 AVI converter,
+# imported from the converter's directory in this repository (see README.md)
+ESP32_CONVERTER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                   'esp', 'basic-cam-save-to-sd', 'arduino', 'esp-32-sd-card')
+sys.path.append(ESP32_CONVERTER_DIR)
+try:
+    from timestamp_overlay import format_utc_ms, get_renderer
+except ImportError as e:
+    raise ImportError(f"timestamp_overlay.py not found in {os.path.normpath(ESP32_CONVERTER_DIR)}, "
+                      f"run the recorder from a full checkout of the repository") from e
+
 # --- Configuration Constants ---
 ADJUSTMENT_INTERVAL = 1.0  # Seconds between image adjustments
 BRIGHTNESS_TARGET_LOW = 80 # Target average pixel value for "not too dark"
@@ -48,6 +59,10 @@ CLIP_DURATION_MINUTES = 1 # Duration of each video clip before a new one is star
 DIRECTORY_THRESHOLD_GB = 50 # GB of disk usage at which old files are deleted
 DISK_CHECK_INTERVAL_SECONDS = 60 # How often to check disk space
 
+# --- Timestamp Overlay ---
+TIMESTAMP_OVERLAY = get_renderer(font_scale=0.7, thickness=2, color=(0, 255, 0), # Green BGR
+                                 background_color=(0, 0, 0), padding=5, line_type=cv2.LINE_AA)
+
 # --- Authentication Constants ---
 # Set WEB_PASSWORD environment variable to protect access
 WEB_PASSWORD = os.environ.get('WEB_PASSWORD', None)
@@ -980,36 +995,12 @@ class VideoRecorder:
                 if not frame.flags['WRITEABLE']:
                     frame = frame.copy() # Make a writable copy if needed
 
-                utc_now = datetime.now(timezone.utc)
-                timestamp_str = utc_now.strftime("%Y-%m-%d %H:%M:%S.%f UTC")[:-3] # Milliseconds up to 3 digits
+                # Milliseconds up to 3 digits, the date/time part is only formatted once per second
+                timestamp_str = format_utc_ms(int(time.time() * 1000)) + " UTC"
 
-                # Define text properties (adjust as needed for visibility)
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                font_scale = 0.7
-                font_thickness = 2
-                text_color = (0, 255, 0) # Green BGR
-                text_color_bg = (0, 0, 0) # Black BGR for background rectangle
-
-                # Get text size
-                (text_width, text_height), baseline = cv2.getTextSize(timestamp_str, font, font_scale, font_thickness)
-                
-                # Position text: bottom-left corner with some padding
-                text_offset_x = 10
-                text_offset_y = frame.shape[0] - 10 # 10 pixels from bottom
-                
-                # Draw a filled rectangle as a background for better visibility
-                # Add some padding around the text
-                padding = 5
-                rect_start_x = text_offset_x - padding
-                rect_start_y = text_offset_y - text_height - baseline - padding
-                rect_end_x = text_offset_x + text_width + padding
-                rect_end_y = text_offset_y + padding
-                
-                cv2.rectangle(frame, (rect_start_x, rect_start_y), (rect_end_x, rect_end_y), text_color_bg, -1)
-                
-                # Put the text on the frame
-                cv2.putText(frame, timestamp_str, (text_offset_x, text_offset_y - baseline),
-                            font, font_scale, text_color, font_thickness, cv2.LINE_AA)
+                # Green text on a black box, 10 pixels from the bottom-left corner,
+                # composited in place from glyphs rasterized once per process
+                TIMESTAMP_OVERLAY.draw(frame, [timestamp_str], x=10, y=10, from_bottom=True)
                 # --- End timestamp drawing ---
 
                 start_time = self.clip_start_times.get(camera_name)
@@ -0,0 +1,237 @@
+"""
+Motion-activity index of ESP32 recordings from their JPEG chunk sizes
+
+A JPEG of a static scene keeps about the same size from frame to frame,
+while motion changes the detail the encoder has to spend bits on. The
+'00dc' chunk sizes are known from the scan without reading a single frame,
+so the change in chunk size is a free proxy for scene change.
+
+compute_activity() bins the relative frame-to-frame size change per second
+(bin_ms) of stitched TIMS time. add_frame_difference() optionally adds the
+mean absolute difference of one 1/8 size grayscale decode per bin. Both are
+turned into robust z-scores against the clip's own median, so the threshold
+does not depend on resolution or JPEG quality, and find_segments() returns
+the spans above the threshold for conversion or review.
+
+ActivityGate plans an activity-gated conversion: the frames of the active
+segments plus pre/post roll, and one still frame for every idle stretch.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+# 1.4826 * MAD estimates the standard deviation of normally distributed data
+_MAD_SCALE = 1.4826
+
+
+def robust_z(values: np.ndarray) -> np.ndarray:
+    """(values - median) / (1.4826 * MAD), or the mean absolute deviation when the MAD is 0"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    median = np.median(values)
+    spread = _MAD_SCALE * np.median(np.abs(values - median))
+    if spread <= 0:
+        # Mostly identical values, anything that differs stands out
+        spread = max(float(np.mean(np.abs(values - median))), 1e-9)
+    return (values - median) / spread
+
+
+class ActivityCurve:
+    """Per-bin activity of a clip, bins of bin_ms starting at the first frame"""
+
+    def __init__(self, timeline_ms: np.ndarray, bin_ms: int, frame_bins: np.ndarray, size_change: np.ndarray,
+                 frame_counts: np.ndarray):
+        self.timeline_ms = timeline_ms      # Stitched TIMS time of every frame
+        self.bin_ms = bin_ms
+        self.frame_bins = frame_bins        # Bin of every frame
+        self.size_change = size_change      # Mean relative chunk size change per bin
+        self.frame_counts = frame_counts    # Frames per bin, 0 for gaps in the recording
+        self.frame_difference: Optional[np.ndarray] = None  # Mean abs pixel difference per bin (0-1)
+
+    def __len__(self):
+        return len(self.frame_counts)
+
+    @property
+    def start_ms(self) -> int:
+        return int(self.timeline_ms[0]) if len(self.timeline_ms) else 0
+
+    def bin_start_ms(self, index: int) -> int:
+        return self.start_ms + index * self.bin_ms
+
+    def scores(self) -> np.ndarray:
+        """Activity score per bin: the larger robust z-score of the signals, 0 for empty bins"""
+        occupied = self.frame_counts > 0
+        score = np.zeros(len(self), dtype=np.float64)
+        if not occupied.any():
+            return score
+        score[occupied] = robust_z(self.size_change[occupied])
+        if self.frame_difference is not None:
+            score[occupied] = np.maximum(score[occupied], robust_z(self.frame_difference[occupied]))
+        return score
+
+
+def compute_activity(timeline_ms: np.ndarray, frame_sizes: np.ndarray, bin_ms: int = 1000) -> ActivityCurve:
+    """Bin the relative change in JPEG chunk size between consecutive frames"""
+    times = np.asarray(timeline_ms, dtype=np.int64)
+    sizes = np.asarray(frame_sizes, dtype=np.float64)
+    count = min(len(times), len(sizes))
+    times, sizes = times[:count], sizes[:count]
+    bin_ms = max(int(bin_ms), 1)
+    if count == 0:
+        empty = np.zeros(0)
+        return ActivityCurve(times, bin_ms, np.zeros(0, dtype=np.int64), empty, np.zeros(0, dtype=np.int64))
+
+    typical = float(np.median(sizes)) or 1.0
+    change = np.concatenate([[0.0], np.abs(np.diff(sizes)) / typical])
+    frame_bins = np.maximum((times - times[0]) // bin_ms, 0)
+    bins = int(frame_bins.max()) + 1
+    counts = np.bincount(frame_bins, minlength=bins)
+    totals = np.bincount(frame_bins, weights=change, minlength=bins)
+    mean_change = np.divide(totals, counts, out=np.zeros(bins), where=counts > 0)
+    return ActivityCurve(times, bin_ms, frame_bins, mean_change, counts)
+
+
+def add_frame_difference(curve: ActivityCurve, read_jpeg: Callable[[int], bytes], reduction: int = 8):
+    """Decode the first frame of every bin as 1/reduction grayscale and store the difference to the previous one"""
+    flags = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+             8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+    first_frames = np.searchsorted(curve.frame_bins, np.arange(len(curve)), side='left')
+    difference = np.zeros(len(curve), dtype=np.float64)
+    previous = None
+    for index in np.flatnonzero(curve.frame_counts > 0).tolist():
+        jpeg = read_jpeg(int(first_frames[index]))
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), flags.get(reduction, cv2.IMREAD_GRAYSCALE))
+        if frame is None:
+            continue
+        if previous is not None and previous.shape == frame.shape:
+            difference[index] = float(cv2.absdiff(frame, previous).mean()) / 255.0
+        previous = frame
+    curve.frame_difference = difference
+
+
+def find_segments(curve: ActivityCurve, threshold: float = 3.0, min_gap_ms: int = 2000,
+                  min_length_ms: int = 0) -> List[Dict]:
+    """Spans of bins scoring at least threshold, merged across gaps shorter than min_gap_ms
+
+    Each segment gives its stitched start/end time, its frames [first_frame,
+    end_frame) and its peak score.
+    """
+    scores = curve.scores()
+    active = scores >= threshold
+    if not active.any():
+        return []
+
+    # Runs of active bins
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    merge_bins = max(min_gap_ms // curve.bin_ms, 0)
+    runs = [[int(starts[0]), int(ends[0])]]
+    for start, end in zip(starts[1:].tolist(), ends[1:].tolist()):
+        if start - runs[-1][1] <= merge_bins:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+
+    segments = []
+    for start, end in runs:
+        if (end - start) * curve.bin_ms < min_length_ms:
+            continue
+        start_ms, end_ms = curve.bin_start_ms(start), curve.bin_start_ms(end)
+        first_frame = int(np.searchsorted(curve.frame_bins, start, side='left'))
+        end_frame = int(np.searchsorted(curve.frame_bins, end, side='left'))
+        segments.append({'start_ms': start_ms, 'end_ms': end_ms, 'first_frame': first_frame,
+                         'end_frame': end_frame, 'peak_score': round(float(scores[start:end].max()), 2)})
+    return segments
+
+
+def activity_report(curve: ActivityCurve, segments: List[Dict], threshold: float) -> Dict:
+    """JSON-ready summary of a clip's activity, including the per-bin curve"""
+    active_ms = sum(s['end_ms'] - s['start_ms'] for s in segments)
+    duration_ms = len(curve) * curve.bin_ms
+    return {
+        'bin_ms': curve.bin_ms,
+        'threshold': threshold,
+        'frames': int(curve.frame_counts.sum()),
+        'start_ms': curve.start_ms,
+        'duration_ms': duration_ms,
+        'active_ms': active_ms,
+        'active_fraction': round(active_ms / duration_ms, 4) if duration_ms else 0.0,
+        'frame_difference': curve.frame_difference is not None,
+        'segments': segments,
+        'curve': [round(float(score), 2) for score in curve.scores()],
+    }
+
+
+class GatePlan:
+    """Frames to convert, in order, and the idle stretches collapsed into still frames"""
+
+    def __init__(self, rows: np.ndarray, is_gap: np.ndarray, skipped_frames: np.ndarray,
+                 idle_ms: np.ndarray, segments: List[Dict]):
+        self.rows = rows                      # Frame rows to read
+        self.is_gap = is_gap                  # True where the row is the still of an idle stretch
+        self.skipped_frames = skipped_frames  # Per row, frames of the idle stretch it stands for
+        self.idle_ms = idle_ms                # Per row, length of that idle stretch
+        self.segments = segments
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def gaps(self) -> int:
+        return int(np.count_nonzero(self.is_gap))
+
+    def output_times_ms(self, timeline_ms: np.ndarray, gap_still_ms: int) -> np.ndarray:
+        """Stitched time of every planned frame, with each idle stretch shortened to gap_still_ms"""
+        times = np.asarray(timeline_ms, dtype=np.int64)[self.rows]
+        if len(times) < 2:
+            return times
+        steps = np.diff(times)
+        steps[self.is_gap[:-1]] = gap_still_ms
+        return times[0] + np.concatenate([[0], np.cumsum(steps)])
+
+
+class ActivityGate:
+    """Settings of an activity-gated conversion, see plan()"""
+
+    def __init__(self, threshold: float = 3.0, bin_s: float = 1.0, pre_roll_s: float = 2.0,
+                 post_roll_s: float = 2.0, gap_still_s: float = 1.0, min_gap_s: float = 2.0):
+        self.threshold = threshold
+        self.bin_s = bin_s
+        self.pre_roll_s = pre_roll_s
+        self.post_roll_s = post_roll_s
+        self.gap_still_s = gap_still_s    # How long each idle stretch is shown in the output
+        self.min_gap_s = min_gap_s        # Active spans closer than this are merged
+
+    def plan(self, timeline_ms: np.ndarray, frame_sizes: np.ndarray) -> GatePlan:
+        """Keep the frames within pre/post roll of an active segment, one still per idle stretch"""
+        times = np.asarray(timeline_ms, dtype=np.int64)
+        curve = compute_activity(times, frame_sizes, int(self.bin_s * 1000))
+        segments = find_segments(curve, self.threshold, min_gap_ms=int(self.min_gap_s * 1000))
+
+        keep = np.zeros(len(times), dtype=bool)
+        for segment in segments:
+            first = np.searchsorted(times, segment['start_ms'] - int(self.pre_roll_s * 1000), side='left')
+            last = np.searchsorted(times, segment['end_ms'] + int(self.post_roll_s * 1000), side='left')
+            keep[first:last] = True
+
+        # Idle stretches are the runs of frames that are not kept
+        edges = np.diff(np.concatenate([[0], (~keep).astype(np.int8), [0]]))
+        idle_starts = np.flatnonzero(edges == 1)
+        idle_ends = np.flatnonzero(edges == -1)
+        is_gap = np.zeros(len(times), dtype=bool)
+        is_gap[idle_starts] = True
+        skipped = np.zeros(len(times), dtype=np.int64)
+        skipped[idle_starts] = idle_ends - idle_starts
+        idle_ms = np.zeros(len(times), dtype=np.int64)
+        if len(idle_starts):
+            # Until the next kept frame, or the last frame for an idle end of the clip
+            stop = times[np.minimum(idle_ends, len(times) - 1)]
+            idle_ms[idle_starts] = stop - times[idle_starts]
+
+        rows = np.flatnonzero(keep | is_gap)
+        return GatePlan(rows, is_gap[rows], skipped[rows], idle_ms[rows], segments)
@@ -0,0 +1,78 @@
+"""
+AVI layout written by esp-32-sd-card.ino
+
+startVideoFile() writes a fixed 212 byte header (AVIHeader, StreamHeader,
+BitmapInfo) and the 'LIST' size 'movi' header, then every frame is a
+'00dc' JPEG chunk followed by a 16 byte 'TIMS' chunk. finishVideoFile()
+patches the RIFF size, total frames and movi size at the end. No idx1
+index is written by the camera.
+
+avi_headers() builds those headers and patch_header() sets the fields
+finishVideoFile() writes (plus the frame rate and stream length), for the
+tools that write this layout: synthetic_avi.py, avi_salvage.py and the
+stream recorder of the server scripts.
+
+The server scripts (esp/http/esp32-CAM-MB/server-scripts) import this
+module from here, keep it free of dependencies beyond numpy.
+"""
+
+import struct
+
+import numpy as np
+
+HEADER_SIZE = 212              # sizeof(AVIHeader) + sizeof(StreamHeader) + sizeof(BitmapInfo)
+MOVI_START = HEADER_SIZE + 12  # First chunk after 'LIST' size 'movi'
+AVIIF_KEYFRAME = 0x10
+
+# Fields set by finishVideoFile() and patch_header()
+RIFF_SIZE_OFFSET = 4
+MICRO_SEC_PER_FRAME_OFFSET = 32
+TOTAL_FRAMES_OFFSET = 48
+STREAM_SCALE_OFFSET = 128  # followed by the rate
+STREAM_LENGTH_OFFSET = 140
+MOVI_SIZE_OFFSET = HEADER_SIZE + 4
+
+
+def avi_headers(width: int, height: int, fps: int) -> bytes:
+    """AVIHeader, StreamHeader, BitmapInfo and MovieHeader as written by startVideoFile()"""
+    max_bytes_per_sec = (120 * 1024) * fps or 3000000
+    avi_header = struct.pack('<4sI4s4sI4s4sI14I',
+                             b'RIFF', 0, b'AVI ', b'LIST', 88 + 76 + 48 - 20, b'hdrl',
+                             b'avih', 56, 1000000 // fps, max_bytes_per_sec, 0, 0x10,
+                             0, 0, 1, 0, width, height, 0, 0, 0, 0)
+    stream_header = struct.pack('<4sI4s4sI4s4sIHHIIIIIIIIHHHH',
+                                b'LIST', 76 + 48 - 8, b'strl', b'strh', 56, b'vids', b'MJPG',
+                                0, 0, 0, 0, 1, fps, 0, 0, max_bytes_per_sec, 0, 0,
+                                0, 0, width, height)
+    bitmap_info = struct.pack('<4sIIiiHHIIiiII', b'strf', 40, 40, width, height, 1, 24,
+                              0x47504A4D, 0, 0, 0, 0, 0)
+    movie_header = struct.pack('<4sI4s', b'LIST', 4, b'movi')
+    return avi_header + stream_header + bitmap_info + movie_header
+
+
+def valid_header(header: bytes) -> bool:
+    return (len(header) >= MOVI_START and header[0:4] == b'RIFF' and header[8:12] == b'AVI '
+            and header[12:16] == b'LIST' and header[20:24] == b'hdrl'
+            and header[HEADER_SIZE:HEADER_SIZE + 4] == b'LIST'
+            and header[HEADER_SIZE + 8:MOVI_START] == b'movi')
+
+
+def median_fps(timestamps_ms: np.ndarray) -> float:
+    """Typical frame rate of TIMS values, 0.0 if unknown
+
+    The median interval is not thrown off by a millis() -> NTP jump.
+    """
+    intervals = np.diff(np.asarray(timestamps_ms).astype(np.int64))
+    intervals = intervals[intervals > 0]
+    return 1000.0 / float(np.median(intervals)) if len(intervals) else 0.0
+
+
+def patch_header(header: bytearray, frames: int, file_size: int, movi_end: int, fps: float):
+    """Set the sizes, frame counts and (if fps > 0) frame rate that finishVideoFile() leaves wrong"""
+    struct.pack_into('<I', header, RIFF_SIZE_OFFSET, file_size - 8)
+    struct.pack_into('<I', header, TOTAL_FRAMES_OFFSET, frames)
+    struct.pack_into('<I', header, STREAM_LENGTH_OFFSET, frames)
+    struct.pack_into('<I', header, MOVI_SIZE_OFFSET, movi_end - (HEADER_SIZE + 8))
+    if fps > 0:
+        struct.pack_into('<I', header, MICRO_SEC_PER_FRAME_OFFSET, int(round(1000000.0 / fps)))
+        struct.pack_into('<II', header, STREAM_SCALE_OFFSET, 1000, int(round(fps * 1000)))
@@ -0,0 +1,86 @@
+"""
+Repair of ESP32 AVIs whose recording was cut short
+
+When the camera loses power, finishVideoFile() never runs: the RIFF size is
+garbage, the movi LIST size is the placeholder 4 and the total frame count
+is 0, and the last chunk may be cut off. Many players (and cv2.VideoCapture)
+then see no frames at all.
+
+salvage_avi() rebuilds the frame table with avi_scan (the chunk walk, or the
+pattern search when the chunk sizes are corrupt), pairs every '00dc' chunk
+with the TIMS chunk that follows it, and writes a new AVI: the original
+headers with correct sizes, frame count and frame rate, the frame and TIMS
+chunks copied byte for byte, and an idx1 index of the frames. Nothing is
+decoded or re-encoded, so a clip is repaired at disk speed.
+"""
+
+import mmap
+import struct
+from typing import Dict
+
+import numpy as np
+
+from avi_layout import AVIIF_KEYFRAME, HEADER_SIZE, MOVI_START, median_fps, patch_header, valid_header
+from avi_scan import JPEG_SOI, TIMS_CHUNK_SIZE, pair_frames, scan_avi
+
+
+def salvage_avi(input_path: str, output_path: str, use_index: bool = True) -> Dict:
+    """Write a repaired copy of input_path to output_path, returning a report of what was recovered"""
+    result = scan_avi(input_path, use_index=use_index)
+    pairs = pair_frames(result)
+    report = {'input': input_path, 'output': output_path, 'method': result.method,
+              'truncated': result.truncated, 'frame_chunks': result.frame_count,
+              'tims_chunks': len(result), 'frames_written': 0, 'frames_without_tims': 0,
+              'frames_dropped': 0, 'bytes_written': 0}
+
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header = bytearray(mm[:MOVI_START])
+        if not valid_header(header):
+            raise ValueError(f"{input_path} does not start with the esp-32-sd-card.ino AVI header")
+
+        # Frames whose payload is not a JPEG (e.g. a garbage chunk size led the
+        # walk astray) are dropped, they would only break decoders
+        keep = []
+        for i in range(result.frame_count):
+            start = int(result.frame_offsets[i]) + 8
+            if mm[start:start + 2] == JPEG_SOI:
+                keep.append(i)
+        report['frames_dropped'] = result.frame_count - len(keep)
+
+        index_entries = []
+        with open(output_path, 'wb') as out:
+            out.write(header)
+            position = MOVI_START
+            for i in keep:
+                frame_offset = int(result.frame_offsets[i])
+                frame_size = int(result.frame_sizes[i])
+                # idx1 offsets are relative to the 'movi' FOURCC
+                index_entries.append(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME,
+                                                 position - (HEADER_SIZE + 8), frame_size))
+                out.write(mm[frame_offset:frame_offset + 8 + frame_size])
+                if frame_size & 1:
+                    out.write(b'\x00')  # The padding byte may be missing in a truncated file
+                position += 8 + frame_size + (frame_size & 1)
+                if pairs[i] >= 0:
+                    tims_offset = int(result.tims_offsets[pairs[i]])
+                    out.write(mm[tims_offset:tims_offset + TIMS_CHUNK_SIZE])
+                    position += TIMS_CHUNK_SIZE
+                else:
+                    report['frames_without_tims'] += 1
+            movi_end = position
+
+            out.write(struct.pack('<4sI', b'idx1', 16 * len(index_entries)))
+            out.write(b''.join(index_entries))
+            file_size = out.tell()
+
+            # Typical frame rate of the recovered frames, for players that ignore TIMS
+            paired = pairs[keep][pairs[keep] >= 0] if keep else np.empty(0, dtype=np.int64)
+            fps = median_fps(result.timestamps[paired])
+            patch_header(header, len(keep), file_size, movi_end, fps)
+            out.seek(0)
+            out.write(header)
+
+    report['frames_written'] = len(keep)
+    report['bytes_written'] = file_size
+    report['fps'] = fps
+    return report
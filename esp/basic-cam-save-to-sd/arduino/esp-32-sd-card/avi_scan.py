@@ -0,0 +1,319 @@
+"""
+Chunk scanner for the AVI files written by esp-32-sd-card.ino
+
+The firmware writes a fixed hdrl LIST followed by a movi LIST in which every
+frame is a '00dc' JPEG chunk immediately followed by a 16 byte 'TIMS' chunk
+holding the capture time in milliseconds.
+
+scan_avi() memory-maps the file and walks that chunk structure, skipping the
+JPEG payloads by their size field, so only the chunk headers are read.
+When the structure is corrupt it falls back to a vectorized search for the
+'TIMS' + size=8 pattern over the whole mapping.
+
+The result is cached in a binary sidecar index (<clip>.avi.tidx) holding the
+frame offsets, frame sizes and TIMS values. The index records the size and
+mtime of the AVI it was built from and is rebuilt whenever either changes.
+"""
+
+import mmap
+import os
+import struct
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+FRAME_CHUNK_ID = b'00dc'
+TIMS_CHUNK_ID = b'TIMS'
+TIMS_CHUNK_SIZE = 16  # 'TIMS' + uint32 size + uint64 unix_epoch_ms
+TIMS_PATTERN = b'TIMS\x08\x00\x00\x00'  # TIMS + size=8 in little endian
+JPEG_SOI = b'\xff\xd8'
+
+INDEX_SUFFIX = '.tidx'
+INDEX_MAGIC = b'TIMSIDX1'
+INDEX_VERSION = 1
+
+_CHUNK_HEADER = struct.Struct('<4sI')
+_UINT64 = struct.Struct('<Q')
+# magic, version, avi size, avi mtime_ns, frame count, TIMS count, skipped TIMS, method, truncated
+_INDEX_HEADER = struct.Struct('<8sIQqIIIBB2x')
+_INDEX_METHODS = ['structure', 'pattern', 'empty']
+
+
+class AVIScanResult:
+    """Chunk offsets and TIMS values found in one AVI file"""
+
+    def __init__(self, frame_offsets: np.ndarray, frame_sizes: np.ndarray,
+                 tims_offsets: np.ndarray, timestamps: np.ndarray,
+                 method: str, truncated: bool = False, skipped_tims: int = 0):
+        self.frame_offsets = frame_offsets  # int64, file offset of each '00dc' chunk header
+        self.frame_sizes = frame_sizes      # uint32, JPEG payload size of each '00dc' chunk
+        self.tims_offsets = tims_offsets    # int64, file offset of each 'TIMS' chunk header
+        self.timestamps = timestamps        # uint64, unix_epoch_ms of each 'TIMS' chunk
+        self.method = method                # 'structure', 'pattern' or 'empty'
+        self.truncated = truncated          # last chunk runs past the end of the file
+        self.skipped_tims = skipped_tims    # TIMS chunks dropped for a bad size or zero value
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.frame_offsets)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+def pair_frames(result: AVIScanResult) -> np.ndarray:
+    """For every frame chunk, the row of the TIMS chunk that follows it, or -1
+
+    The firmware writes each TIMS chunk right after its '00dc' chunk, so a
+    frame is paired with the first TIMS chunk between it and the next frame.
+    Frames whose TIMS chunk is missing, or was skipped for a bad size or a
+    zero value, get -1.
+    """
+    frame_offsets = result.frame_offsets
+    tims_offsets = result.tims_offsets
+    if len(frame_offsets) == 0:
+        return np.empty(0, dtype=np.int64)
+    rows = np.searchsorted(tims_offsets, frame_offsets, side='right')
+    next_frame = np.append(frame_offsets[1:], np.iinfo(np.int64).max)
+    found = rows < len(tims_offsets)
+    found[found] = tims_offsets[rows[found]] < next_frame[found]
+    return np.where(found, rows, -1).astype(np.int64)
+
+
+def frame_timestamps(result: AVIScanResult) -> Tuple[np.ndarray, np.ndarray]:
+    """TIMS value of every frame chunk, paired by chunk order, and a mask of the interpolated ones
+
+    Frames without a TIMS chunk get a value interpolated between the nearest
+    paired frames (extrapolated at the median interval at either end), so one
+    missing chunk does not shift the timestamps of every frame after it.
+    """
+    pairs = pair_frames(result)
+    known = pairs >= 0
+    values = np.zeros(len(pairs), dtype=np.uint64)
+    values[known] = result.timestamps[pairs[known]]
+    interpolated = ~known
+    if not known.any() or known.all():
+        return values, interpolated
+
+    rows = np.flatnonzero(known)
+    missing = np.flatnonzero(interpolated)
+    known_values = values[rows].astype(np.float64)
+    estimate = np.interp(missing, rows, known_values)
+    if len(rows) > 1:
+        step = float(np.median(np.diff(known_values) / np.diff(rows)))
+        before = missing < rows[0]
+        after = missing > rows[-1]
+        estimate[before] = known_values[0] - (rows[0] - missing[before]) * step
+        estimate[after] = known_values[-1] + (missing[after] - rows[-1]) * step
+    values[missing] = np.round(np.maximum(estimate, 1.0)).astype(np.uint64)
+    return values, interpolated
+
+
+def _empty_result(method: str) -> AVIScanResult:
+    return AVIScanResult(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint32),
+                         np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64), method)
+
+
+def _is_fourcc(chunk_id: bytes) -> bool:
+    """True if chunk_id looks like a RIFF FOURCC (alphanumeric, space padded)"""
+    stripped = chunk_id.rstrip(b' ')
+    return len(stripped) > 0 and stripped.isalnum()
+
+
+def _walk_chunks(mm: mmap.mmap, file_size: int) -> Optional[AVIScanResult]:
+    """Walk the RIFF/movi chunk structure, returning None if it is corrupt"""
+    if file_size < 12 or mm[0:4] != b'RIFF' or mm[8:12] != b'AVI ':
+        return None
+
+    # Find the movi LIST. The RIFF size is only patched in finishVideoFile(),
+    # so it is ignored and the top level is walked up to the end of the file.
+    pos = 12
+    movi_size = None
+    while pos + 12 <= file_size:
+        chunk_id, size = _CHUNK_HEADER.unpack_from(mm, pos)
+        if chunk_id == b'LIST' and mm[pos + 8:pos + 12] == b'movi':
+            movi_size = size
+            break
+        if not _is_fourcc(chunk_id):
+            return None
+        pos += 8 + size + (size & 1)
+    if movi_size is None:
+        return None
+
+    # A clip cut short by power loss still carries the placeholder size of 4
+    movi_end = pos + 8 + movi_size
+    if movi_size <= 4 or movi_end > file_size:
+        movi_end = file_size
+
+    frame_offsets: List[int] = []
+    frame_sizes: List[int] = []
+    tims_offsets: List[int] = []
+    timestamps: List[int] = []
+    skipped_tims = 0
+    truncated = False
+
+    pos += 12
+    while pos + 8 <= movi_end:
+        chunk_id, size = _CHUNK_HEADER.unpack_from(mm, pos)
+        if not _is_fourcc(chunk_id):
+            return None
+
+        if chunk_id == b'LIST':
+            pos += 12  # Descend into 'rec ' lists
+            continue
+
+        end = pos + 8 + size
+        if end > movi_end:
+            # Either the last chunk was cut off, or its size field is garbage
+            # and there is more data after it
+            if mm.find(TIMS_PATTERN, pos + 8) != -1:
+                return None
+            truncated = True
+            break
+
+        if chunk_id == FRAME_CHUNK_ID:
+            frame_offsets.append(pos)
+            frame_sizes.append(size)
+        elif chunk_id == TIMS_CHUNK_ID:
+            unix_epoch_ms = _UINT64.unpack_from(mm, pos + 8)[0] if size == 8 else 0
+            if unix_epoch_ms > 0:
+                tims_offsets.append(pos)
+                timestamps.append(unix_epoch_ms)
+            else:
+                skipped_tims += 1
+
+        pos = end + (size & 1)
+
+    return AVIScanResult(np.array(frame_offsets, dtype=np.int64),
+                         np.array(frame_sizes, dtype=np.uint32),
+                         np.array(tims_offsets, dtype=np.int64),
+                         np.array(timestamps, dtype=np.uint64),
+                         'structure', truncated, skipped_tims)
+
+
+def _find_all(mm: mmap.mmap, pattern: bytes, step: int) -> np.ndarray:
+    offsets = []
+    pos = mm.find(pattern)
+    while pos != -1:
+        offsets.append(pos)
+        pos = mm.find(pattern, pos + step)
+    return np.array(offsets, dtype=np.int64)
+
+
+def _gather_uint(buf: np.ndarray, offsets: np.ndarray, width: int) -> np.ndarray:
+    """Read a little endian unsigned int of `width` bytes at every offset"""
+    index = offsets[:, None] + np.arange(width, dtype=np.int64)
+    return buf[index].view(f'<u{width}').reshape(-1)
+
+
+def _search_pattern(mm: mmap.mmap, file_size: int) -> AVIScanResult:
+    """Fallback for corrupt files: locate TIMS and JPEG frame chunks by pattern"""
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    try:
+        tims_offsets = _find_all(mm, TIMS_PATTERN, TIMS_CHUNK_SIZE)
+        tims_offsets = tims_offsets[tims_offsets + TIMS_CHUNK_SIZE <= file_size]
+        timestamps = _gather_uint(buf, tims_offsets + 8, 8)
+        valid = timestamps > 0
+        skipped_tims = int(np.count_nonzero(~valid))
+
+        # '00dc' can occur inside JPEG data, so only keep hits whose size
+        # fits in the file and whose payload starts with a JPEG SOI marker
+        frame_offsets = _find_all(mm, FRAME_CHUNK_ID, 8)
+        frame_offsets = frame_offsets[frame_offsets + 10 <= file_size]
+        frame_sizes = _gather_uint(buf, frame_offsets + 4, 4)
+        plausible = ((frame_offsets + 8 + frame_sizes.astype(np.int64) <= file_size)
+                     & (buf[frame_offsets + 8] == JPEG_SOI[0])
+                     & (buf[frame_offsets + 9] == JPEG_SOI[1]))
+
+        return AVIScanResult(frame_offsets[plausible], frame_sizes[plausible],
+                             tims_offsets[valid], timestamps[valid],
+                             'pattern', skipped_tims=skipped_tims)
+    finally:
+        # The mmap cannot be closed while a NumPy view still exports it
+        del buf
+
+
+def scan_file(file: BinaryIO) -> AVIScanResult:
+    """Scan an open AVI file for frame and TIMS chunks"""
+    file_size = os.fstat(file.fileno()).st_size
+    if file_size == 0:
+        return _empty_result('empty')
+
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        result = _walk_chunks(mm, file_size)
+        if result is None or len(result) == 0:
+            result = _search_pattern(mm, file_size)
+    return result
+
+
+def index_path(filepath: str) -> str:
+    """Path of the sidecar index for the AVI file at filepath"""
+    return filepath + INDEX_SUFFIX
+
+
+def load_index(filepath: str) -> Optional[AVIScanResult]:
+    """Load the sidecar index of filepath, or None if it is missing or stale"""
+    try:
+        stat = os.stat(filepath)
+        with open(index_path(filepath), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if len(data) < _INDEX_HEADER.size:
+        return None
+    (magic, version, file_size, mtime_ns, frame_count, tims_count,
+     skipped_tims, method, truncated) = _INDEX_HEADER.unpack_from(data, 0)
+    if (magic != INDEX_MAGIC or version != INDEX_VERSION
+            or file_size != stat.st_size or mtime_ns != stat.st_mtime_ns):
+        return None
+    if len(data) != _INDEX_HEADER.size + frame_count * 12 + tims_count * 16:
+        return None
+
+    pos = _INDEX_HEADER.size
+    arrays = []
+    for dtype, count in (('<i8', frame_count), ('<u4', frame_count),
+                         ('<i8', tims_count), ('<u8', tims_count)):
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+        arrays.append(array)
+        pos += array.nbytes
+
+    return AVIScanResult(*arrays, method=_INDEX_METHODS[method],
+                         truncated=bool(truncated), skipped_tims=skipped_tims)
+
+
+def save_index(filepath: str, result: AVIScanResult) -> bool:
+    """Write the sidecar index of filepath, returning False if it can't be written"""
+    stat = os.stat(filepath)
+    header = _INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                result.frame_count, len(result), result.skipped_tims,
+                                _INDEX_METHODS.index(result.method), result.truncated)
+    target = index_path(filepath)
+    temp = target + '.tmp'
+    try:
+        with open(temp, 'wb') as f:
+            f.write(header)
+            f.write(result.frame_offsets.astype('<i8').tobytes())
+            f.write(result.frame_sizes.astype('<u4').tobytes())
+            f.write(result.tims_offsets.astype('<i8').tobytes())
+            f.write(result.timestamps.astype('<u8').tobytes())
+        os.replace(temp, target)
+    except OSError as e:
+        print(f"Warning: could not write index {target}: {e}")
+        return False
+    return True
+
+
+def scan_avi(filepath: str, use_index: bool = True) -> AVIScanResult:
+    """Scan the AVI file at filepath for frame and TIMS chunks, reusing its sidecar index if fresh"""
+    if use_index:
+        result = load_index(filepath)
+        if result is not None:
+            return result
+
+    with open(filepath, 'rb') as file:
+        result = scan_file(file)
+
+    if use_index:
+        save_index(filepath, result)
+    return result
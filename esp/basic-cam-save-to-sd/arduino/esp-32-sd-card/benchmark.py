@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the AVI scanner and converter on synthetic clips
+
+Generates a clip with synthetic_avi.py and times, each in a fresh worker
+process so that its peak RSS is its own:
+
+    scan      avi_scan.scan_file() on the whole clip (MB/s), best of --repeat
+    index     loading the .tidx sidecar index (MB/s of AVI covered)
+    convert   VideoProcessor.process_video(), the default mp4v output (frames/s)
+    vfr       VideoProcessor.process_video() with --vfr into .mkv (frames/s)
+    remux     VideoProcessor.remux_video() into .mkv (frames/s)
+
+Results can be saved with --json and compared against a saved run with
+--baseline, flagging every benchmark that got more than --tolerance slower.
+
+Usage:
+    python3 benchmark.py --frames 3000 --width 800 --height 600
+    python3 benchmark.py --json before.json
+    python3 benchmark.py --baseline before.json --only scan index
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from avi_scan import index_path, load_index, save_index, scan_file
+from synthetic_avi import CORRUPTIONS, generate_avi
+
+BENCHMARKS = ['scan', 'index', 'convert', 'vfr', 'remux']
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_converter():
+    """Import convert-avi-custom-normal.py, whose file name is not a valid module name"""
+    spec = importlib.util.spec_from_file_location('convert_avi_custom_normal',
+                                                  os.path.join(_HERE, 'convert-avi-custom-normal.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _run_benchmark(name: str, avi_path: str, work_dir: str, repeat: int) -> Dict:
+    """Body of one benchmark, run in its own worker process"""
+    size_mb = os.path.getsize(avi_path) / (1024 * 1024)
+    result = {'name': name, 'seconds': None, 'rate': None, 'unit': None, 'peak_rss_mb': None}
+
+    if name in ('scan', 'index'):
+        if name == 'index':
+            with open(avi_path, 'rb') as f:
+                save_index(avi_path, scan_file(f))
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if name == 'scan':
+                with open(avi_path, 'rb') as f:
+                    scan = scan_file(f)
+            else:
+                scan = load_index(avi_path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result.update(seconds=best, rate=size_mb / best if best > 0 else 0.0, unit='MB/s',
+                      frames=scan.frame_count if scan is not None else 0)
+    else:
+        converter = _load_converter()
+        extension = '.mp4' if name == 'convert' else '.mkv'
+        output_path = os.path.join(work_dir, f"bench_{name}{extension}")
+        processor = converter.VideoProcessor(avi_path, output_path, use_index=False, vfr=(name == 'vfr'))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            processor.extract_timestamps()
+            start = time.perf_counter()
+            ok = processor.remux_video() if name == 'remux' else processor.process_video()
+            elapsed = time.perf_counter() - start
+        if not ok:
+            raise RuntimeError(f"{name} failed on {avi_path}")
+        result.update(seconds=elapsed, rate=processor.input_frames / elapsed if elapsed > 0 else 0.0,
+                      unit='frames/s', frames=processor.input_frames,
+                      output_mb=os.path.getsize(output_path) / (1024 * 1024))
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_benchmarks(avi_path: str, names: List[str], work_dir: str, repeat: int = 3) -> List[Dict]:
+    results = []
+    had_index = os.path.exists(index_path(avi_path))
+    for name in names:
+        # A fresh process per benchmark, so peak RSS is not inherited from earlier ones
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(_run_benchmark, name, avi_path, work_dir, repeat).result())
+    # The index benchmark writes a sidecar index, only keep one that was already there
+    if not had_index and os.path.exists(index_path(avi_path)):
+        os.remove(index_path(avi_path))
+    return results
+
+
+def print_results(results: List[Dict], baseline: Optional[Dict[str, Dict]] = None,
+                  tolerance: float = 0.1) -> int:
+    """Print the results table, returning the number of regressions against baseline"""
+    regressions = 0
+    print(f"\n{'benchmark':<10} {'seconds':>9} {'rate':>19} {'peak RSS':>10}  change")
+    print("-" * 64)
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r['peak_rss_mb'] is not None else "n/a"
+        change = ""
+        previous = (baseline or {}).get(r['name'])
+        if previous and previous.get('rate'):
+            ratio = r['rate'] / previous['rate'] - 1.0
+            change = f"{ratio * 100:+.1f}%"
+            if ratio < -tolerance:
+                change += "  REGRESSION"
+                regressions += 1
+        print(f"{r['name']:<10} {r['seconds']:>9.3f} {r['rate']:>10.1f} {r['unit']:<8} {rss:>10}  {change}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AVI scanner and converter on a synthetic clip')
+    parser.add_argument('--input', help='Benchmark this AVI instead of generating one')
+    parser.add_argument('--frames', type=int, default=1000, help='Frames in the generated clip (default: 1000)')
+    parser.add_argument('--width', type=int, default=640, help='Frame width (default: 640)')
+    parser.add_argument('--height', type=int, default=480, help='Frame height (default: 480)')
+    parser.add_argument('--jitter-ms', type=int, default=5, help='Frame interval jitter in ms (default: 5)')
+    parser.add_argument('--corrupt', action='append', choices=CORRUPTIONS, default=[], help='Damage the generated clip (repeatable)')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='Benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions of the scan and index benchmarks, best is reported (default: 3)')
+    parser.add_argument('--work-dir', help='Directory for the generated clip and outputs (default: a temporary directory)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Slowdown flagged as a regression (default: 0.1 = 10%%)')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='avi-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        if args.input:
+            avi_path = args.input
+        else:
+            avi_path = os.path.join(work_dir, 'synthetic.avi')
+            start = time.perf_counter()
+            info = generate_avi(avi_path, args.frames, args.width, args.height, jitter_ms=args.jitter_ms,
+                                corruptions=args.corrupt)
+            print(f"Generated {avi_path}: {info['frames']} frames, {args.width}x{args.height}, "
+                  f"{info['bytes'] / (1024 * 1024):.1f} MB in {time.perf_counter() - start:.1f}s")
+
+        results = run_benchmarks(avi_path, args.only, work_dir, max(1, args.repeat))
+
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = {r['name']: r for r in json.load(f)['results']}
+        regressions = print_results(results, baseline, args.tolerance)
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'input': os.path.basename(avi_path), 'bytes': os.path.getsize(avi_path),
+                           'results': results}, f, indent=4)
+            print(f"Results written to {args.json}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Contact sheets of ESP32 AVIs for triaging SD card dumps
+
+A contact sheet is one thumbnail every N seconds of TIMS time, tiled in a
+grid with the frame's timestamp under each thumbnail. Only the frames that
+end up on the sheet are touched: their JPEG payloads are read straight from
+the '00dc' chunks and decoded with cv2.IMREAD_REDUCED_COLOR_*, which lets
+libjpeg scale down in the DCT domain instead of decoding every pixel and
+resizing afterwards. A one hour clip at one thumbnail per 10 seconds is 360
+reduced decodes.
+"""
+
+from typing import Callable, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from timestamp_overlay import get_renderer
+
+# cv2.imdecode flags by scale denominator
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def reduction_for(frame_width: int, thumb_width: int) -> int:
+    """Largest JPEG scale denominator that still decodes at least thumb_width pixels wide"""
+    for reduction in (8, 4, 2):
+        if frame_width // reduction >= thumb_width:
+            return reduction
+    return 1
+
+
+def decode_reduced(jpeg: bytes, reduction: int = 1) -> Optional[np.ndarray]:
+    """Decode a JPEG at 1/reduction of its size, None if it is corrupt"""
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), REDUCED_DECODE_FLAGS[reduction])
+
+
+def thumbnail_rows(presentation_times_ms: np.ndarray, interval_ms: float) -> np.ndarray:
+    """Rows of the first frame at or after every interval_ms of presentation time"""
+    times = np.asarray(presentation_times_ms, dtype=np.int64)
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64)
+    interval_ms = max(interval_ms, 1.0)
+    targets = times[0] + np.arange(0, times[-1] - times[0] + 1, interval_ms)
+    return np.unique(np.searchsorted(times, targets, side='left'))
+
+
+def tile_contact_sheet(thumbnails: Sequence[Optional[np.ndarray]], labels: Sequence[Sequence[str]],
+                       columns: int = 6, thumb_width: int = 160, title: str = "") -> np.ndarray:
+    """Tile thumbnails in a grid with the lines of a label under each, corrupt ones (None) as gray tiles"""
+    shapes = [t.shape for t in thumbnails if t is not None]
+    aspect = shapes[0][0] / shapes[0][1] if shapes else 0.75
+    thumb_height = max(1, int(round(thumb_width * aspect)))
+    renderer = get_renderer(font_scale=0.4, thickness=1, color=(255, 255, 255),
+                            outline_color=(0, 0, 0), outline_thickness=0,
+                            background_color=None, padding=0, line_spacing=4)
+    label_lines = max((len(label) for label in labels), default=1)
+    label_height = label_lines * (renderer.atlas.ascent + renderer.line_spacing) + 6
+    title_height = renderer.atlas.ascent + 14 if title else 0
+    gap = 4
+
+    columns = max(1, min(columns, len(thumbnails) or 1))
+    rows = (len(thumbnails) + columns - 1) // columns
+    cell_width, cell_height = thumb_width + gap, thumb_height + label_height + gap
+    sheet = np.full((title_height + rows * cell_height + gap, columns * cell_width + gap, 3), 32, dtype=np.uint8)
+    if title:
+        renderer.draw(sheet, [title], x=gap, y=7)
+
+    for i, (thumbnail, label) in enumerate(zip(thumbnails, labels)):
+        x = gap + (i % columns) * cell_width
+        y = title_height + gap + (i // columns) * cell_height
+        if thumbnail is None:
+            sheet[y:y + thumb_height, x:x + thumb_width] = 96
+        else:
+            sheet[y:y + thumb_height, x:x + thumb_width] = cv2.resize(
+                thumbnail, (thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        renderer.draw(sheet, list(label), x=x, y=y + thumb_height + 4)
+    return sheet
+
+
+def make_contact_sheet(read_jpeg: Callable[[int], bytes], rows: Sequence[int], labels: Sequence[Sequence[str]],
+                       frame_width: int, columns: int = 6, thumb_width: int = 160,
+                       title: str = "") -> np.ndarray:
+    """Decode the given frames at reduced size with read_jpeg(row) and tile them"""
+    reduction = reduction_for(frame_width, thumb_width)
+    thumbnails = [decode_reduced(read_jpeg(int(row)), reduction) for row in rows]
+    return tile_contact_sheet(thumbnails, labels, columns, thumb_width, title)
@@ -9,57 +9,68 @@ a new video with proper timing based on the original timestamps.
 Requirements:
 - opencv-python
 - numpy
+- ffmpeg (optional, for --vfr/--remux output other than .mkv)
 - struct (built-in)
 - datetime (built-in)
+
+Usage:
+    python3 convert-avi-custom-normal.py video_1.avi --info
+    python3 convert-avi-custom-normal.py video_1.avi -o video_1.mp4
+    # One output frame per input frame, each at its exact TIMS time
+    python3 convert-avi-custom-normal.py video_1.avi -o video_1.mkv --vfr
+    # Archive copy: the original JPEGs with their timing, timestamps as subtitles
+    python3 convert-avi-custom-normal.py video_1.avi --remux --subtitles
+    # Repair a recording cut short by a power loss (no re-encoding)
+    python3 convert-avi-custom-normal.py video_1.avi --salvage
+    # 20 seconds from 12:00:05 UTC, decoding only those frames
+    python3 convert-avi-custom-normal.py video_1.avi --from "2024-05-01 12:00:05" --to +20 -o clip.mp4
+    # Thumbnail every 30 seconds of every clip, for triaging an SD card dump
+    python3 convert-avi-custom-normal.py /media/sdcard --contact-sheet --sheet-interval 30 -o sheets/
+    # Spans with motion, from the JPEG chunk sizes, as JSON
+    python3 convert-avi-custom-normal.py video_1.avi --activity
+    # Only the spans with motion plus 3 seconds either side, idle stretches as one still each
+    python3 convert-avi-custom-normal.py video_1.avi --activity-gate --pre-roll 3 --post-roll 3 --vfr
+    # Every clip of an SD card dump on one timeline, millis() clips anchored to NTP time
+    python3 convert-avi-custom-normal.py /media/sdcard --info
+    # Convert a whole SD card dump on 8 worker processes
+    python3 convert-avi-custom-normal.py /media/sdcard -o converted/ -j 8
 """
 
 import cv2
+import mmap
 import numpy as np
-import struct
 import os
-from datetime import datetime, timezone
-from typing import List, Tuple, Optional
+import glob
+import json
+import time
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Tuple, Optional
 import argparse
 
-
-class TimestampChunk:
-    """Represents a TIMS timestamp chunk from the AVI file"""
-    def __init__(self, unix_epoch_ms: int):
-        self.unix_epoch_ms = unix_epoch_ms
-        self.original_value = unix_epoch_ms
-        
-        # Determine timestamp type based on ESP32 getCurrentTimestampMs() logic
-        if unix_epoch_ms > 1577836800000:  # If it's after 2020-01-01 in milliseconds
-            # This looks like a proper Unix timestamp in milliseconds (NTP was available)
-            self.datetime = datetime.fromtimestamp(unix_epoch_ms / 1000.0, tz=timezone.utc)
-            self.is_unix_timestamp = True
-            self.timestamp_type = "NTP Unix timestamp"
-        else:
-            # This looks like millis() - milliseconds since ESP32 boot
-            # We'll create a relative datetime starting from epoch for display purposes
-            self.datetime = datetime.fromtimestamp(unix_epoch_ms / 1000.0, tz=timezone.utc)
-            self.is_unix_timestamp = False
-            self.timestamp_type = "millis() since boot"
-    
-    def __str__(self):
-        if self.is_unix_timestamp:
-            return f"TIMS: {self.unix_epoch_ms}ms ({self.datetime.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} UTC) [NTP]"
-        else:
-            # For millis() timestamps, show boot time and duration
-            seconds = self.unix_epoch_ms / 1000.0
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = seconds % 60
-            return f"TIMS: {self.unix_epoch_ms}ms ({hours:02d}:{minutes:02d}:{secs:06.3f} since boot) [millis()]"
+from avi_scan import AVIScanResult, frame_timestamps, scan_avi
+from timestamp_series import (ClockSegment, TimestampChunk, TimestampSeries, format_boot_time,
+                              parse_time_ms, stitch_timelines)
+from timestamp_overlay import format_utc_ms, get_renderer
+from mkv_writer import VFRVideoWriter, ffmpeg_available
+from frame_pipeline import FramePipeline
+from avi_salvage import salvage_avi
+from activity_index import (ActivityGate, activity_report, add_frame_difference, compute_activity,
+                            find_segments)
+from contact_sheet import decode_reduced, make_contact_sheet, thumbnail_rows
 
 
 class AVITimestampReader:
     """Reads AVI files and extracts custom TIMS timestamp chunks"""
     
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, use_index: bool = True):
         self.filepath = filepath
+        self.use_index = use_index
         self.file = None
-        self.timestamps: List[TimestampChunk] = []
+        self.timestamps = TimestampSeries()
+        self.scan_result: Optional[AVIScanResult] = None
+        self.interpolated = np.zeros(0, dtype=bool)
         
     def __enter__(self):
         self.file = open(self.filepath, 'rb')
@@ -69,92 +80,27 @@ class AVITimestampReader:
         if self.file:
             self.file.close()
 
-    def read_timestamps(self) -> List[TimestampChunk]:
+    def read_timestamps(self) -> TimestampSeries:
         """Extract all TIMS timestamp chunks from the AVI file"""
-        self.timestamps = []
+        self.timestamps = TimestampSeries()
 
         if not self.file:
             raise ValueError("File not opened")
 
-        self.file.seek(0)
         file_size = os.path.getsize(self.filepath)
-
         print(f"Scanning file of size {file_size} bytes for TIMS chunks...")
 
-        # Method 1: Search for TIMS pattern in the entire file
-        found_any = False
-        position = 0
-
-        while position < file_size - 16:  # Need at least 16 bytes for TimestampChunk
-            self.file.seek(position)
-            data = self.file.read(16)
-
-            if len(data) < 16:
-                break
-
-            # Look for TIMS ID at current position
-            if data[:4] == b'TIMS':
-                try:
-                    chunk_size = struct.unpack('<I', data[4:8])[0]
-
-                    # Expect chunk_size to be 8 bytes for a uint64_t timestamp
-                    if chunk_size == 8:
-                        unix_epoch_ms = struct.unpack('<Q', data[8:16])[0]
-
-                        # **FIX**: Assume timestamp is already in milliseconds, no scale conversion needed.
-                        # We are explicitly communicating this by design.
-                        if unix_epoch_ms > 0:
-                            self.timestamps.append(TimestampChunk(unix_epoch_ms))
-                            found_any = True
-                            print(f"Found TIMS chunk at position {position}: {unix_epoch_ms} ms")
-                            position += 16  # Skip past this chunk
-                        else:
-                            print(f"Warning: TIMS chunk at position {position} has zero or negative timestamp ({unix_epoch_ms}). Skipping.")
-                            position += 1
-                    else:
-                        print(f"Warning: TIMS chunk at position {position} has unexpected data size {chunk_size}. Expected 8 bytes for milliseconds timestamp. Skipping.")
-                        position += 1 # Move to next byte to search for TIMS ID again
-                except struct.error as e:
-                    print(f"Error parsing TIMS chunk at position {position}: {e}. Skipping.")
-                    position += 1
-            else:
-                position += 1
+        # Reuses the sidecar index when it matches the file's size and mtime,
+        # otherwise walks the RIFF/movi chunk structure through an mmap
+        self.scan_result = scan_avi(self.filepath, use_index=self.use_index)
+        self.timestamps = TimestampSeries(self.scan_result.timestamps)
 
-        # Method 2: If no TIMS found, try alternative approach - look for the pattern as written by ESP32
-        # This method is less robust if not explicitly using chunking, but can act as a fallback
-        if not found_any:
-            print("No TIMS chunks found with Method 1, trying alternative search for exact pattern...")
-            self.file.seek(0)
+        if self.scan_result.skipped_tims:
+            print(f"Warning: skipped {self.scan_result.skipped_tims} TIMS chunks with an unexpected size or zero timestamp.")
+        if self.scan_result.truncated:
+            print("Warning: the last chunk runs past the end of the file (recording was cut short).")
 
-            # Search for the hex pattern that might represent TIMS
-            # The ESP32 writes: "TIMS" (0x54494D53) + size (0x08000000) + timestamp
-            tims_pattern = b'TIMS\x08\x00\x00\x00'  # TIMS + size=8 in little endian
-
-            file_content = self.file.read()
-            offset = 0
-
-            while True:
-                pos = file_content.find(tims_pattern, offset)
-                if pos == -1:
-                    break
-
-                # Found the pattern, extract timestamp
-                if pos + 16 <= len(file_content):
-                    timestamp_bytes = file_content[pos + 8:pos + 16]
-                    try:
-                        unix_epoch_ms = struct.unpack('<Q', timestamp_bytes)[0]
-
-                        # **FIX**: Assume timestamp is already in milliseconds, no scale conversion needed.
-                        if unix_epoch_ms > 0:
-                            self.timestamps.append(TimestampChunk(unix_epoch_ms))
-                            print(f"Found TIMS pattern at position {pos}: {unix_epoch_ms} ms")
-                            found_any = True
-                    except struct.error as e:
-                        print(f"Error parsing timestamp at position {pos}: {e}")
-
-                offset = pos + 1 # Move to the next byte after the found pattern to continue searching
-
-        if not found_any:
+        if not self.timestamps:
             print("No TIMS chunks found. File may not contain timestamp metadata.")
             # Let's also try to dump the first few bytes to see what we're dealing with
             self.file.seek(0)
@@ -162,222 +108,899 @@ class AVITimestampReader:
             print(f"File header (first 64 bytes): {header}")
             print(f"Header as hex: {header.hex()}")
         else:
-            print(f"Found {len(self.timestamps)} TIMS chunks total")
+            print(f"Found {len(self.timestamps)} TIMS chunks and {self.scan_result.frame_count} frame chunks "
+                  f"({self.scan_result.method} scan)")
 
         return self.timestamps
 
+    def read_frame_timestamps(self) -> TimestampSeries:
+        """TIMS value of every frame chunk, paired with it by chunk order
+
+        Row i belongs to the frame chunk at scan_result.frame_offsets[i].
+        self.interpolated marks the frames that had no TIMS chunk of their own.
+        """
+        if self.scan_result is None:
+            self.read_timestamps()
+        values, self.interpolated = frame_timestamps(self.scan_result)
+        return TimestampSeries(values)
+
+    def read_frame_jpeg(self, frame_number: int) -> bytes:
+        """Read the raw JPEG payload of frame N using the scanned frame offsets"""
+        if not self.file:
+            raise ValueError("File not opened")
+        if self.scan_result is None:
+            self.read_timestamps()
+
+        offset = int(self.scan_result.frame_offsets[frame_number])
+        size = int(self.scan_result.frame_sizes[frame_number])
+        self.file.seek(offset + 8)
+        return self.file.read(size)
+
+    def decode_frame(self, frame_number: int, reduction: int = 1) -> Optional[np.ndarray]:
+        """Decode frame N directly, without decoding the frames before it
+
+        reduction 2, 4 or 8 decodes it at that fraction of its size in the
+        JPEG DCT domain, much faster than a full decode.
+        """
+        return decode_reduced(self.read_frame_jpeg(frame_number), reduction)
+
 class VideoProcessor:
     """Processes video files with timestamp overlay and timing correction"""
     
-    def __init__(self, input_path: str, output_path: str):
+    def __init__(self, input_path: str, output_path: str, use_index: bool = True, vfr: bool = False,
+                 overlay_workers: int = 2, queue_size: int = 8,
+                 time_range: Optional[Tuple[int, int]] = None,
+                 activity_gate: Optional[ActivityGate] = None):
         self.input_path = input_path
         self.output_path = output_path
-        self.timestamps: List[TimestampChunk] = []
+        self.use_index = use_index
+        # Only convert the frames whose TIMS value lies in [start_ms, end_ms]
+        self.time_range = time_range
+        # Only encode the active spans, each idle stretch becomes one still frame
+        self.activity_gate = activity_gate
+        # Write each frame once at its TIMS time instead of duplicating frames at a constant rate
+        self.vfr = vfr
+        # Threads drawing the overlay, and frames buffered between the pipeline stages
+        self.overlay_workers = overlay_workers
+        self.queue_size = queue_size
+        self.pipeline_stats: List[str] = []
+        self.timestamps = TimestampSeries()  # One value per frame chunk
+        # The same frames on one monotonic clock, millis() segments anchored to NTP time
+        self.timeline = TimestampSeries()
+        self.clock_segments: List[ClockSegment] = []
+        self.interpolated = np.zeros(0, dtype=bool)
+        self.scan_result: Optional[AVIScanResult] = None
+        self.input_frames = 0
+        self.output_frames = 0
+        self.overlay_renderer = get_renderer(font_scale=0.7, thickness=2, color=(255, 255, 255),
+                                             outline_color=(0, 0, 0), outline_thickness=4,
+                                             background_color=(0, 0, 0), padding=5, line_spacing=10)
+        self.gap_renderer = get_renderer(font_scale=0.7, thickness=2, color=(0, 200, 255),
+                                         outline_color=(0, 0, 0), outline_thickness=4,
+                                         background_color=(0, 0, 0), padding=5, line_spacing=10)
+        
+    def extract_timestamps(self) -> TimestampSeries:
+        """Extract the timestamp of every frame from the input AVI file"""
+        with AVITimestampReader(self.input_path, use_index=self.use_index) as reader:
+            if not reader.read_timestamps():
+                self.timestamps = TimestampSeries()
+                self.timeline = TimestampSeries()
+                self.clock_segments = []
+                return self.timestamps
+            self.timestamps = reader.read_frame_timestamps()
+            self.interpolated = reader.interpolated
+            self.scan_result = reader.scan_result
+        self.timeline, self.clock_segments = self.timestamps.stitched()
         
-    def extract_timestamps(self) -> List[TimestampChunk]:
-        """Extract timestamps from the input AVI file"""
-        with AVITimestampReader(self.input_path) as reader:
-            self.timestamps = reader.read_timestamps()
+        missing = int(np.count_nonzero(self.interpolated))
+        paired = len(self.timestamps) - missing
+        if missing:
+            print(f"Warning: {missing} frames have no TIMS chunk, their timestamps are interpolated.")
+        if len(self.scan_result) > paired:
+            print(f"Warning: {len(self.scan_result) - paired} TIMS chunks do not follow a frame and are ignored.")
+        if not self.timestamps:
+            print("Warning: no frame chunks found.")
+        if len(self.clock_segments) > 1:
+            print(f"Warning: the clock jumps {len(self.clock_segments) - 1} times, "
+                  f"frame timing uses the stitched timeline.")
         return self.timestamps
     
-    def overlay_timestamp_on_frame(self, frame: np.ndarray, timestamp: TimestampChunk) -> np.ndarray:
-        """Overlay timestamp information on a video frame"""
-        # Create a copy to avoid modifying the original
-        output_frame = frame.copy()
-        
+    def timestamp_lines(self, timestamp: TimestampChunk) -> List[str]:
+        """The two lines of text shown for a timestamp, burned in or as a subtitle"""
         # Format timestamp text based on whether it's a Unix timestamp or millis()
         if timestamp.is_unix_timestamp:
-            timestamp_text = timestamp.datetime.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + ' UTC'
+            timestamp_text = format_utc_ms(timestamp.unix_epoch_ms) + ' UTC'
             unix_text = f"Unix: {timestamp.unix_epoch_ms}ms (NTP)"
         else:
             # For millis() timestamps, show time since boot in readable format
-            seconds = timestamp.unix_epoch_ms / 1000.0
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = seconds % 60
-            timestamp_text = f"Boot+{hours:02d}:{minutes:02d}:{secs:06.3f}"
+            timestamp_text = f"Boot+{format_boot_time(timestamp.unix_epoch_ms)}"
             unix_text = f"millis(): {timestamp.unix_epoch_ms}ms"
-        
-        # Text properties
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.7
-        color = (255, 255, 255)  # White text
-        thickness = 2
-        outline_color = (0, 0, 0)  # Black outline
-        outline_thickness = 4
-        
-        # Get text size for positioning
-        (text_width, text_height), baseline = cv2.getTextSize(timestamp_text, font, font_scale, thickness)
-        (unix_width, unix_height), unix_baseline = cv2.getTextSize(unix_text, font, font_scale, thickness)
-        
-        # Position text at top-left with some padding
-        padding = 10
-        y_pos = padding + text_height
-        
-        # Draw background rectangle for better readability
-        cv2.rectangle(output_frame, 
-                     (padding - 5, padding - 5), 
-                     (padding + max(text_width, unix_width) + 5, padding + text_height + unix_height + baseline + 15), 
-                     (0, 0, 0), -1)
-        
-        # Draw outline (black)
-        cv2.putText(output_frame, timestamp_text, (padding, y_pos), font, font_scale, outline_color, outline_thickness)
-        cv2.putText(output_frame, unix_text, (padding, y_pos + text_height + 10), font, font_scale, outline_color, outline_thickness)
-        
-        # Draw main text (white)
-        cv2.putText(output_frame, timestamp_text, (padding, y_pos), font, font_scale, color, thickness)
-        cv2.putText(output_frame, unix_text, (padding, y_pos + text_height + 10), font, font_scale, color, thickness)
-        
-        return output_frame
+        return [timestamp_text, unix_text]
+    
+    def overlay_timestamp_on_frame(self, frame: np.ndarray, timestamp: TimestampChunk) -> np.ndarray:
+        """Overlay timestamp information on a video frame, in place"""
+        # White text with a black outline on a black box at the top-left,
+        # composited from pre-rendered glyphs instead of cv2.putText
+        return self.overlay_renderer.draw(frame, self.timestamp_lines(timestamp), x=10, y=10)
     
-    def calculate_frame_durations(self) -> List[float]:
+    def calculate_frame_durations(self, timestamps: Optional[TimestampSeries] = None) -> np.ndarray:
         """Calculate the duration each frame should be displayed based on timestamps"""
-        if len(self.timestamps) < 2:
-            return [1.0 / 30.0]  # Default to 30fps if insufficient timestamp data
-        
-        durations = []
-        for i in range(len(self.timestamps) - 1):
-            duration = (self.timestamps[i + 1].unix_epoch_ms - self.timestamps[i].unix_epoch_ms) / 1000.0
-            durations.append(max(duration, 0.001))  # Minimum 1ms duration
-        
-        # For the last frame, use the average duration
-        if durations:
-            avg_duration = sum(durations) / len(durations)
-            durations.append(avg_duration)
-        
-        return durations
+        if timestamps is None:
+            timestamps = self.timestamps
+        # Minimum 1ms duration, the last frame gets the average duration and
+        # 30fps is assumed if there is insufficient timestamp data
+        return timestamps.frame_durations(min_duration=0.001, default_fps=30.0)
+    
+    def select_frame_range(self) -> Tuple[int, int]:
+        """Frames [first, last) to convert: all of them, or those within self.time_range"""
+        frame_count = self.scan_result.frame_count if self.scan_result is not None else 0
+        if self.time_range is None:
+            if frame_count == 0:
+                print("No frame chunks found in the video file!")
+            return 0, frame_count
+        first, last = self.timeline.frame_range(*self.time_range)
+        last = min(last, frame_count)
+        if first < last:
+            start = int(self.scan_result.frame_offsets[first])
+            end = int(self.scan_result.frame_offsets[last - 1]) + 8 + int(self.scan_result.frame_sizes[last - 1])
+            print(f"Selected frames {first}-{last - 1} of {frame_count}: "
+                  f"{self.timestamps[first]} to {self.timestamps[last - 1]}, "
+                  f"bytes {start}-{end} of {os.path.getsize(self.input_path)}")
+        else:
+            print(f"No frames with timestamps between {self.time_range[0]} and {self.time_range[1]}ms")
+        return first, max(first, last)
     
-    def process_video(self) -> bool:
-        """Process the input video and generate output with timestamp overlay and corrected timing"""
+    def process_video(self, progress_callback: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Process the input video and generate output with timestamp overlay and corrected timing
+
+        progress_callback(frame_index, total_frames) replaces the printed
+        progress indicator, e.g. to aggregate progress across a batch.
+        """
         
-        # Extract timestamps
-        print(f"Extracting timestamps from {self.input_path}...")
-        timestamps = self.extract_timestamps()
+        # Extract timestamps, unless main() already did
+        if self.timestamps:
+            timestamps = self.timestamps
+        else:
+            print(f"Extracting timestamps from {self.input_path}...")
+            timestamps = self.extract_timestamps()
         
         if not timestamps:
             print("No TIMS timestamp chunks found in the video file!")
             return False
         
-        print(f"Found {len(timestamps)} timestamp chunks")
+        print(f"Found timestamps for {len(timestamps)} frames")
         
-        # Open input video
-        cap = cv2.VideoCapture(self.input_path)
-        if not cap.isOpened():
-            print(f"Error: Could not open video file {self.input_path}")
+        # Frames are decoded straight from the scanned frame chunks, so frame i
+        # is exactly the chunk that timestamps[i] was paired with
+        first, last = self.select_frame_range()
+        if first == last:
             return False
+        if self.activity_gate is not None:
+            plan = self.activity_gate.plan(self.timeline.values[first:last],
+                                           self.scan_result.frame_sizes[first:last])
+            rows = plan.rows + first
+            is_gap, skipped, idle_ms = plan.is_gap, plan.skipped_frames, plan.idle_ms
+            # Idle stretches are shortened to gap_still_s on the output timeline
+            timeline = TimestampSeries(plan.output_times_ms(self.timeline.values[first:last],
+                                                            int(self.activity_gate.gap_still_s * 1000)))
+            print(f"Activity gate: {len(plan.segments)} active segments, keeping {len(rows) - plan.gaps} "
+                  f"of {last - first} frames, {plan.gaps} idle stretches collapsed into still frames")
+        else:
+            rows = np.arange(first, last)
+            is_gap = np.zeros(len(rows), dtype=bool)
+            skipped = idle_ms = np.zeros(len(rows), dtype=np.int64)
+            timeline = self.timeline[first:last]
+        timestamps = TimestampSeries(timestamps.values[rows])
+        with AVITimestampReader(self.input_path, use_index=self.use_index) as reader:
+            reader.scan_result = self.scan_result
+            # The input is closed however writing ends
+            return self._write_frames(reader, rows, timestamps, timeline, is_gap, skipped, idle_ms,
+                                      progress_callback)
+
+    def _write_frames(self, reader: AVITimestampReader, rows: np.ndarray, timestamps: TimestampSeries,
+                      timeline: TimestampSeries, is_gap: np.ndarray, skipped: np.ndarray, idle_ms: np.ndarray,
+                      progress_callback: Optional[Callable[[int, int], None]]) -> bool:
+        """Decode, overlay and encode the frames at rows of an open reader"""
+        first_frame = reader.decode_frame(int(rows[0]))
+        if first_frame is None:
+            print(f"Error: Could not decode frame {int(rows[0])} of {self.input_path}")
+            return False
+        height, width = first_frame.shape[:2]
+        fps = timeline.average_fps()
+        total_frames = len(rows)
+        next_row = 0
         
-        # Get video properties
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        def read_frame() -> Optional[np.ndarray]:
+            # Only reads the JPEG, the overlay workers decode it
+            nonlocal next_row
+            if next_row >= total_frames:
+                return None
+            jpeg = np.frombuffer(reader.read_frame_jpeg(int(rows[next_row])), dtype=np.uint8)
+            next_row += 1
+            return jpeg
         
         print(f"Input video: {width}x{height}, {fps} fps, {total_frames} frames")
         
         # Calculate frame durations based on timestamps
-        durations = self.calculate_frame_durations()
+        durations = self.calculate_frame_durations(timeline)
         
         # Calculate new FPS based on timestamp timing
-        if durations:
-            avg_duration = sum(durations) / len(durations)
+        if len(durations):
+            avg_duration = float(durations.mean())
             new_fps = 1.0 / avg_duration
             print(f"Calculated new FPS based on timestamps: {new_fps:.2f}")
         else:
             new_fps = fps
         
         # Setup video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(self.output_path, fourcc, new_fps, (width, height))
+        if self.vfr:
+            try:
+                out = VFRVideoWriter(self.output_path, width, height)
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                return False
+            presentation_times = timeline.presentation_times_ms()
+            print("Writing variable frame rate output with per-frame timestamps")
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(self.output_path, fourcc, new_fps, (width, height))
         
-        frame_index = 0
         processed_frames = 0
+        pts = 0
         
-        print("Processing frames...")
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
+        def overlay_frame(frame_index: int, jpeg: np.ndarray) -> np.ndarray:
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if frame is None or frame.shape != first_frame.shape:
+                # A corrupt JPEG becomes a black frame, keeping every later frame in place
+                frame = np.zeros_like(first_frame)
             # Apply timestamp overlay if we have timestamp data for this frame
+            if is_gap[frame_index]:
+                # Dimmed, so the still stands out from the recorded frames
+                np.right_shift(frame, 1, out=frame)
+                self.gap_renderer.draw(frame, [f"GAP: idle {format_boot_time(int(idle_ms[frame_index]))}",
+                                               f"{int(skipped[frame_index])} idle frames"],
+                                       x=10, y=10, from_bottom=True)
             if frame_index < len(timestamps):
-                frame_with_timestamp = self.overlay_timestamp_on_frame(frame, timestamps[frame_index])
-                
-                # Write frame to output video
+                self.overlay_timestamp_on_frame(frame, timestamps[frame_index])
+            return frame
+        
+        def write_frame(frame_index: int, frame: np.ndarray):
+            nonlocal processed_frames, pts
+            if self.vfr:
+                # Every input frame is written exactly once at its own time,
+                # frames without TIMS data continue at the average interval
+                if frame_index < len(timestamps):
+                    pts = int(presentation_times[frame_index])
+                else:
+                    extra_frames = frame_index - len(timestamps) + 1
+                    pts = int(presentation_times[-1] + round(extra_frames * avg_duration * 1000.0))
+                out.write(frame, pts)
+                processed_frames += 1
+            elif frame_index < len(durations):
                 # For variable frame timing, we might need to duplicate frames
                 # based on the calculated duration vs target fps
-                if frame_index < len(durations):
-                    duration = durations[frame_index]
-                    repeats = max(1, int(duration * new_fps))
-                    
-                    for _ in range(repeats):
-                        out.write(frame_with_timestamp)
-                        processed_frames += 1
-                else:
-                    out.write(frame_with_timestamp)
+                repeats = max(1, int(durations[frame_index] * new_fps))
+                for _ in range(repeats):
+                    out.write(frame)
                     processed_frames += 1
             else:
                 # No timestamp data for this frame, write as-is
                 out.write(frame)
                 processed_frames += 1
-            
-            frame_index += 1
-            
-            # Progress indicator
-            if frame_index % 100 == 0:
-                print(f"Processed {frame_index}/{total_frames} frames")
         
-        # Cleanup
-        cap.release()
-        out.release()
+        def report_progress(frame_count: int):
+            if progress_callback:
+                progress_callback(frame_count, total_frames)
+            else:
+                print(f"Processed {frame_count}/{total_frames} frames")
+        
+        # Decoding, drawing and encoding overlap on separate threads
+        print(f"Processing frames ({self.overlay_workers} decode/overlay workers)...")
+        pipeline = FramePipeline(read_frame, overlay_frame, write_frame,
+                                 workers=self.overlay_workers, queue_size=self.queue_size)
+        try:
+            frame_index = pipeline.run(progress_callback=report_progress, progress_interval=100)
+        except BaseException:
+            if self.vfr:
+                out.release()
+            raise
+        finally:
+            if not self.vfr:
+                out.release()
+        
+        if self.vfr:
+            # The last frame is shown for the average frame duration
+            if not out.release(duration_ms=pts + avg_duration * 1000.0 if processed_frames else 0.0):
+                print("Error: ffmpeg failed to encode the output video")
+                return False
+        
+        self.input_frames = frame_index
+        self.output_frames = processed_frames
+        self.pipeline_stats = pipeline.summary()
         
         print(f"Processing complete!")
         print(f"Output video: {self.output_path}")
         print(f"Processed {processed_frames} frames from {frame_index} input frames")
+        print("Pipeline stages:")
+        for line in self.pipeline_stats:
+            print(line)
         
         return True
     
-    def print_timestamp_info(self):
-        """Print detailed information about extracted timestamps"""
+    def remux_video(self, subtitles: bool = False,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> bool:
+        """Copy the JPEG frames into the output at their TIMS times, without decoding them
+
+        No overlay is drawn. With subtitles, the timestamp text is written to
+        a subtitle track instead. An .mkv output needs nothing but this
+        script, other containers are muxed by ffmpeg with '-c:v copy'.
+        """
+        if not self.timestamps:
+            print(f"Extracting timestamps from {self.input_path}...")
+            self.extract_timestamps()
+        if self.scan_result is None or self.scan_result.frame_count == 0:
+            print("No frame chunks found in the video file!")
+            return False
+
+        first, last = self.select_frame_range()
+        if first == last:
+            return False
+        timestamps = self.timestamps[first:last]
+        timeline = self.timeline[first:last]
+        frame_offsets = self.scan_result.frame_offsets[first:last]
+        frame_sizes = self.scan_result.frame_sizes[first:last]
+        total_frames = len(frame_offsets)
+        presentation_times = timeline.presentation_times_ms(total_frames)
+        # The last frame is shown for the average frame duration
+        last_duration = float(self.calculate_frame_durations(timeline).mean()) * 1000.0
+
+        with open(self.input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Only the first frame is decoded, for the dimensions in the track header
+            start = int(frame_offsets[0]) + 8
+            frame = cv2.imdecode(np.frombuffer(mm[start:start + int(frame_sizes[0])], dtype=np.uint8),
+                                 cv2.IMREAD_COLOR)
+            if frame is None:
+                print(f"Error: Could not decode the first frame of {self.input_path}")
+                return False
+            height, width = frame.shape[:2]
+            print(f"Remuxing {total_frames} JPEG frames ({width}x{height}) without re-encoding")
+
+            try:
+                out = VFRVideoWriter(self.output_path, width, height, subtitles=subtitles, video_codec='copy')
+            except RuntimeError as e:
+                print(f"Error: {e}")
+                return False
+
+            try:
+                for frame_index in range(total_frames):
+                    start = int(frame_offsets[frame_index]) + 8
+                    pts = int(presentation_times[frame_index])
+                    out.write_jpeg(mm[start:start + int(frame_sizes[frame_index])], pts)
+                    if subtitles and frame_index < len(timestamps):
+                        if frame_index + 1 < total_frames:
+                            duration = int(presentation_times[frame_index + 1]) - pts
+                        else:
+                            duration = int(round(last_duration))
+                        out.write_subtitle('\n'.join(self.timestamp_lines(timestamps[frame_index])), pts, duration)
+
+                    if (frame_index + 1) % 1000 == 0:
+                        if progress_callback:
+                            progress_callback(frame_index + 1, total_frames)
+                        else:
+                            print(f"Remuxed {frame_index + 1}/{total_frames} frames")
+            except BaseException:
+                # Stops ffmpeg and leaves a playable file with the frames written so far
+                out.release()
+                raise
+
+        if not out.release(duration_ms=presentation_times[-1] + last_duration):
+            print("Error: ffmpeg failed to write the output video")
+            return False
+
+        self.input_frames = total_frames
+        self.output_frames = total_frames
+        if progress_callback:
+            progress_callback(total_frames, total_frames)
+
+        print("Remux complete!")
+        print(f"Output video: {self.output_path}")
+        return True
+    
+    def write_contact_sheet(self, sheet_path: str, interval_s: float = 10.0, columns: int = 6,
+                            thumb_width: int = 160) -> bool:
+        """Write a grid of thumbnails, one every interval_s seconds of TIMS time, to an image file"""
+        if not self.timestamps:
+            print(f"Extracting timestamps from {self.input_path}...")
+            self.extract_timestamps()
+        if not self.timestamps:
+            print("No frame chunks found in the video file!")
+            return False
+
+        start_time = time.time()
+        rows = thumbnail_rows(self.timeline.presentation_times_ms(), interval_s * 1000.0)
+        # Date and time on separate lines, to fit under a thumbnail
+        labels = [self.timestamp_lines(self.timestamps[int(row)])[0].split(' ', 1) for row in rows]
+        with AVITimestampReader(self.input_path, use_index=self.use_index) as reader:
+            reader.scan_result = self.scan_result
+            # A 1/8 decode is enough to learn the frame width
+            probe = reader.decode_frame(0, reduction=8)
+            frame_width = probe.shape[1] * 8 if probe is not None else thumb_width
+            duration_s = self.timeline.total_time_ms() / 1000.0
+            title = (f"{os.path.basename(self.input_path)}: {len(self.timestamps)} frames, {duration_s:.0f}s, "
+                     f"one thumbnail every {interval_s:g}s")
+            sheet = make_contact_sheet(reader.read_frame_jpeg, rows, labels, frame_width,
+                                       columns=columns, thumb_width=thumb_width, title=title)
+
+        if not cv2.imwrite(sheet_path, sheet):
+            print(f"Error: could not write {sheet_path}")
+            return False
+        print(f"Contact sheet: {len(rows)} thumbnails, {sheet.shape[1]}x{sheet.shape[0]}, "
+              f"{time.time() - start_time:.2f}s -> {sheet_path}")
+        return True
+    
+    def write_activity_index(self, json_path: str, bin_s: float = 1.0, threshold: float = 3.0,
+                             frame_difference: bool = False, min_gap_s: float = 2.0) -> Optional[Dict]:
+        """Write the activity curve and the active segments of the clip to a JSON file
+
+        The curve comes from the JPEG chunk sizes alone, with frame_difference
+        one 1/8 size grayscale decode per bin is compared as well.
+        """
+        if not self.timestamps:
+            print(f"Extracting timestamps from {self.input_path}...")
+            self.extract_timestamps()
+        if not self.timestamps:
+            print("No frame chunks found in the video file!")
+            return None
+
+        start_time = time.time()
+        curve = compute_activity(self.timeline.values, self.scan_result.frame_sizes, int(bin_s * 1000))
+        if frame_difference:
+            with AVITimestampReader(self.input_path, use_index=self.use_index) as reader:
+                reader.scan_result = self.scan_result
+                add_frame_difference(curve, reader.read_frame_jpeg)
+        segments = find_segments(curve, threshold, min_gap_ms=int(min_gap_s * 1000))
+        for segment in segments:
+            # The TIMS values as shown in the overlay, for finding the span by eye
+            segment['start'] = self.timestamp_lines(self.timestamps[segment['first_frame']])[0]
+            segment['end'] = self.timestamp_lines(self.timestamps[segment['end_frame'] - 1])[0]
+
+        report = {'input': self.input_path}
+        report.update(activity_report(curve, segments, threshold))
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+        print(f"Activity: {len(segments)} segments, {report['active_ms'] / 1000.0:.0f}s of "
+              f"{report['duration_ms'] / 1000.0:.0f}s active ({report['active_fraction'] * 100:.1f}%), "
+              f"{time.time() - start_time:.2f}s -> {json_path}")
+        for segment in segments:
+            print(f"  frames {segment['first_frame']}-{segment['end_frame'] - 1}: {segment['start']} to "
+                  f"{segment['end']}, peak score {segment['peak_score']}")
+        return report
+    
+    def print_timestamp_info(self, rows: int = 20):
+        """Print information about extracted timestamps, listing the first and last `rows` entries (0 = all)"""
         if not self.timestamps:
             print("No timestamps found!")
             return
         
-        print(f"\nTimestamp Information ({len(self.timestamps)} entries):")
+        count = len(self.timestamps)
+        print(f"\nTimestamp Information ({count} entries):")
         print("-" * 60)
         
-        for i, ts in enumerate(self.timestamps):
-            print(f"Frame {i:3d}: {ts}")
+        intervals = self.timestamps.intervals_ms()
+        if rows <= 0 or count <= 2 * rows:
+            shown = range(count)
+        else:
+            shown = list(range(rows)) + list(range(count - rows, count))
+        
+        previous = None
+        for i in shown:
+            if previous is not None and i != previous + 1:
+                print(f"         ... {i - previous - 1} entries not shown ...")
+            suffix = " (interpolated)" if i < len(self.interpolated) and self.interpolated[i] else ""
+            print(f"Frame {i:3d}: {self.timestamps[i]}{suffix}")
             
             if i > 0:
-                time_diff = self.timestamps[i].unix_epoch_ms - self.timestamps[i-1].unix_epoch_ms
+                time_diff = int(intervals[i - 1])
                 print(f"         Time since previous: {time_diff}ms ({time_diff/1000.0:.3f}s)")
+            previous = i
         
-        if len(self.timestamps) > 1:
-            total_time = self.timestamps[-1].unix_epoch_ms - self.timestamps[0].unix_epoch_ms
-            avg_interval = total_time / (len(self.timestamps) - 1)
+        if count > 1:
+            # Across clock jumps the raw values are meaningless, the stitched timeline is not
+            total_time = self.timeline.total_time_ms()
+            avg_interval = total_time / (count - 1)
             print(f"\nSummary:")
             print(f"Total recording time: {total_time}ms ({total_time/1000.0:.3f}s)")
-            print(f"Average frame interval: {avg_interval:.1f}ms ({1000.0/avg_interval:.2f} fps)")
+            if avg_interval > 0:
+                print(f"Average frame interval: {avg_interval:.1f}ms ({1000.0/avg_interval:.2f} fps)")
+            
+            jitter = self.timeline.jitter_stats()
+            print(f"Frame interval jitter: median {jitter['median']:.1f}ms, std {jitter['std']:.1f}ms, "
+                  f"min {jitter['min']:.0f}ms, max {jitter['max']:.0f}ms, p95 {jitter['p95']:.1f}ms")
+            
+            gaps = self.timestamps.gaps()
+            if len(gaps):
+                print(f"Gaps (> 3x median interval or backwards): {len(gaps)}")
+                for i in gaps[:rows if rows > 0 else len(gaps)].tolist():
+                    print(f"         after frame {i}: {int(intervals[i])}ms")
+        
+        counts = self.timestamps.classification_counts()
+        print(f"Timestamp sources: {counts['ntp']} NTP, {counts['millis']} millis() since boot")
+        if len(self.clock_segments) > 1:
+            print("Clock segments (stitched into one timeline):")
+            for segment in self.clock_segments:
+                print(f"         {describe_segment(segment, self.timeline)}")
+        missing = int(np.count_nonzero(self.interpolated))
+        if missing:
+            print(f"Interpolated (frame without TIMS chunk): {missing}")
+
+
+def describe_segment(segment: ClockSegment, timeline: TimestampSeries) -> str:
+    """One line describing a clock segment and where it lies on the stitched timeline"""
+    start = TimestampChunk(int(timeline.values[segment.start]))
+    clock = "NTP" if segment.is_unix else "millis()"
+    if segment.is_unix and segment.offset_ms == 0:
+        placement = "measured"
+    elif segment.is_unix:
+        # NTP stepped back, moved to continue after the previous segment
+        placement = f"shifted after the previous segment, {segment.offset_ms:+d}ms"
+    elif segment.anchored:
+        placement = f"anchored to NTP, {segment.offset_ms:+d}ms"
+    else:
+        placement = f"not anchored, {segment.offset_ms:+d}ms"
+    when = (format_utc_ms(start.unix_epoch_ms) + ' UTC' if start.is_unix_timestamp
+            else f"Boot+{format_boot_time(start.unix_epoch_ms)}")
+    return (f"frames {segment.start}-{segment.end - 1}: {clock}, "
+            f"{placement}, starts {when}")
+
+
+def print_session_timeline(input_files: List[str], use_index: bool = True):
+    """Stitch the clips of a batch into one timeline and print where each clip lies on it
+
+    The clips are taken in file name order, which is recording order for the
+    numbered video_N.avi files, so clips recorded before NTP sync are anchored
+    by the NTP time of the clips after them.
+    """
+    names, series = [], []
+    for input_path in input_files:
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                values, _ = frame_timestamps(scan_avi(input_path, use_index=use_index))
+        except OSError as e:
+            print(f"  {input_path}: {e}")
+            continue
+        if len(values):
+            names.append(input_path)
+            series.append(TimestampSeries(values))
+
+    timelines, segments = stitch_timelines(series)
+    print(f"\nSession timeline ({len(names)} clips, {sum(len(s) for s in series)} frames, "
+          f"{len(segments)} clock segments):")
+    print("-" * 60)
+    for name, timeline in zip(names, timelines):
+        start, end = TimestampChunk(int(timeline.values[0])), TimestampChunk(int(timeline.values[-1]))
+        if start.is_unix_timestamp:
+            span = f"{format_utc_ms(start.unix_epoch_ms)} - {format_utc_ms(end.unix_epoch_ms)} UTC"
+        else:
+            span = f"Boot+{format_boot_time(start.unix_epoch_ms)} - Boot+{format_boot_time(end.unix_epoch_ms)}"
+        print(f"{os.path.basename(name)}: {span} ({len(timeline)} frames)")
+    if len(segments) > 1:
+        session = TimestampSeries(np.concatenate([t.values for t in timelines]))
+        print("Clock segments (frames counted across the whole session):")
+        for segment in segments:
+            print(f"         {describe_segment(segment, session)}")
+
+
+# Shared frame counter of the batch worker processes, set by _init_batch_worker
+_batch_frame_counter = None
+
+
+# AVIs written by this script (--salvage), never taken as batch inputs
+GENERATED_AVI_SUFFIXES = ('_repaired',)
+
+
+def collect_input_files(pattern: str) -> List[str]:
+    """Expand a directory or glob pattern into a sorted list of AVI files, leaving out the ones this script wrote"""
+    if os.path.isdir(pattern):
+        candidates = glob.glob(os.path.join(pattern, '*'))
+    else:
+        candidates = glob.glob(pattern, recursive=True)
+    return sorted(path for path in candidates
+                  if os.path.isfile(path) and path.lower().endswith('.avi')
+                  and not os.path.splitext(os.path.basename(path))[0].endswith(GENERATED_AVI_SUFFIXES))
+
+
+def default_output_path(input_path: str, output_dir: Optional[str] = None, extension: str = '.mp4',
+                        suffix: str = '_timestamped') -> str:
+    """input_timestamped.mp4, next to the input or inside output_dir"""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    directory = output_dir if output_dir else os.path.dirname(input_path)
+    return os.path.join(directory, f"{base_name}{suffix}{extension}")
+
+
+def default_output_extension(vfr: bool, remux: bool = False) -> str:
+    """Variable frame rate output needs ffmpeg for mp4, otherwise it is written as MJPEG .mkv"""
+    if remux:
+        return '.mkv'
+    return '.mkv' if vfr and not ffmpeg_available() else '.mp4'
+
+
+def default_output_suffix(vfr: bool, remux: bool = False) -> str:
+    """_remux / _vfr / _timestamped, so the outputs of different modes never overwrite each other"""
+    if remux:
+        return '_remux'
+    return '_vfr' if vfr else '_timestamped'
+
+
+def is_up_to_date(input_path: str, output_path: str) -> bool:
+    """True if output_path exists and is newer than input_path"""
+    return (os.path.exists(output_path) and os.path.getsize(output_path) > 0
+            and os.path.getmtime(output_path) >= os.path.getmtime(input_path))
+
+
+def _init_batch_worker(frame_counter):
+    global _batch_frame_counter
+    _batch_frame_counter = frame_counter
+    # One OpenCV thread per worker, the pool already uses every core
+    cv2.setNumThreads(1)
+
+
+def convert_file(input_path: str, output_path: str, use_index: bool = True, vfr: bool = False,
+                 remux: bool = False, subtitles: bool = False,
+                 activity_gate: Optional[ActivityGate] = None) -> Dict:
+    """Convert one AVI in a batch worker, returning a summary of the job"""
+    result = {'input': input_path, 'output': output_path, 'status': 'failed',
+              'input_frames': 0, 'output_frames': 0, 'seconds': 0.0, 'error': None}
+    start_time = time.time()
+    reported = 0
+
+    def progress(frame_index, total_frames):
+        nonlocal reported
+        if _batch_frame_counter is not None:
+            with _batch_frame_counter.get_lock():
+                _batch_frame_counter.value += frame_index - reported
+        reported = frame_index
+
+    # The pool already runs one file per core, so each file gets a single overlay worker
+    processor = VideoProcessor(input_path, output_path, use_index=use_index, vfr=vfr, overlay_workers=1,
+                               activity_gate=activity_gate)
+    try:
+        # The per-file output would interleave across workers, so it is
+        # dropped and only the aggregated progress is reported
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if remux:
+                converted = processor.remux_video(subtitles=subtitles, progress_callback=progress)
+            else:
+                converted = processor.process_video(progress_callback=progress)
+            if converted:
+                result['status'] = 'converted'
+            else:
+                result['error'] = 'no TIMS chunks found or video could not be opened'
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['input_frames'] = processor.input_frames
+    result['output_frames'] = processor.output_frames
+    result['seconds'] = time.time() - start_time
+    return result
+
+
+def run_batch(input_files: List[str], output_dir: Optional[str], jobs: int,
+              force: bool = False, use_index: bool = True, report_path: Optional[str] = None,
+              vfr: bool = False, remux: bool = False, subtitles: bool = False,
+              activity_gate: Optional[ActivityGate] = None) -> int:
+    """Convert many AVI files on a process pool and print a summary report"""
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    pending_jobs = []
+    for input_path in input_files:
+        output_path = default_output_path(input_path, output_dir, default_output_extension(vfr, remux),
+                                          suffix=default_output_suffix(vfr, remux))
+        if not force and is_up_to_date(input_path, output_path):
+            results.append({'input': input_path, 'output': output_path, 'status': 'skipped',
+                            'input_frames': 0, 'output_frames': 0, 'seconds': 0.0, 'error': None})
+        else:
+            pending_jobs.append((input_path, output_path))
+
+    print(f"Batch: {len(input_files)} files, {len(pending_jobs)} to convert, "
+          f"{len(results)} already up to date, {jobs} workers")
+
+    start_time = time.time()
+    frame_counter = multiprocessing.Value('q', 0)
+    if pending_jobs:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                                 initargs=(frame_counter,)) as executor:
+            futures = {executor.submit(convert_file, input_path, output_path, use_index, vfr, remux, subtitles,
+                                       activity_gate)
+                       for input_path, output_path in pending_jobs}
+            done_count = 0
+            while futures:
+                done, futures = wait(futures, timeout=5.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    done_count += 1
+                    status = result['status'] if not result['error'] else f"{result['status']} ({result['error']})"
+                    print(f"[{done_count}/{len(pending_jobs)}] {os.path.basename(result['input'])}: {status}")
+
+                elapsed = time.time() - start_time
+                frames = frame_counter.value
+                print(f"Progress: {done_count}/{len(pending_jobs)} files, {frames} frames, "
+                      f"{frames / elapsed if elapsed > 0 else 0.0:.1f} frames/s")
+
+    elapsed = time.time() - start_time
+    converted = [r for r in results if r['status'] == 'converted']
+    skipped = [r for r in results if r['status'] == 'skipped']
+    failed = [r for r in results if r['status'] == 'failed']
+    total_frames = sum(r['input_frames'] for r in converted)
+
+    print("\nBatch summary:")
+    print("-" * 60)
+    print(f"Converted: {len(converted)}")
+    print(f"Skipped (up to date): {len(skipped)}")
+    print(f"Failed: {len(failed)}")
+    for r in failed:
+        print(f"  {r['input']}: {r['error']}")
+    print(f"Input frames converted: {total_frames}")
+    print(f"Elapsed: {elapsed:.1f}s ({total_frames / elapsed if elapsed > 0 else 0.0:.1f} frames/s)")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump({'elapsed_seconds': elapsed, 'jobs': jobs, 'files': results}, f, indent=4)
+        print(f"Report written to {report_path}")
+
+    return 1 if failed else 0
+
+
+def salvage_file(input_path: str, output_path: str, use_index: bool = True) -> bool:
+    """Write a repaired copy of a cut-short recording and print what was recovered"""
+    try:
+        report = salvage_avi(input_path, output_path, use_index=use_index)
+    except (OSError, ValueError) as e:
+        print(f"Error: could not salvage {input_path}: {e}")
+        return False
+    print(f"Salvaged {input_path} -> {output_path} ({report['method']} scan)")
+    print(f"  Frames written: {report['frames_written']} of {report['frame_chunks']} frame chunks"
+          f"{', last chunk was cut off' if report['truncated'] else ''}")
+    if report['frames_dropped']:
+        print(f"  Frames dropped (payload is not a JPEG): {report['frames_dropped']}")
+    if report['frames_without_tims']:
+        print(f"  Frames without a TIMS chunk: {report['frames_without_tims']}")
+    print(f"  Frame rate in the header: {report['fps']:.2f} fps, {report['bytes_written']} bytes")
+    return True
 
 
 def main():
     parser = argparse.ArgumentParser(description='Process AVI files with TIMS timestamp chunks')
-    parser.add_argument('input', help='Input AVI file path')
-    parser.add_argument('-o', '--output', help='Output video file path (default: input_timestamped.mp4)')
+    parser.add_argument('input', help='Input AVI file path, or a directory / glob pattern (quoted) for batch conversion')
+    parser.add_argument('-o', '--output', help='Output video file path (default: input_timestamped.mp4, input_vfr.mp4/.mkv with --vfr, input_remux.mkv with --remux), or the output directory in batch mode')
     parser.add_argument('-i', '--info', action='store_true', help='Only show timestamp information, do not process video')
+    parser.add_argument('--no-index', action='store_true', help='Always rescan the AVI instead of using/writing the .tidx sidecar index')
+    parser.add_argument('--rows', type=int, default=20, help='Number of timestamps listed at the start and end of the info output (0 = all, default: 20)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes in batch mode (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true', help='In batch mode, also convert (or salvage) files whose output is already up to date')
+    parser.add_argument('--report', help='In batch mode, write a JSON summary report to this path')
+    parser.add_argument('--vfr', action='store_true', help='Write each frame once with its exact TIMS timestamp (MJPEG .mkv, or H.264 through ffmpeg) instead of duplicating frames')
+    parser.add_argument('--salvage', action='store_true', help='Write a repaired AVI (correct header sizes, idx1 index) of a recording that was cut short, without re-encoding')
+    parser.add_argument('--remux', action='store_true', help='Copy the JPEG frames into an MJPEG .mkv at their TIMS times without decoding them or drawing the overlay')
+    parser.add_argument('--workers', type=int, default=2, help='Overlay worker threads between the decoder and encoder threads (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=8, help='Frames buffered between the pipeline stages, bounds memory use (default: 8)')
+    parser.add_argument('--subtitles', action='store_true', help='With --remux, keep the timestamps as a subtitle track')
+    parser.add_argument('--from', dest='time_from', help='Only convert frames from this time: UTC date and time, HH:MM:SS[.mmm] (UTC time of day, or time since boot for millis() clips), a raw TIMS value, or +SECONDS after the first frame')
+    parser.add_argument('--to', dest='time_to', help='Only convert frames up to this time, same formats as --from, +SECONDS is relative to --from')
+    parser.add_argument('--contact-sheet', action='store_true', help='Write a grid of thumbnails (input_sheet.jpg, or -o) instead of converting, decoding only the frames shown at reduced size')
+    parser.add_argument('--sheet-interval', type=float, default=10.0, help='Seconds of TIMS time between contact sheet thumbnails (default: 10)')
+    parser.add_argument('--sheet-columns', type=int, default=6, help='Thumbnails per contact sheet row (default: 6)')
+    parser.add_argument('--thumb-width', type=int, default=160, help='Contact sheet thumbnail width in pixels (default: 160)')
+    parser.add_argument('--activity', action='store_true', help='Write an activity index (input_activity.json, or -o) from the JPEG chunk sizes instead of converting')
+    parser.add_argument('--activity-threshold', type=float, default=3.0, help='Activity score (robust z-score against the clip median) that makes a second active (default: 3.0)')
+    parser.add_argument('--activity-bin', type=float, default=1.0, help='Seconds per activity curve bin (default: 1)')
+    parser.add_argument('--frame-diff', action='store_true', help='With --activity, also compare one reduced-size decoded frame per bin')
+    parser.add_argument('--activity-gate', action='store_true', help='Only encode the active spans (see --activity), each idle stretch becomes one still frame with a gap overlay')
+    parser.add_argument('--pre-roll', type=float, default=2.0, help='With --activity-gate, seconds kept before each active span (default: 2)')
+    parser.add_argument('--post-roll', type=float, default=2.0, help='With --activity-gate, seconds kept after each active span (default: 2)')
+    parser.add_argument('--gap-still', type=float, default=1.0, help='With --activity-gate, seconds each idle stretch is shown (default: 1)')
     
     args = parser.parse_args()
     
+    activity_gate = None
+    if args.activity_gate:
+        if args.remux:
+            print("Error: --activity-gate does not apply to --remux")
+            return 1
+        activity_gate = ActivityGate(threshold=args.activity_threshold, bin_s=args.activity_bin,
+                                     pre_roll_s=args.pre_roll, post_roll_s=args.post_roll,
+                                     gap_still_s=args.gap_still)
+    
+    if os.path.isdir(args.input) or any(c in args.input for c in '*?['):
+        if args.time_from or args.time_to:
+            print("Error: --from/--to only apply to a single input file")
+            return 1
+        input_files = collect_input_files(args.input)
+        if not input_files:
+            print(f"Error: No AVI files found for '{args.input}'!")
+            return 1
+        
+        if args.salvage:
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+            failed = 0
+            for input_path in input_files:
+                output_path = default_output_path(input_path, args.output, '.avi', suffix='_repaired')
+                if not args.force and is_up_to_date(input_path, output_path):
+                    print(f"Skipping {input_path}, {output_path} is up to date")
+                    continue
+                if not salvage_file(input_path, output_path, use_index=not args.no_index):
+                    failed += 1
+            return 1 if failed else 0
+        
+        if args.contact_sheet:
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+            failed = 0
+            for input_path in input_files:
+                sheet_path = default_output_path(input_path, args.output, '.jpg', suffix='_sheet')
+                processor = VideoProcessor(input_path, sheet_path, use_index=not args.no_index)
+                if not processor.write_contact_sheet(sheet_path, args.sheet_interval, args.sheet_columns,
+                                                     args.thumb_width):
+                    failed += 1
+            return 1 if failed else 0
+        
+        if args.activity:
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+            failed = 0
+            for input_path in input_files:
+                json_path = default_output_path(input_path, args.output, '.json', suffix='_activity')
+                processor = VideoProcessor(input_path, json_path, use_index=not args.no_index)
+                if processor.write_activity_index(json_path, args.activity_bin, args.activity_threshold,
+                                                  args.frame_diff) is None:
+                    failed += 1
+            return 1 if failed else 0
+        
+        if args.info:
+            for input_path in input_files:
+                processor = VideoProcessor(input_path, default_output_path(input_path), use_index=not args.no_index)
+                print(f"\n=== {input_path} ===")
+                processor.extract_timestamps()
+                processor.print_timestamp_info(rows=args.rows)
+            print_session_timeline(input_files, use_index=not args.no_index)
+            return 0
+        
+        return run_batch(input_files, args.output, max(1, args.jobs), force=args.force,
+                         use_index=not args.no_index, report_path=args.report, vfr=args.vfr,
+                         remux=args.remux, subtitles=args.subtitles, activity_gate=activity_gate)
+    
     if not os.path.exists(args.input):
         print(f"Error: Input file '{args.input}' not found!")
         return 1
     
+    if args.salvage:
+        output_path = args.output or f"{os.path.splitext(args.input)[0]}_repaired.avi"
+        return 0 if salvage_file(args.input, output_path, use_index=not args.no_index) else 1
+    
+    if args.contact_sheet:
+        sheet_path = args.output or f"{os.path.splitext(args.input)[0]}_sheet.jpg"
+        processor = VideoProcessor(args.input, sheet_path, use_index=not args.no_index)
+        return 0 if processor.write_contact_sheet(sheet_path, args.sheet_interval, args.sheet_columns,
+                                                  args.thumb_width) else 1
+    
+    if args.activity:
+        json_path = args.output or f"{os.path.splitext(args.input)[0]}_activity.json"
+        processor = VideoProcessor(args.input, json_path, use_index=not args.no_index)
+        return 0 if processor.write_activity_index(json_path, args.activity_bin, args.activity_threshold,
+                                                   args.frame_diff) is not None else 1
+    
     if not args.output:
         base_name = os.path.splitext(args.input)[0]
-        args.output = f"{base_name}_timestamped.mp4"
+        args.output = (f"{base_name}{default_output_suffix(args.vfr, args.remux)}"
+                       f"{default_output_extension(args.vfr, args.remux)}")
     
-    processor = VideoProcessor(args.input, args.output)
+    processor = VideoProcessor(args.input, args.output, use_index=not args.no_index, vfr=args.vfr,
+                               overlay_workers=args.workers, queue_size=args.queue_size,
+                               activity_gate=activity_gate)
     
     # Extract timestamps first
     timestamps = processor.extract_timestamps()
@@ -387,13 +1010,30 @@ def main():
         return 1
     
     # Show timestamp information
-    processor.print_timestamp_info()
+    processor.print_timestamp_info(rows=args.rows)
     
     if args.info:
         return 0
     
+    if args.time_from or args.time_to:
+        # Times are matched against the stitched timeline
+        timestamps = processor.timeline
+        first_ms = int(timestamps.values[0])
+        try:
+            start_ms = parse_time_ms(args.time_from, first_ms) if args.time_from else 0
+            end_ms = (parse_time_ms(args.time_to, first_ms, base_ms=start_ms if args.time_from else first_ms)
+                      if args.time_to else int(timestamps.values.max()))
+        except ValueError as e:
+            print(f"Error: invalid --from/--to time: {e}")
+            return 1
+        processor.time_range = (start_ms, end_ms)
+    
     # Process the video
-    if processor.process_video():
+    if args.remux:
+        converted = processor.remux_video(subtitles=args.subtitles)
+    else:
+        converted = processor.process_video()
+    if converted:
         print(f"\nSuccess! Output video saved as: {args.output}")
         return 0
     else:
@@ -0,0 +1,195 @@
+"""
+Threaded read -> process -> write pipeline for video frames
+
+VideoProcessor used to decode a frame, draw on it and encode it on one
+thread, so the three steps never overlapped. FramePipeline runs them as
+stages: a reader thread, a pool of worker threads and a writer thread.
+cv2 decoding, drawing and encoding release the GIL, so the stages run
+concurrently.
+
+The reader submits every frame to the worker pool and puts the resulting
+future on a bounded queue in frame order. The writer takes futures off that
+queue in the same order, so frames are written in order even though the
+workers finish them out of order, and at most queue_size + workers + 2
+frames are in memory however long the clip is.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+_POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """Items handled by one stage and the time spent handling them"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+    @property
+    def items_per_second(self) -> float:
+        """Throughput of the stage while it is busy (per thread for the worker pool)"""
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+
+class QueueStats:
+    """Occupancy of a bounded queue, sampled every time an item is taken off it"""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total = 0
+        self.peak = 0
+
+    def sample(self, size: int):
+        self.samples += 1
+        self.total += size
+        self.peak = max(self.peak, size)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.samples if self.samples else 0.0
+
+
+class FramePipeline:
+    """Runs read_frame -> process_frame -> write_frame on separate threads, in frame order
+
+    read_frame() returns the next frame or None at the end of the input.
+    process_frame(index, frame) returns the frame to write, and runs on
+    `workers` threads at once. write_frame(index, frame) is called from a
+    single thread in increasing index order. An exception in any stage
+    stops the pipeline and is raised again from run().
+    """
+
+    def __init__(self, read_frame: Callable[[], Optional[np.ndarray]],
+                 process_frame: Callable[[int, np.ndarray], np.ndarray],
+                 write_frame: Callable[[int, np.ndarray], None],
+                 workers: int = 2, queue_size: int = 8):
+        self.read_frame = read_frame
+        self.process_frame = process_frame
+        self.write_frame = write_frame
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.stats: Dict[str, StageStats] = {}
+        self.queue_stats = QueueStats('frames', self.queue_size)
+        self.elapsed_seconds = 0.0
+
+    def _process(self, index: int, frame: np.ndarray):
+        start = time.perf_counter()
+        frame = self.process_frame(index, frame)
+        self.stats['process'].add(time.perf_counter() - start)
+        return index, frame
+
+    def run(self, progress_callback: Optional[Callable[[int], None]] = None,
+            progress_interval: int = 100) -> int:
+        """Run the pipeline to the end of the input, returning the number of frames written
+
+        progress_callback(frames_written) is called from the writer thread
+        every progress_interval frames, and once more with the final count.
+        """
+        self.stats = {name: StageStats(name) for name in ('read', 'process', 'write')}
+        self.queue_stats = QueueStats('frames', self.queue_size)
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        written = 0
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def reader(pool: ThreadPoolExecutor):
+            try:
+                index = 0
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    frame = self.read_frame()
+                    if frame is None:
+                        break
+                    self.stats['read'].add(time.perf_counter() - start)
+                    if not put(pool.submit(self._process, index, frame)):
+                        break
+                    index += 1
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(None)
+
+        def writer():
+            nonlocal written
+            try:
+                while True:
+                    try:
+                        future = frames.get(timeout=_POLL_SECONDS)
+                    except queue.Empty:
+                        if stop.is_set():
+                            break
+                        continue
+                    # Frames waiting at the moment, including the one just taken
+                    self.queue_stats.sample(frames.qsize() + 1)
+                    if future is None:
+                        break
+                    index, frame = future.result()
+                    start = time.perf_counter()
+                    self.write_frame(index, frame)
+                    self.stats['write'].add(time.perf_counter() - start)
+                    written += 1
+                    if progress_callback and written % progress_interval == 0:
+                        progress_callback(written)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='frame-process') as pool:
+            threads = [threading.Thread(target=reader, args=(pool,), name='frame-read', daemon=True),
+                       threading.Thread(target=writer, name='frame-write', daemon=True)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                pool.shutdown(wait=True, cancel_futures=True)
+        self.elapsed_seconds = time.perf_counter() - start_time
+
+        if errors:
+            raise errors[0]
+        # The final count, unless the writer just reported it
+        if progress_callback and (written == 0 or written % progress_interval):
+            progress_callback(written)
+        return written
+
+    def summary(self) -> List[str]:
+        """Per-stage throughput and queue occupancy of the last run, one line each"""
+        lines = []
+        for stats in self.stats.values():
+            threads = f" on {self.workers} threads" if stats.name == 'process' else ""
+            lines.append(f"{stats.name:>8}: {stats.items} frames, {stats.busy_seconds:.2f}s busy{threads}, "
+                         f"{stats.items_per_second:.1f} frames/s per thread")
+        q = self.queue_stats
+        lines.append(f"{'queue':>8}: average {q.average:.1f}, peak {q.peak} of {q.maxsize} frames")
+        if self.elapsed_seconds > 0:
+            written = self.stats['write'].items if 'write' in self.stats else 0
+            lines.append(f"{'total':>8}: {written / self.elapsed_seconds:.1f} frames/s "
+                         f"({self.elapsed_seconds:.2f}s)")
+        return lines
@@ -0,0 +1,320 @@
+"""
+Minimal Matroska (MKV) muxer for JPEG frames with exact per-frame timestamps
+
+AVI and cv2.VideoWriter only know a constant frame rate, so the ESP32's real
+frame timing (the TIMS values) can only be approximated by duplicating frames.
+Matroska stores a timestamp on every block, so MatroskaWriter writes each JPEG
+frame exactly once at its own millisecond timestamp (V_MJPEG), optionally with
+a S_TEXT/UTF8 subtitle track carrying the timestamp text.
+
+The output can go to a file (seekable: Cues, Duration and SeekHead are filled
+in on close) or to a pipe, e.g. ffmpeg's stdin via open_ffmpeg_encoder(), to
+encode the frames to H.264 while keeping their timestamps.
+"""
+
+import re
+import shutil
+import struct
+import subprocess
+from functools import lru_cache
+from typing import BinaryIO, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Element IDs, already including their length marker bits
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+MUXING_APP = 0x4D80
+WRITING_APP = 0x5741
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+FLAG_LACING = 0x9C
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+BLOCK_DURATION = 0x9B
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+VOID = 0xEC
+
+VIDEO_TRACK = 1
+SUBTITLE_TRACK = 2
+UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+SEEK_HEAD_RESERVED = 96  # bytes kept free after the Segment header for the SeekHead
+
+
+def _id_bytes(element_id: int) -> bytes:
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def _size_bytes(size: int, length: Optional[int] = None) -> bytes:
+    """EBML variable length size, in the shortest form unless length is given"""
+    if length is None:
+        length = 1
+        while size >= (1 << (7 * length)) - 1:
+            length += 1
+    return ((1 << (7 * length)) | size).to_bytes(length, 'big')
+
+
+def element(element_id: int, payload: bytes) -> bytes:
+    return _id_bytes(element_id) + _size_bytes(len(payload)) + payload
+
+
+def uint_element(element_id: int, value: int) -> bytes:
+    return element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big'))
+
+
+def float_element(element_id: int, value: float) -> bytes:
+    return element(element_id, struct.pack('>d', value))
+
+
+def string_element(element_id: int, value: str) -> bytes:
+    return element(element_id, value.encode('utf-8'))
+
+
+def void_element(total_size: int) -> bytes:
+    """Void element of exactly total_size bytes (at least 2), used as reserved space"""
+    size_length = 8 if total_size >= 9 else 1
+    payload_size = total_size - 1 - size_length
+    return _id_bytes(VOID) + _size_bytes(payload_size, size_length) + b'\x00' * payload_size
+
+
+class MatroskaWriter:
+    """Writes JPEG frames with millisecond timestamps into a Matroska file or pipe"""
+
+    def __init__(self, output: BinaryIO, width: int, height: int, subtitles: bool = False,
+                 cluster_ms: int = 5000, writing_app: str = 'convert-avi-custom-normal.py'):
+        self.output = output
+        self.subtitles = subtitles
+        self.cluster_ms = min(cluster_ms, 32000)  # Block timecodes are int16 relative to the cluster
+        try:
+            self.seekable = output.seekable()
+        except (AttributeError, OSError):
+            self.seekable = False
+
+        self._cluster_time: Optional[int] = None
+        self._cluster_blocks: List[bytes] = []
+        self._cues: List[Tuple[int, int]] = []  # (cluster time, cluster position in segment)
+        self._last_time = 0
+        self._written = 0
+
+        self._write(element(EBML, b''.join([
+            uint_element(0x4286, 1),              # EBMLVersion
+            uint_element(0x42F7, 1),              # EBMLReadVersion
+            uint_element(0x42F2, 4),              # EBMLMaxIDLength
+            uint_element(0x42F3, 8),              # EBMLMaxSizeLength
+            string_element(0x4282, 'matroska'),   # DocType
+            uint_element(0x4287, 4),              # DocTypeVersion
+            uint_element(0x4285, 2),              # DocTypeReadVersion
+        ])))
+
+        # The Segment size is unknown until close(), and stays unknown on a pipe
+        self._segment_size_pos = self._written + len(_id_bytes(SEGMENT))
+        self._write(_id_bytes(SEGMENT) + UNKNOWN_SIZE)
+        self._segment_start = self._written
+
+        self._seek_head_pos = self._written
+        self._write(void_element(SEEK_HEAD_RESERVED))
+
+        self._info_pos = self._segment_offset()
+        info = uint_element(TIMECODE_SCALE, 1000000)  # Timestamps in milliseconds
+        info += string_element(MUXING_APP, writing_app) + string_element(WRITING_APP, writing_app)
+        info += float_element(DURATION, 0.0)
+        self._write(element(INFO, info))
+        self._duration_pos = self._written - 8  # The Duration value is the last 8 bytes of Info
+
+        self._tracks_pos = self._segment_offset()
+        tracks = element(TRACK_ENTRY, b''.join([
+            uint_element(TRACK_NUMBER, VIDEO_TRACK),
+            uint_element(TRACK_UID, VIDEO_TRACK),
+            uint_element(TRACK_TYPE, 1),
+            uint_element(FLAG_LACING, 0),
+            string_element(CODEC_ID, 'V_MJPEG'),
+            element(VIDEO, uint_element(PIXEL_WIDTH, width) + uint_element(PIXEL_HEIGHT, height)),
+        ]))
+        if subtitles:
+            tracks += element(TRACK_ENTRY, b''.join([
+                uint_element(TRACK_NUMBER, SUBTITLE_TRACK),
+                uint_element(TRACK_UID, SUBTITLE_TRACK),
+                uint_element(TRACK_TYPE, 0x11),
+                uint_element(FLAG_LACING, 0),
+                string_element(CODEC_ID, 'S_TEXT/UTF8'),
+            ]))
+        self._write(element(TRACKS, tracks))
+
+    def _write(self, data: bytes):
+        self.output.write(data)
+        self._written += len(data)
+
+    def _segment_offset(self) -> int:
+        return self._written - self._segment_start
+
+    def _block_header(self, track: int, timestamp_ms: int, flags: int) -> bytes:
+        if self._cluster_time is None or timestamp_ms - self._cluster_time >= self.cluster_ms:
+            self._flush_cluster()
+            self._cluster_time = timestamp_ms
+        return _size_bytes(track) + struct.pack('>hB', timestamp_ms - self._cluster_time, flags)
+
+    def _flush_cluster(self):
+        if self._cluster_time is None or not self._cluster_blocks:
+            return
+        self._cues.append((self._cluster_time, self._segment_offset()))
+        payload = uint_element(TIMECODE, self._cluster_time)
+        self._write(_id_bytes(CLUSTER) + _size_bytes(len(payload) + sum(map(len, self._cluster_blocks))))
+        self._write(payload)
+        for block in self._cluster_blocks:
+            self._write(block)
+        self._cluster_blocks = []
+
+    def write_frame(self, jpeg: bytes, timestamp_ms: int):
+        """Add one JPEG frame, timestamps must not decrease"""
+        timestamp_ms = max(int(timestamp_ms), self._last_time)
+        header = self._block_header(VIDEO_TRACK, timestamp_ms, 0x80)  # Keyframe
+        self._cluster_blocks.append(element(SIMPLE_BLOCK, header + jpeg))
+        self._last_time = timestamp_ms
+
+    def write_subtitle(self, text: str, timestamp_ms: int, duration_ms: int):
+        """Add a subtitle shown from timestamp_ms for duration_ms"""
+        if not self.subtitles:
+            raise ValueError("MatroskaWriter was created without a subtitle track")
+        timestamp_ms = max(int(timestamp_ms), self._last_time)
+        block = element(BLOCK, self._block_header(SUBTITLE_TRACK, timestamp_ms, 0) + text.encode('utf-8'))
+        self._cluster_blocks.append(element(BLOCK_GROUP, block + uint_element(BLOCK_DURATION, max(1, int(duration_ms)))))
+        self._last_time = timestamp_ms
+
+    def close(self, duration_ms: Optional[float] = None):
+        """Flush the last cluster and, on a seekable output, write Cues, Duration and SeekHead"""
+        self._flush_cluster()
+        if not self.seekable:
+            self.output.flush()
+            return
+
+        cues_pos = self._segment_offset()
+        self._write(element(CUES, b''.join(
+            element(CUE_POINT, uint_element(CUE_TIME, cue_time) + element(CUE_TRACK_POSITIONS,
+                    uint_element(CUE_TRACK, VIDEO_TRACK) + uint_element(CUE_CLUSTER_POSITION, position)))
+            for cue_time, position in self._cues)))
+        end = self._written
+
+        seek_head = element(SEEK_HEAD, b''.join(
+            element(SEEK, element(SEEK_ID, _id_bytes(element_id)) + uint_element(SEEK_POSITION, position))
+            for element_id, position in ((INFO, self._info_pos), (TRACKS, self._tracks_pos), (CUES, cues_pos))))
+        seek_head += void_element(SEEK_HEAD_RESERVED - len(seek_head))
+
+        if duration_ms is None:
+            duration_ms = self._last_time
+        for position, data in ((self._segment_size_pos, _size_bytes(end - self._segment_start, 8)),
+                               (self._seek_head_pos, seek_head),
+                               (self._duration_pos, struct.pack('>d', float(duration_ms)))):
+            self.output.seek(position)
+            self.output.write(data)
+        self.output.seek(end)
+        self.output.flush()
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_passthrough_option() -> List[str]:
+    """'-fps_mode passthrough', or '-vsync passthrough' for ffmpeg older than 5.1
+
+    -vsync is deprecated since 5.1 and prints a warning on every run.
+    Development builds ('N-...' versions) are taken as recent.
+    """
+    try:
+        version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+    except OSError:
+        version = ''
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', version)
+    if match and (int(match.group(1)), int(match.group(2))) < (5, 1):
+        return ['-vsync', 'passthrough']
+    return ['-fps_mode', 'passthrough']
+
+
+def open_ffmpeg_encoder(output_path: str, crf: int = 23, preset: str = 'veryfast',
+                        video_codec: str = 'libx264') -> subprocess.Popen:
+    """Start ffmpeg reading Matroska from stdin and encoding H.264 with the input timestamps
+
+    '-fps_mode passthrough' keeps every frame at its own timestamp instead of
+    dropping/duplicating frames to reach a constant rate. With video_codec
+    'copy' the JPEG frames are only remuxed into the output container.
+    """
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+               '-f', 'matroska', '-i', 'pipe:0',
+               '-map', '0', '-c:v', video_codec]
+    if video_codec != 'copy':
+        command += ['-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+    command += ffmpeg_passthrough_option()
+    if output_path.lower().endswith(('.mp4', '.mov')):
+        command += ['-c:s', 'mov_text', '-movflags', '+faststart']
+    else:
+        command += ['-c:s', 'copy']
+    command.append(output_path)
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+
+class VFRVideoWriter:
+    """cv2.VideoWriter-like writer that gives every frame its own timestamp
+
+    Frames are JPEG encoded into a MatroskaWriter, written straight to an
+    .mkv file, or piped through ffmpeg for any other output format.
+    write_jpeg() takes already encoded frames, e.g. copied out of an AVI.
+    """
+
+    def __init__(self, output_path: str, width: int, height: int, jpeg_quality: int = 95,
+                 subtitles: bool = False, video_codec: str = 'libx264'):
+        self.output_path = output_path
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        self.process: Optional[subprocess.Popen] = None
+        if output_path.lower().endswith('.mkv'):
+            self.output = open(output_path, 'wb')
+        else:
+            if not ffmpeg_available():
+                raise RuntimeError(f"ffmpeg is needed to write {output_path} with per-frame timestamps, "
+                                   f"install it or write an .mkv file instead")
+            self.process = open_ffmpeg_encoder(output_path, video_codec=video_codec)
+            self.output = self.process.stdin
+        self.mkv = MatroskaWriter(self.output, width, height, subtitles=subtitles)
+
+    def write(self, frame: np.ndarray, timestamp_ms: int):
+        ok, jpeg = cv2.imencode('.jpg', frame, self.encode_params)
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        self.mkv.write_frame(jpeg.tobytes(), timestamp_ms)
+
+    def write_jpeg(self, jpeg: bytes, timestamp_ms: int):
+        self.mkv.write_frame(jpeg, timestamp_ms)
+
+    def write_subtitle(self, text: str, timestamp_ms: int, duration_ms: int):
+        self.mkv.write_subtitle(text, timestamp_ms, duration_ms)
+
+    def release(self, duration_ms: Optional[float] = None) -> bool:
+        """Finish the file, returning False if ffmpeg failed"""
+        self.mkv.close(duration_ms)
+        self.output.close()
+        if self.process is not None:
+            return self.process.wait() == 0
+        return True
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Synthetic AVI generator with the layout written by esp-32-sd-card.ino
+
+Writes the same AVIHeader/StreamHeader/BitmapInfo/movi LIST headers as
+startVideoFile(), then a '00dc' JPEG chunk (padded to an even size) and a
+16 byte 'TIMS' chunk per frame, and finally patches the RIFF size, total
+frames and movi size like finishVideoFile(). No idx1 index is written, as on
+the camera.
+
+Frames cycle through a small pool of JPEGs with a moving bar, except in
+idle spans, which repeat one frame like a camera watching a static scene.
+The clip can be given clock jumps (e.g. millis() switching to NTP time
+mid-recording), frame timing jitter, and the damage seen on real SD cards:
+an unfinished file, a truncated last chunk, garbage chunk sizes, zeroed
+TIMS values and overwritten bytes. It is used by benchmark.py and to try
+the converter without ESP32 footage.
+
+Usage:
+    python3 synthetic_avi.py clip.avi --frames 3000 --width 800 --height 600
+    # millis() for 100 frames, then NTP time, with a truncated last frame
+    python3 synthetic_avi.py clip.avi --start-ms 5000 --clock-jump 100:1700000000000 --corrupt truncate
+    # Motion only in frames 0-99 and 500-599
+    python3 synthetic_avi.py clip.avi --frames 1000 --idle 100:500 --idle 600:1000
+"""
+
+import argparse
+import os
+import random
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from avi_layout import HEADER_SIZE, MOVI_SIZE_OFFSET, MOVI_START, TOTAL_FRAMES_OFFSET, avi_headers
+
+CORRUPTIONS = ['unfinished', 'truncate', 'bad-size', 'zero-tims', 'garbage']
+
+
+def frame_pool(width: int, height: int, count: int = 16, quality: int = 90, seed: int = 0) -> List[bytes]:
+    """A few distinct JPEG frames (moving bar over noise) that the clip cycles through"""
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 64, size=(height, width, 3), dtype=np.uint8)
+    gradient = np.ascontiguousarray(np.broadcast_to(
+        np.linspace(0, 128, width, dtype=np.uint8)[None, :, None], (height, width, 3)))
+    base = cv2.add(cv2.GaussianBlur(base, (0, 0), 3), gradient)
+    jpegs = []
+    for i in range(count):
+        frame = base.copy()
+        x = (i * width) // count
+        cv2.rectangle(frame, (x, height // 3), (x + width // 8, 2 * height // 3), (0, 200, 255), -1)
+        ok, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        jpegs.append(jpeg.tobytes())
+    return jpegs
+
+
+def frame_timestamps(frames: int, fps: int, start_ms: int, jitter_ms: int = 0,
+                     clock_jumps: Sequence[Tuple[int, int]] = (), seed: int = 0) -> np.ndarray:
+    """TIMS values: start_ms at fps with +-jitter_ms, restarting at value V from frame N for each (N, V)"""
+    rng = np.random.default_rng(seed)
+    intervals = np.full(frames, 1000 // fps, dtype=np.int64)
+    if jitter_ms:
+        intervals += rng.integers(-jitter_ms, jitter_ms + 1, size=frames)
+    intervals = np.maximum(intervals, 1)
+    intervals[0] = 0
+    values = start_ms + np.cumsum(intervals)
+    for frame, value in sorted(clock_jumps):
+        if 0 <= frame < frames:
+            values[frame:] += value - values[frame]
+    return values.astype(np.uint64)
+
+
+def generate_avi(path: str, frames: int = 300, width: int = 640, height: int = 480, fps: int = 10,
+                 start_ms: int = 1700000000000, jitter_ms: int = 0,
+                 clock_jumps: Sequence[Tuple[int, int]] = (), corruptions: Sequence[str] = (),
+                 quality: int = 90, seed: int = 0, idle_spans: Sequence[Tuple[int, int]] = ()) -> Dict:
+    """Write a synthetic clip to path and return what was written (sizes, timestamps, damage)"""
+    for corruption in corruptions:
+        if corruption not in CORRUPTIONS:
+            raise ValueError(f"Unknown corruption '{corruption}', expected one of {CORRUPTIONS}")
+
+    jpegs = frame_pool(width, height, quality=quality, seed=seed)
+    timestamps = frame_timestamps(frames, fps, start_ms, jitter_ms, clock_jumps, seed)
+    idle = np.zeros(frames, dtype=bool)
+    for first, last in idle_spans:
+        idle[max(first, 0):max(last, 0)] = True
+    frame_offsets = np.empty(frames, dtype=np.int64)
+    tims_offsets = np.empty(frames, dtype=np.int64)
+
+    with open(path, 'wb') as f:
+        f.write(avi_headers(width, height, fps))
+        position = MOVI_START
+        for i in range(frames):
+            jpeg = jpegs[0] if idle[i] else jpegs[i % len(jpegs)]
+            frame_offsets[i] = position
+            chunk = struct.pack('<4sI', b'00dc', len(jpeg)) + jpeg + (b'\x00' if len(jpeg) % 2 else b'')
+            tims_offsets[i] = position + len(chunk)
+            chunk += struct.pack('<4sIQ', b'TIMS', 8, int(timestamps[i]))
+            f.write(chunk)
+            position += len(chunk)
+
+        if 'unfinished' not in corruptions:
+            # finishVideoFile()
+            f.seek(4)
+            f.write(struct.pack('<I', position - 8))
+            f.seek(TOTAL_FRAMES_OFFSET)
+            f.write(struct.pack('<I', frames))
+            f.seek(MOVI_SIZE_OFFSET)
+            f.write(struct.pack('<I', position - HEADER_SIZE - 8))
+
+    damage = _damage(path, corruptions, frame_offsets, tims_offsets, seed)
+    return {'path': path, 'frames': frames, 'width': width, 'height': height, 'fps': fps,
+            'bytes': os.path.getsize(path), 'timestamps': timestamps,
+            'frame_offsets': frame_offsets, 'tims_offsets': tims_offsets, 'damage': damage}
+
+
+def _damage(path: str, corruptions: Sequence[str], frame_offsets: np.ndarray,
+            tims_offsets: np.ndarray, seed: int) -> List[str]:
+    """Apply corruptions to the file in place, returning a description of each"""
+    rng = random.Random(seed)
+    frames = len(frame_offsets)
+    damage = []
+    with open(path, 'r+b') as f:
+        if 'bad-size' in corruptions and frames > 2:
+            i = rng.randrange(1, frames - 1)
+            f.seek(int(frame_offsets[i]) + 4)
+            f.write(struct.pack('<I', 0x7FFFFFF0))
+            damage.append(f"frame {i}: chunk size overwritten")
+        if 'zero-tims' in corruptions and frames > 2:
+            i = rng.randrange(1, frames - 1)
+            f.seek(int(tims_offsets[i]) + 8)
+            f.write(b'\x00' * 8)
+            damage.append(f"frame {i}: TIMS value zeroed")
+        if 'garbage' in corruptions and frames > 2:
+            i = rng.randrange(1, frames - 1)
+            f.seek(int(frame_offsets[i]))
+            f.write(bytes(rng.randrange(256) for _ in range(64)))
+            damage.append(f"frame {i}: 64 bytes overwritten from the chunk header")
+        if 'truncate' in corruptions and frames:
+            cut = int(frame_offsets[-1]) + (int(tims_offsets[-1]) - int(frame_offsets[-1])) // 2
+            f.truncate(cut)
+            damage.append(f"frame {frames - 1}: file truncated at byte {cut}")
+    if 'unfinished' in corruptions:
+        damage.append("RIFF, total frames and movi sizes not patched")
+    return damage
+
+
+def parse_clock_jump(text: str) -> Tuple[int, int]:
+    frame, value = text.split(':')
+    return int(frame), int(value)
+
+
+def parse_span(text: str) -> Tuple[int, int]:
+    first, last = text.split(':')
+    return int(first), int(last)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic ESP32 AVI with TIMS chunks')
+    parser.add_argument('output', help='Output AVI file path')
+    parser.add_argument('--frames', type=int, default=300, help='Number of frames (default: 300)')
+    parser.add_argument('--width', type=int, default=640, help='Frame width (default: 640)')
+    parser.add_argument('--height', type=int, default=480, help='Frame height (default: 480)')
+    parser.add_argument('--fps', type=int, default=10, help='Nominal frame rate (default: 10)')
+    parser.add_argument('--start-ms', type=int, default=1700000000000, help='First TIMS value, small values act as millis() (default: 1700000000000)')
+    parser.add_argument('--jitter-ms', type=int, default=0, help='Random +- variation of the frame interval in ms (default: 0)')
+    parser.add_argument('--clock-jump', action='append', type=parse_clock_jump, default=[], metavar='FRAME:MS', help='From FRAME on, timestamps continue from MS (repeatable)')
+    parser.add_argument('--idle', action='append', type=parse_span, default=[], metavar='FIRST:LAST', help='Frames FIRST up to LAST show a static scene (repeatable)')
+    parser.add_argument('--corrupt', action='append', choices=CORRUPTIONS, default=[], help='Damage to apply (repeatable)')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality (default: 90)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    info = generate_avi(args.output, args.frames, args.width, args.height, args.fps, args.start_ms,
+                        args.jitter_ms, args.clock_jump, args.corrupt, args.quality, args.seed, args.idle)
+    print(f"Wrote {info['path']}: {info['frames']} frames, {info['width']}x{info['height']}, "
+          f"{info['bytes'] / (1024 * 1024):.1f} MB")
+    for description in info['damage']:
+        print(f"  damage: {description}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Cached timestamp burn-in for video frames
+
+Drawing a timestamp with cv2.getTextSize/cv2.rectangle/cv2.putText on every
+frame rasterizes the same few characters over and over. TimestampOverlayRenderer
+rasterizes each character once, text and outline together, into a tile exactly
+one advance wide. Per frame a line of text is then a single np.concatenate of
+cached tiles, copied (or alpha blended, without a background box) into the
+small region of the frame that the label covers, in place.
+
+It is shared by convert-avi-custom-normal.py and the ELP recorder
+(elp/elp-usb16mp01-H120), which imports it from this directory.
+"""
+
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_CHARSET = "0123456789:-.+/ ()[]_" \
+                  "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+Color = Tuple[int, int, int]
+
+
+class Glyph:
+    """Pre-rendered tiles of one character"""
+
+    def __init__(self, advance: float, baseline: int, tiles: Dict[int, Tuple[np.ndarray, Optional[np.ndarray]]]):
+        self.advance = advance      # horizontal advance in pixels (fractional)
+        self.baseline = baseline    # pixels below the baseline, as returned by cv2.getTextSize
+        self.tiles = tiles          # tile width -> (image, alpha or None when opaque)
+
+
+class GlyphAtlas:
+    """Lazily filled cache of glyph tiles for one font and color scheme
+
+    Tiles are cropped to the character's advance, rounded down and up, so a
+    line assembled from them follows cv2.putText's fractional positions.
+    """
+
+    def __init__(self, font: int = cv2.FONT_HERSHEY_SIMPLEX, font_scale: float = 0.7,
+                 thickness: int = 2, color: Color = (255, 255, 255),
+                 outline_color: Color = (0, 0, 0), outline_thickness: int = 0,
+                 background_color: Optional[Color] = (0, 0, 0),
+                 line_type: int = cv2.LINE_8, charset: str = DEFAULT_CHARSET):
+        self.font = font
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.color = color
+        self.outline_color = outline_color
+        self.outline_thickness = outline_thickness
+        self.background_color = background_color
+        self.line_type = line_type
+
+        (_, self.ascent), descent = cv2.getTextSize(charset, font, font_scale, thickness)
+        # Rows above the ascent and below the baseline for strokes and outline
+        self.margin = (max(thickness, outline_thickness) + 1) // 2 + 1
+        self.cell_height = self.ascent + descent + 2 * self.margin
+
+        self._glyphs: Dict[str, Glyph] = {}
+        self._lock = threading.Lock()
+        self._render_word = lru_cache(maxsize=1024)(self._render_run)
+        for char in charset:
+            self.glyph(char)
+
+    def _render_layer(self, char: str, color, thickness: int, canvas: np.ndarray):
+        cv2.putText(canvas, char, (self.margin, self.margin + self.ascent),
+                    self.font, self.font_scale, color, thickness, self.line_type)
+
+    def _render(self, char: str) -> Glyph:
+        (char_width, _), baseline = cv2.getTextSize(char, self.font, self.font_scale, self.thickness)
+        # getTextSize rounds, so measure the advance over a run of the character
+        (run_width, _), _ = cv2.getTextSize(char * 16, self.font, self.font_scale, self.thickness)
+        advance = (run_width - char_width) / 15.0
+
+        width = int(np.ceil(advance)) + 2 * self.margin
+        shape = (self.cell_height, width, 3)
+        if self.background_color is not None:
+            image = np.empty(shape, dtype=np.uint8)
+            image[:] = self.background_color
+            if self.outline_thickness > 0:
+                self._render_layer(char, self.outline_color, self.outline_thickness, image)
+            self._render_layer(char, self.color, self.thickness, image)
+            alpha = None
+        else:
+            # Premultiplied color plus coverage, composited as outline then text
+            fill = np.zeros(shape, dtype=np.uint8)
+            self._render_layer(char, (255, 255, 255), self.thickness, fill)
+            f = fill.astype(np.float32) / 255.0
+            o = np.zeros_like(f)
+            if self.outline_thickness > 0:
+                outline = np.zeros(shape, dtype=np.uint8)
+                self._render_layer(char, (255, 255, 255), self.outline_thickness, outline)
+                o = outline.astype(np.float32) / 255.0
+            coverage = o + f - o * f
+            premultiplied = (np.array(self.outline_color, dtype=np.float32) * o * (1.0 - f)
+                             + np.array(self.color, dtype=np.float32) * f)
+            image = np.round(premultiplied).astype(np.uint16)
+            alpha = np.round(coverage * 255.0).astype(np.uint16)
+
+        tiles = {}
+        for tile_width in {int(np.floor(advance)), int(np.ceil(advance))}:
+            crop = slice(self.margin, self.margin + tile_width)
+            tiles[tile_width] = (np.ascontiguousarray(image[:, crop]),
+                                 None if alpha is None else np.ascontiguousarray(alpha[:, crop]))
+        return Glyph(advance, baseline, tiles)
+
+    def glyph(self, char: str) -> Glyph:
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            glyph = self._render(char)
+            with self._lock:
+                self._glyphs[char] = glyph
+        return glyph
+
+    def text_size(self, text: str) -> Tuple[Tuple[int, int], int]:
+        """Same contract as cv2.getTextSize, computed from the cached glyphs"""
+        glyphs = [self.glyph(char) for char in text]
+        width = int(round(sum(g.advance for g in glyphs)))
+        baseline = max((g.baseline for g in glyphs), default=0)
+        return (width, self.ascent), baseline
+
+    def _render_run(self, text: str) -> Tuple[np.ndarray, Optional[np.ndarray], int]:
+        images: List[np.ndarray] = []
+        alphas: List[np.ndarray] = []
+        baseline = 0
+        x = 0.0
+        left = 0
+        for char in text:
+            g = self._glyphs.get(char) or self.glyph(char)
+            x += g.advance
+            image, alpha = g.tiles.get(int(round(x)) - left) or next(iter(g.tiles.values()))
+            images.append(image)
+            if alpha is not None:
+                alphas.append(alpha)
+            if g.baseline > baseline:
+                baseline = g.baseline
+            left += image.shape[1]
+
+        if not images:
+            return np.empty((self.cell_height, 0, 3), dtype=np.uint8), None, 0
+        return (np.concatenate(images, axis=1),
+                np.concatenate(alphas, axis=1) if alphas else None,
+                baseline)
+
+    def render_line(self, text: str) -> Tuple[np.ndarray, Optional[np.ndarray], int]:
+        """Assemble the tiles of text into (image, alpha, baseline)
+
+        The line image starts at the text origin's x and self.margin rows
+        above the top of the text; alpha is None for an opaque background.
+        Words are cached, so only the part of a timestamp that changed since
+        the previous frame is assembled character by character.
+        """
+        words = text.split(' ')
+        if len(words) == 1:
+            return self._render_word(text)
+
+        runs = []
+        for i, word in enumerate(words):
+            if i:
+                runs.append(self._render_word(' '))
+            if word:
+                runs.append(self._render_word(word))
+        return (np.concatenate([image for image, _, _ in runs], axis=1),
+                None if runs[0][1] is None else np.concatenate([alpha for _, alpha, _ in runs], axis=1),
+                max(baseline for _, _, baseline in runs))
+
+
+class TimestampOverlayRenderer:
+    """Draws lines of text over an optional background box, in place"""
+
+    def __init__(self, font: int = cv2.FONT_HERSHEY_SIMPLEX, font_scale: float = 0.7,
+                 thickness: int = 2, color: Color = (255, 255, 255),
+                 outline_color: Color = (0, 0, 0), outline_thickness: int = 0,
+                 background_color: Optional[Color] = (0, 0, 0), padding: int = 5,
+                 line_spacing: int = 10, line_type: int = cv2.LINE_8):
+        self.atlas = GlyphAtlas(font, font_scale, thickness, color, outline_color,
+                                outline_thickness, background_color, line_type)
+        self.background_color = background_color
+        self.padding = padding
+        self.line_spacing = line_spacing
+
+    def draw(self, frame: np.ndarray, lines: Sequence[str], x: int = 10, y: int = 10,
+             from_bottom: bool = False) -> np.ndarray:
+        """Draw lines onto frame, with the text block's top-left corner at (x, y)
+
+        With from_bottom, y is the distance from the bottom of the frame to
+        the bottom of the text block (including the last line's baseline).
+        """
+        atlas = self.atlas
+        rendered = [atlas.render_line(text) for text in lines]
+        if not rendered:
+            return frame
+        block_width = max(image.shape[1] for image, _, _ in rendered)
+        block_height = len(lines) * atlas.ascent + (len(lines) - 1) * self.line_spacing + rendered[-1][2]
+
+        if from_bottom:
+            y = frame.shape[0] - y - block_height
+
+        # Lines are clipped to the frame, and to the box when there is one
+        clip_top, clip_left = 0, 0
+        clip_bottom, clip_right = frame.shape[0], frame.shape[1]
+        if self.background_color is not None:
+            pad = self.padding
+            clip_top, clip_left = max(y - pad, 0), max(x - pad, 0)
+            clip_bottom = max(min(y + block_height + pad + 1, clip_bottom), clip_top)
+            clip_right = max(min(x + block_width + pad + 1, clip_right), clip_left)
+            # Much faster than assigning a color tuple to the slice
+            cv2.rectangle(frame, (x - pad, y - pad), (x + block_width + pad, y + block_height + pad),
+                          self.background_color, -1)
+
+        line_top = y - atlas.margin
+        for image, alpha, _ in rendered:
+            top, left = max(line_top, clip_top), max(x, clip_left)
+            bottom = min(line_top + image.shape[0], clip_bottom)
+            right = min(x + image.shape[1], clip_right)
+            if bottom > top and right > left:
+                rows = slice(top - line_top, bottom - line_top)
+                cols = slice(left - x, right - x)
+                roi = frame[top:bottom, left:right]
+                if alpha is None:
+                    roi[...] = image[rows, cols]
+                else:
+                    a = alpha[rows, cols]
+                    roi[...] = (roi * (255 - a) + image[rows, cols] * 255 + 127) // 255
+            line_top += atlas.ascent + self.line_spacing
+        return frame
+
+
+_renderers: Dict[tuple, TimestampOverlayRenderer] = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(**style) -> TimestampOverlayRenderer:
+    """Shared renderer for a given style, so the glyphs are rasterized once per process"""
+    key = tuple(sorted(style.items()))
+    with _renderers_lock:
+        renderer = _renderers.get(key)
+        if renderer is None:
+            renderer = TimestampOverlayRenderer(**style)
+            _renderers[key] = renderer
+    return renderer
+
+
+@lru_cache(maxsize=8)
+def _utc_second_text(epoch_seconds: int) -> str:
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_utc_ms(unix_epoch_ms: int) -> str:
+    """'YYYY-MM-DD HH:MM:SS.mmm', formatting the date and time once per second"""
+    seconds, millis = divmod(int(unix_epoch_ms), 1000)
+    return f"{_utc_second_text(seconds)}.{millis:03d}"
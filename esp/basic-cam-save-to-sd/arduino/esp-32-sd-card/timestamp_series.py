@@ -0,0 +1,290 @@
+"""
+Columnar storage for the TIMS values of one AVI file
+
+TimestampSeries keeps every TIMS value in a single uint64 NumPy array and
+computes durations, fps, gaps and jitter over it in vectorized form.
+TimestampChunk objects (and their datetime) are only created for the rows
+that are actually indexed, e.g. the ones printed or burned into a frame.
+
+stitch_timeline() turns values that switch between millis() and NTP time
+(or restart after a reboot) into one monotonic timeline.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Values after 2020-01-01 in milliseconds come from NTP time, anything
+# smaller is millis() since ESP32 boot (see getCurrentTimestampMs())
+NTP_EPOCH_THRESHOLD_MS = 1577836800000
+
+
+def format_boot_time(unix_epoch_ms: int) -> str:
+    """Format a millis() value as HH:MM:SS.mmm since boot"""
+    seconds = unix_epoch_ms / 1000.0
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
+
+
+_TIME_OF_DAY = re.compile(r'^(\d+):(\d{1,2})(?::(\d{1,2}(?:\.\d*)?))?$')
+
+
+def parse_time_ms(text: str, reference_ms: int, base_ms: Optional[int] = None) -> int:
+    """Parse a --from/--to value into a TIMS value in milliseconds
+
+    Accepted forms:
+      1700000000123            a raw TIMS value (epoch ms or millis())
+      2024-05-01 12:00:05.250  UTC date and time (ISO 8601, 'T', 'Z' and offsets accepted)
+      12:00:05.250             time of day in UTC on the day of reference_ms for an NTP
+                               clip, or time since boot (as shown by Boot+...) for millis()
+      +20 / +1.5               seconds after base_ms (default: reference_ms)
+    """
+    text = text.strip()
+    if text.startswith('+'):
+        return int(base_ms if base_ms is not None else reference_ms) + int(round(float(text[1:]) * 1000))
+    if text.isdigit():
+        return int(text)
+
+    match = _TIME_OF_DAY.match(text)
+    if match:
+        hours, minutes, seconds = int(match.group(1)), int(match.group(2)), float(match.group(3) or 0)
+        offset_ms = int(round(((hours * 60 + minutes) * 60 + seconds) * 1000))
+        if reference_ms > NTP_EPOCH_THRESHOLD_MS:
+            midnight = datetime.fromtimestamp(reference_ms // 1000, tz=timezone.utc).replace(
+                hour=0, minute=0, second=0)
+            return int(midnight.timestamp()) * 1000 + offset_ms
+        return offset_ms
+
+    if text.endswith(' UTC'):
+        text = text[:-4]
+    if text.endswith('Z'):
+        text = text[:-1]
+    moment = datetime.fromisoformat(text)  # Raises ValueError for anything else
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(milliseconds=1)
+
+
+class TimestampChunk:
+    """Represents a TIMS timestamp chunk from the AVI file"""
+    def __init__(self, unix_epoch_ms: int):
+        self.unix_epoch_ms = unix_epoch_ms
+        self.original_value = unix_epoch_ms
+        self._datetime: Optional[datetime] = None
+
+        # Determine timestamp type based on ESP32 getCurrentTimestampMs() logic
+        if unix_epoch_ms > NTP_EPOCH_THRESHOLD_MS:
+            # This looks like a proper Unix timestamp in milliseconds (NTP was available)
+            self.is_unix_timestamp = True
+            self.timestamp_type = "NTP Unix timestamp"
+        else:
+            # This looks like millis() - milliseconds since ESP32 boot
+            self.is_unix_timestamp = False
+            self.timestamp_type = "millis() since boot"
+
+    @property
+    def datetime(self) -> datetime:
+        # For millis() values this is relative to the epoch, for display purposes only
+        if self._datetime is None:
+            self._datetime = datetime.fromtimestamp(self.unix_epoch_ms / 1000.0, tz=timezone.utc)
+        return self._datetime
+
+    def __str__(self):
+        if self.is_unix_timestamp:
+            return f"TIMS: {self.unix_epoch_ms}ms ({self.datetime.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} UTC) [NTP]"
+        else:
+            # For millis() timestamps, show boot time and duration
+            return f"TIMS: {self.unix_epoch_ms}ms ({format_boot_time(self.unix_epoch_ms)} since boot) [millis()]"
+
+
+class TimestampSeries:
+    """All TIMS values of a clip, backed by a uint64 array"""
+
+    def __init__(self, values=()):
+        self.values = np.ascontiguousarray(values, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TimestampSeries(self.values[index])
+        return TimestampChunk(int(self.values[index]))
+
+    def __iter__(self) -> Iterator[TimestampChunk]:
+        for unix_epoch_ms in self.values.tolist():
+            yield TimestampChunk(unix_epoch_ms)
+
+    @property
+    def is_unix(self) -> np.ndarray:
+        """Boolean mask of the NTP (Unix epoch) values"""
+        return self.values > NTP_EPOCH_THRESHOLD_MS
+
+    def classification_counts(self) -> Dict[str, int]:
+        ntp = int(np.count_nonzero(self.is_unix))
+        return {'ntp': ntp, 'millis': len(self) - ntp}
+
+    def intervals_ms(self) -> np.ndarray:
+        """Signed difference between consecutive values, in milliseconds"""
+        return np.diff(self.values.astype(np.int64))
+
+    def total_time_ms(self) -> int:
+        if len(self) < 2:
+            return 0
+        return int(self.values[-1]) - int(self.values[0])
+
+    def frame_durations(self, min_duration: float = 0.001, default_fps: float = 30.0) -> np.ndarray:
+        """Seconds each frame should be displayed, the last frame getting the average"""
+        if len(self) < 2:
+            return np.array([1.0 / default_fps])
+
+        durations = np.maximum(self.intervals_ms() / 1000.0, min_duration)
+        return np.append(durations, durations.mean())
+
+    def presentation_times_ms(self, count: Optional[int] = None, default_fps: float = 30.0) -> np.ndarray:
+        """Strictly increasing per-frame timestamps in milliseconds, starting at 0
+
+        Values that repeat or run backwards are pushed forward 1 ms past the
+        previous frame, so every frame keeps its own presentation time.
+        With count, frames past the last value continue at the average interval.
+        """
+        relative = self.values.astype(np.int64) - np.int64(self.values[0] if len(self) else 0)
+        if count is not None and count != len(relative):
+            interval_ms = 1000.0 / (self.average_fps() or default_fps)
+            start = relative[-1] if len(relative) else -interval_ms
+            extra = np.round(start + np.arange(1, count - len(relative) + 1) * interval_ms).astype(np.int64)
+            relative = np.concatenate([relative, extra])[:count]
+        steps = np.arange(len(relative), dtype=np.int64)
+        return np.maximum.accumulate(relative - steps) + steps
+
+    def frame_range(self, start_ms: int, end_ms: int) -> Tuple[int, int]:
+        """Rows [first, last) spanning every value within [start_ms, end_ms], (0, 0) if none"""
+        rows = np.flatnonzero((self.values >= np.uint64(max(start_ms, 0)))
+                              & (self.values <= np.uint64(max(end_ms, 0))))
+        if len(rows) == 0:
+            return 0, 0
+        return int(rows[0]), int(rows[-1]) + 1
+
+    def average_fps(self) -> float:
+        total_time = self.total_time_ms()
+        if total_time <= 0:
+            return 0.0
+        return 1000.0 * (len(self) - 1) / total_time
+
+    def jitter_stats(self) -> Dict[str, float]:
+        """Summary statistics of the frame intervals in milliseconds"""
+        intervals = self.intervals_ms()
+        if len(intervals) == 0:
+            return {}
+        median = float(np.median(intervals))
+        return {
+            'mean': float(intervals.mean()),
+            'median': median,
+            'std': float(intervals.std()),
+            'min': float(intervals.min()),
+            'max': float(intervals.max()),
+            'p95': float(np.percentile(intervals, 95)),
+            'mean_abs_deviation': float(np.abs(intervals - median).mean()),
+        }
+
+    def gaps(self, factor: float = 3.0, min_gap_ms: int = 0) -> np.ndarray:
+        """Indices i where the interval from row i to i+1 is a gap
+
+        An interval counts as a gap when it is more than `factor` times the
+        median interval (and at least min_gap_ms), or when time runs backwards.
+        """
+        intervals = self.intervals_ms()
+        if len(intervals) == 0:
+            return np.empty(0, dtype=np.int64)
+        threshold = max(factor * float(np.median(intervals)), min_gap_ms)
+        return np.flatnonzero((intervals > threshold) | (intervals < 0))
+
+    def stitched(self) -> Tuple['TimestampSeries', List['ClockSegment']]:
+        """The values on one monotonic timeline, see stitch_timeline()"""
+        timeline, segments = stitch_timeline(self.values)
+        return TimestampSeries(timeline), segments
+
+
+class ClockSegment:
+    """Rows [start, end) recorded against one continuous clock"""
+
+    def __init__(self, start: int, end: int, is_unix: bool, offset_ms: int, anchored: bool):
+        self.start = start
+        self.end = end
+        self.is_unix = is_unix        # NTP time, otherwise millis() since boot
+        self.offset_ms = offset_ms    # Added to the raw values to place them on the timeline
+        self.anchored = anchored      # On NTP time, either measured or placed next to NTP samples
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        clock = "NTP" if self.is_unix else "millis()"
+        return (f"ClockSegment(rows {self.start}-{self.end - 1}, {clock}, offset {self.offset_ms}ms"
+                f"{', anchored' if self.anchored else ''})")
+
+
+def stitch_timeline(values, min_step_ms: int = 1) -> Tuple[np.ndarray, List[ClockSegment]]:
+    """Monotonic timeline (int64 ms) of values that jump between clocks
+
+    A new segment starts wherever the clock changes between millis() and
+    NTP time, or time runs backwards (a reboot restarts millis(), NTP
+    corrects the clock). Forward gaps on the same clock are real pauses in
+    the recording and are kept.
+
+    millis() segments are anchored to NTP time by assuming they end one
+    typical frame interval before the next anchored segment starts, which is
+    what happens when NTP syncs mid-recording. Segments with nothing anchored
+    after them follow the previous segment instead. Values may be the
+    concatenated TIMS values of many clips in recording order, so a clip
+    recorded before NTP sync is anchored by the clips after it.
+    """
+    raw = np.asarray(values).astype(np.int64)
+    if len(raw) == 0:
+        return raw, []
+
+    unix = raw > NTP_EPOCH_THRESHOLD_MS
+    steps = np.diff(raw)
+    boundary = (unix[1:] != unix[:-1]) | (steps < 0)
+    starts = np.concatenate([[0], np.flatnonzero(boundary) + 1])
+    ends = np.concatenate([starts[1:], [len(raw)]])
+
+    regular = steps[~boundary & (steps > 0)]
+    interval = max(int(np.median(regular)) if len(regular) else 0, min_step_ms)
+
+    segments = [ClockSegment(int(start), int(end), bool(unix[start]), 0, bool(unix[start]))
+                for start, end in zip(starts, ends)]
+    # Backwards from the last NTP segment: each millis() segment ends just before the next
+    for k in range(len(segments) - 2, -1, -1):
+        segment, following = segments[k], segments[k + 1]
+        if not segment.is_unix and following.anchored:
+            next_start = raw[following.start] + following.offset_ms
+            segment.offset_ms = int(next_start - interval - raw[segment.end - 1])
+            segment.anchored = True
+    # Forwards: anything still running backwards continues after the previous segment
+    for k in range(1, len(segments)):
+        segment, previous = segments[k], segments[k - 1]
+        previous_end = raw[previous.end - 1] + previous.offset_ms
+        if raw[segment.start] + segment.offset_ms <= previous_end:
+            segment.offset_ms = int(previous_end + interval - raw[segment.start])
+            segment.anchored = segment.anchored or previous.anchored
+
+    offsets = np.repeat(np.array([s.offset_ms for s in segments], dtype=np.int64), ends - starts)
+    return raw + offsets, segments
+
+
+def stitch_timelines(series: List[TimestampSeries]) -> Tuple[List[TimestampSeries], List[ClockSegment]]:
+    """stitch_timeline() over the clips of a recording session, in recording order
+
+    The clips are stitched as one array, so millis() clips recorded before
+    NTP sync are anchored by later clips. Segment rows index the concatenation.
+    """
+    lengths = [len(s) for s in series]
+    values = np.concatenate([s.values for s in series]) if series else np.empty(0, dtype=np.uint64)
+    timeline, segments = stitch_timeline(values)
+    parts = np.split(timeline, np.cumsum(lengths)[:-1]) if series else []
+    return [TimestampSeries(part) for part in parts], segments
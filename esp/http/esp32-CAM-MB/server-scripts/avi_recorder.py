@@ -0,0 +1,68 @@
+"""
+Recording of stream JPEGs in the AVI layout of the SD card firmware
+
+TimsAVIWriter copies JPEG bytes into '00dc' chunks, each followed by a TIMS
+chunk with the frame's arrival time in epoch milliseconds, exactly like
+esp-32-sd-card.ino does on the SD card. It also writes an idx1 index and
+correct header sizes, frame count and frame rate, so the recordings play
+anywhere and convert-avi-custom-normal.py can process them like SD card
+clips (overlay, --vfr, --remux, --activity...).
+
+The header and patching code is the SD card tools' avi_layout.py, the one
+description of the firmware's layout, imported from
+esp/basic-cam-save-to-sd/arduino/esp-32-sd-card in this repository.
+"""
+
+import os
+import struct
+import sys
+
+SD_CARD_TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..',
+                                 'basic-cam-save-to-sd', 'arduino', 'esp-32-sd-card')
+sys.path.append(SD_CARD_TOOLS_DIR)
+try:
+    from avi_layout import AVIIF_KEYFRAME, HEADER_SIZE, MOVI_START, avi_headers, median_fps, patch_header
+except ImportError as e:
+    raise ImportError(f"avi_layout.py not found in {os.path.normpath(SD_CARD_TOOLS_DIR)}, "
+                      f"run the server scripts from a full checkout of the repository") from e
+
+
+class TimsAVIWriter:
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.header = bytearray(avi_headers(width, height, max(1, int(round(fps)))))
+        self.file.write(self.header)
+        self.position = MOVI_START
+        self.index_entries = []
+        self.timestamps_ms = []
+
+    def __len__(self):
+        return len(self.index_entries)
+
+    def write(self, jpeg, timestamp_ms):
+        """Append one JPEG frame and its TIMS chunk"""
+        # idx1 offsets are relative to the 'movi' FOURCC
+        self.index_entries.append(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME,
+                                              self.position - (HEADER_SIZE + 8), len(jpeg)))
+        padding = b'\x00' if len(jpeg) & 1 else b''
+        self.file.write(struct.pack('<4sI', b'00dc', len(jpeg)))
+        self.file.write(jpeg)
+        self.file.write(padding)
+        self.file.write(struct.pack('<4sIQ', b'TIMS', 8, int(timestamp_ms)))
+        self.position += 8 + len(jpeg) + len(padding) + 16
+        self.timestamps_ms.append(int(timestamp_ms))
+
+    def close(self):
+        """Write the index and patch the header with the final sizes and the typical frame rate"""
+        if self.file is None:
+            return
+        movi_end = self.position
+        self.file.write(struct.pack('<4sI', b'idx1', 16 * len(self.index_entries)))
+        self.file.write(b''.join(self.index_entries))
+        file_size = self.file.tell()
+        patch_header(self.header, len(self.index_entries), file_size, movi_end, median_fps(self.timestamps_ms))
+        self.file.seek(0)
+        self.file.write(self.header)
+        self.file.close()
+        self.file = None
@@ -4,14 +4,27 @@ This script help sets up a machine to run inference on multiple IP cameras.
 The camera's should be defined following the txt file from :
 - https://docs.ultralytics.com/modes/predict/#inference-sources
 
+Cameras are found through mDNS. A single service browser keeps the camera
+registry up to date, and streams are added to and removed from the running
+inference as cameras appear, move or disappear.
+
+Every camera stream is read on its own thread, keeping only its latest
+frame (see iphandler.py). The latest frame of every camera is run through
+the model in batches of up to batch_size frames, every inference_interval
+seconds (see inference_engine.py). Frames of static scenes are left out,
+only those with motion are inferred, with a minimum and maximum rate per
+camera (see motion_scheduler.py). The boxes of every camera are tracked
+across inferences (see tracker.py), so a person triggers one event rather
+than one per frame. Every box found is appended to the
+detection log in ./detections (see detection_log.py to search it).
+
 Steps :
 pip install ultralytics zeroconf
 python3 camera-stream.py
 """
 
-from ultralytics import YOLO
 from zeroconf import ServiceBrowser, Zeroconf, ServiceStateChange
-from threading import Thread
+from threading import Lock, Thread
 import time
 
 import cv2
@@ -19,135 +32,162 @@ from ultralytics import YOLO
 import torch
 
 from save_stream import StreamSaver
-from iphandler import IPStreamHandler
+from iphandler import StreamPool
+from inference_engine import InferenceEngine, draw_detections
+from detection_log import DetectionLog
+from motion_scheduler import MotionScheduler
+from tracker import CameraTrackers, draw_tracks
+
+PERSON_CLASS = 0
 
 class CameraDiscovery:
-    def __init__(self, output_file, service_names, interval=60):
+    def __init__(self, output_file, service_names, batch_size=8, inference_interval=0.5,
+                 show=False, pre_roll=10.0, cooldown=15.0, detection_log="detections",
+                 min_inference_rate=0.2, max_inference_rate=2.0):
         self.output_file = output_file
         self.service_names = service_names
-        self.interval = interval
-        self.discovered_ips = []
+        self.cameras = {}  # Camera name (entry of service_names) -> stream URL, kept up to date by the browser
+        self.camera_names = {}  # Stream URL -> camera name
+        self.cameras_lock = Lock()
         self.zeroconf = Zeroconf()
-        # Load a pretrained YOLOv8n model
+        self.browser = None
         self.inference_loop_thread = Thread(target=self.inference_loop)
-        self.model = YOLO("yolov8n.pt")
         self.inference_loop_thread.daemon = True
         self.running = False  # Stop the thread
+        self.show = show  # Display every frame with its boxes drawn, interpolated between inferences
+        self.pre_roll = pre_roll  # Seconds recorded from before a detection
+        self.cooldown = cooldown  # Seconds recorded after the last detection of a camera
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"Inference device is {device}")
+        # Load a pretrained YOLOv8n model
         self.model = YOLO("yolov8n.pt").to(device)
+        self.engine = InferenceEngine(self.model, batch_size=batch_size, interval=inference_interval)
+        # Only frames with motion are inferred, every camera within min and max inferences per second
+        self.scheduler = MotionScheduler(min_rate=min_inference_rate, max_rate=max_inference_rate)
+        # Stable ids for the boxes of every camera, a track outlives a few missed detections
+        # Boxes move between inferences for at most one inference interval of a camera with motion
+        self.trackers = CameraTrackers(max_age=max(3.0, 2.0 / max(min_inference_rate, 1e-3)),
+                                       max_extrapolation=1.0 / max_inference_rate if max_inference_rate > 0 else 1.0)
         self.stream_saver_dict = {}
+        # Every box found, searchable with detection_log.py
+        self.detection_log = DetectionLog(detection_log)
+        # Streams are added and removed while inference keeps running
+        self.stream_pool = StreamPool()
+
+    @property
+    def discovered_ips(self):
+        with self.cameras_lock:
+            return sorted(self.cameras.values())
 
     def on_service_state_change(self, zeroconf, service_type, name, state_change):
-        if state_change is ServiceStateChange.Added:
-            info = zeroconf.get_service_info(service_type, name)
-            if info:
-                # Check if the service name contains any of the specified camera names
-                for camera in self.service_names:
-                  ip_address = ".".join(map(str, info.addresses[0]))
-                  if (camera in name) and not (ip_address in self.discovered_ips):
-                      print(f"Discovered {name} at IP: {ip_address}")
-                      self.discovered_ips.append(f"http://{ip_address}/stream")
-
-    def discover_services(self):
-        # Start the service browser for mDNS
-        ServiceBrowser(self.zeroconf, "_http._tcp.local.", handlers=[self.on_service_state_change])
-        time.sleep(10)  # Allow time for discovery to complete
-        print("discovery completed")
+        # Check if the service name contains any of the specified camera names,
+        # the camera is known by that short name (e.g. Camera2, not Camera2._http._tcp.local.)
+        camera = next((camera for camera in self.service_names if camera in name), None)
+        if camera is None:
+            return
+        if state_change is ServiceStateChange.Removed:
+            self.remove_camera(camera)
+            return
+        # Added, or Updated (e.g. a new IP address after a DHCP renewal)
+        info = zeroconf.get_service_info(service_type, name)
+        if info and info.addresses:
+            ip_address = ".".join(map(str, info.addresses[0]))
+            self.add_camera(camera, f"http://{ip_address}/stream")
+
+    def add_camera(self, name, url):
+        with self.cameras_lock:
+            previous = self.cameras.get(name)
+            if previous == url:
+                return
+            self.cameras[name] = url
+            self.camera_names.pop(previous, None)
+            self.camera_names[url] = name
+        if previous is not None:
+            print(f"{name} moved from {previous} to {url}")
+            self.drop_stream(previous)
+        else:
+            print(f"Discovered {name} at {url}")
+        # Fed by the stream inference reads, keeping the last pre_roll seconds
+        self.stream_saver_dict[url] = StreamSaver(name, pre_roll=self.pre_roll, cooldown=self.cooldown)
+        self.stream_pool.add(url).add_listener(self.stream_saver_dict[url].add_frame)
+        self.write_to_file()
+
+    def remove_camera(self, name):
+        with self.cameras_lock:
+            url = self.cameras.pop(name, None)
+            self.camera_names.pop(url, None)
+        if url is not None:
+            print(f"Lost {name} at {url}")
+            self.drop_stream(url)
+            self.write_to_file()
+
+    def drop_stream(self, url):
+        self.stream_pool.remove(url)
+        self.scheduler.forget(url)
+        self.trackers.forget(url)
+        # A recording in progress finishes with the frames it already has
+        self.stream_saver_dict.pop(url, None)
 
     def write_to_file(self):
-        # Write discovered IP addresses to the output file
+        # Write discovered IP addresses to the output file, for reference
         with open(self.output_file, "w") as file:
             for ip in self.discovered_ips:
                 file.write(f"{ip}\n")
-                self.stream_saver_dict[ip] = StreamSaver(ip)
-
-    def discovery_loop(self):
-        while True:
-            prev_ips = self.discovered_ips
-            self.discovered_ips = [] # reset ips in case of restart
-            self.discover_services()
-            if prev_ips != self.discovered_ips:
-              print("Ip's discovered has changed")
-              self.write_to_file()
-              if self.inference_loop_thread.is_alive():
-                  self.running = False  # Stop the thread
-                  self.inference_loop_thread.join()  # Wait for the thread to finish
-              self.inference_loop_thread.start()
-            time.sleep(self.interval)  # Wait for the next interval
 
     def inference_loop(self):
         self.running = True
-        # Initialize a list of IPStreamHandler objects
-        #streams = [IPStreamHandler(url).start() for url in self.discovered_ips]
-        #print(f"Starting inference on {streams}")
-
-        while self.running:
-            print(f"About to run")
-            results = self.model(self.output_file, stream=True)  # generator of Results objects
-            person_found = True
-            for res in results:
-              #print(res)
-              for box in res.boxes:
-                  # Draw bounding boxes on the image
-                  cls = box.cls.cpu()[0]   #: tensor([0.], device='cuda:0')
-                  conf = box.conf.cpu()[0]   #: tensor([0.8933], device='cuda:0')
-                  data = box.data.cpu()   #: tensor([[  0.0000,   2.1979, 637.8018, 479.2267,   0.8933,   0.0000]], device='cuda:0')
-                  id = box.id   #: None
-                  is_track = box.is_track   #: False
-                  orig_shape = box.orig_shape   #: (480, 640)
-                  shape = box.shape   #: torch.Size([1, 6])
-                  xywh = box.xywh.cpu()   #: tensor([[318.9009, 240.7123, 637.8018, 477.0287]], device='cuda:0')
-                  xywhn = box.xywhn.cpu()   #: tensor([[0.4983, 0.5015, 0.9966, 0.9938]], device='cuda:0')
-                  xyxy = box.xyxy.cpu()   #: tensor([[  0.0000,   2.1979, 637.8018, 479.2267]], device='cuda:0')
-                  xyxyn = box.xyxyn.cpu()   #: tensor([[0.0000, 0.0046, 0.9966, 0.9984]], device='cuda:0')
-
-                  # Unpack the coordinates and convert them to integers
-                  x_min, y_min, x_max, y_max = map(int, xyxy.squeeze().tolist())
-
-                  # Draw the bounding box
-                  cv2.rectangle(res.orig_img, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
-
-                  # Prepare label with class and confidence
-                  label = f"{cls} {id}: {conf:.2f}"
-                  if cls == 0:
-                    person_found = True
-
-                  # Draw the label
-                  (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                  cv2.rectangle(res.orig_img, (x_min, y_min - 20), (x_min + w, y_min), (0, 255, 0), -1)
-                  cv2.putText(res.orig_img, label, (x_min, y_min - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-              if person_found:
-                  print("Person Found")
-                  for ip, stream_saver in self.stream_saver_dict.items() :
-                      stream_saver.save_stream_to_video(stream_url=ip, output_dir="video-streams", duration=60)
-                  person_found = False
-              # Display the image
-              # TODO mutex / thread safe way to do save_stream_to_video(ip, file save path)
-              #cv2.imshow(f"Detected Objects {res.path}", res.orig_img)
-              if cv2.waitKey(1) == ord('q') or not self.running:
-                  self.running = False
-                  break
-            print(results)
-            print(f"looping")
-        print(f"Stopping inference")
-
-
-        # Close the window
-        cv2.destroyAllWindows()
-        """
-        # Clean up
-        for stream in streams:
-            stream.stop()
-        """
-        print(f"Stopped")
+        print("Starting inference")
+
+        # Runs once for the lifetime of the process, cameras come and go in the pool
+        self.engine.run(self.next_frames, self.handle_detections,
+                        should_stop=lambda: not self.running, on_report=self.print_stream_stats,
+                        on_tick=self.detection_log.flush_if_due)
+        print(f"Stopping inference: {self.engine.stats.summary()}")
+        self.detection_log.close()
         cv2.destroyAllWindows()
+        print("Stopped")
+
+    def next_frames(self):
+        return self.scheduler.select(self.stream_pool.latest_stream_frames(),
+                                     on_skipped=self.show_tracks if self.show else None)
+
+    def show_tracks(self, camera, frame):
+        # A frame left out of inference, with the boxes of the camera's tracks moved to its capture time
+        image = frame.image
+        if image is None:
+            return
+        boxes = self.trackers[camera].boxes_at(frame.captured_at)
+        cv2.imshow(f"Detected Objects {camera}", draw_tracks(image, boxes, self.model.names))
+        if cv2.waitKey(1) == ord('q'):
+            self.running = False
+
+    def print_stream_stats(self):
+        for line in self.stream_pool.summary() + self.scheduler.summary():
+            print(f"  {line}")
+
+    def handle_detections(self, detections):
+        for result in detections:
+            # Logged under the camera's name (e.g. Camera2), which stays the same when its IP changes
+            self.detection_log.append(result, camera=self.camera_names.get(result.camera))
+            name = self.camera_names.get(result.camera, result.camera)
+            for track in self.trackers.update(result):
+                if track.cls == PERSON_CLASS:
+                    print(f"Person #{track.track_id} found on {name}")
+            # Only the camera that sees a person records, extending its recording while the track lives
+            if self.trackers[result.camera].live_tracks(result.captured_at, PERSON_CLASS):
+                stream_saver = self.stream_saver_dict.get(result.camera)
+                if stream_saver is not None and stream_saver.trigger(output_dir="video-streams"):
+                    print(f"Recording {name}")
+            if self.show:
+                # Only now are the boxes copied off the inference device
+                cv2.imshow(f"Detected Objects {result.camera}", draw_detections(result.frame, result))
+        if self.show and cv2.waitKey(1) == ord('q'):
+            self.running = False
 
     def start(self):
-        # Create and start the discovery thread
-        thread = Thread(target=self.discovery_loop)
-        thread.daemon = True
-        thread.start()
+        # One browser for the lifetime of the process, reporting cameras as they come and go
+        self.browser = ServiceBrowser(self.zeroconf, "_http._tcp.local.", handlers=[self.on_service_state_change])
+        self.inference_loop_thread.start()
 
         # Keep the main thread alive
         try:
@@ -155,6 +195,13 @@ class CameraDiscovery:
                 time.sleep(1)
         except KeyboardInterrupt:
             print("Stopping discovery.")
+            self.running = False
+            # Let the inference round in progress finish and the detection log be closed
+            self.inference_loop_thread.join(timeout=10)
+            self.stream_pool.stop()
+            # Finish the recordings in progress, so their files get an index and final header
+            for stream_saver in list(self.stream_saver_dict.values()):
+                stream_saver.stop()
             self.zeroconf.close()
 
 if __name__ == "__main__":
@@ -164,8 +211,13 @@ if __name__ == "__main__":
     # Define the service names to look for
     service_names = ["Camera1", "Camera2", "Camera3"]
 
+    # Frames per forward pass, and seconds between inference rounds
+    batch_size = 8
+    inference_interval = 0.5
+
     # Create an instance of the CameraDiscovery class
-    camera_discovery = CameraDiscovery(output_file, service_names)
+    camera_discovery = CameraDiscovery(output_file, service_names, batch_size=batch_size,
+                                       inference_interval=inference_interval)
 
     # Start the discovery process
     camera_discovery.start()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Append-only columnar log of the detections
+
+DetectionLog keeps one record per box (camera, capture time, class,
+confidence, x1 y1 x2 y2) and appends them to the current log file in blocks,
+every flush_interval seconds or flush_rows records. A block stores each
+field as one contiguous column:
+
+    'DLOG' rows:u32 first_ms:i64 last_ms:i64 meta_len:u32 meta (JSON)
+    timestamp_ms:i64[rows] camera:u16[rows] class:u16[rows]
+    confidence:f16[rows] xyxy:f16[rows, 4]
+
+meta holds the camera and class names the u16 columns index into, so every
+block reads on its own. A box costs 22 bytes. A new file is started when the
+current one reaches max_bytes or is max_age seconds old; the files are named
+after the time they were started, and a block cut short by a crash is
+skipped when reading.
+
+query_detections() reads the blocks overlapping a time range, seeking past
+the others, and returns the matching records, e.g. every person on Camera2 in an hour:
+
+    python3 detection_log.py detections --camera Camera2 --class person \\
+        --from 2024-05-01T14:00 --to 2024-05-01T15:00
+"""
+
+import argparse
+import glob
+import json
+import os
+import struct
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MAGIC = b'DLOG'
+BLOCK_HEADER = struct.Struct('<4sIqqI')
+FILE_PREFIX = 'detections_'
+FILE_SUFFIX = '.dlog'
+FILE_TIME_FORMAT = '%Y-%m-%d_%H-%M-%S.%f'
+
+RECORD_DTYPE = np.dtype([('camera', 'U64'), ('timestamp_ms', 'i8'), ('cls', 'i4'), ('name', 'U32'),
+                         ('confidence', 'f4'), ('xyxy', 'f4', (4,))])
+
+
+class DetectionLog:
+    """Appends detection records to rotating columnar log files in a directory"""
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_age=3600.0,
+                 flush_interval=5.0, flush_rows=4096):
+        self.directory = directory
+        self.max_bytes = max_bytes            # Size at which a new file is started
+        self.max_age = max_age                # Seconds after which a new file is started
+        self.flush_interval = flush_interval  # Longest time records wait in memory
+        self.flush_rows = flush_rows
+        self.file = None
+        self.path = None
+        self._file_started = 0.0
+        self._lock = Lock()
+        self._pending: List[tuple] = []  # (camera, timestamps, classes, confidences, xyxy, names)
+        self._pending_rows = 0
+        self._last_flush = time.time()
+        self.records = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, detections, camera: Optional[str] = None):
+        """Log every box of a Detections, under camera if given instead of detections.camera"""
+        if len(detections) == 0:
+            return
+        data = detections.data
+        self.add(camera or detections.camera, detections.captured_at, data[:, -1], data[:, -2],
+                 data[:, :4], detections.names)
+
+    def add(self, camera: str, captured_at: float, classes, confidences, xyxy, names: Optional[Dict] = None):
+        """Log the boxes of one frame captured at captured_at (seconds since the epoch)"""
+        rows = len(classes)
+        if rows == 0:
+            return
+        with self._lock:
+            self._pending.append((camera, np.full(rows, int(captured_at * 1000), dtype=np.int64),
+                                  np.asarray(classes).astype(np.uint16),
+                                  np.asarray(confidences, dtype=np.float16),
+                                  np.asarray(xyxy, dtype=np.float16).reshape(rows, 4), names or {}))
+            self._pending_rows += rows
+            due = self._pending_rows >= self.flush_rows
+        if due:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Write the records in memory if the oldest has waited flush_interval seconds
+
+        Called for every box added and periodically by the owner, so records
+        are not held back until the next detection.
+        """
+        with self._lock:
+            due = self._pending and time.time() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the records in memory as one block"""
+        with self._lock:
+            pending, self._pending, self._pending_rows = self._pending, [], 0
+            self._last_flush = time.time()
+            if not pending:
+                return
+            cameras = sorted({camera for camera, *_ in pending})
+            camera_ids = {camera: i for i, camera in enumerate(cameras)}
+            names = {}
+            for camera, _, classes, _, _, frame_names in pending:
+                for cls in np.unique(classes).tolist():
+                    names[str(cls)] = frame_names.get(cls, str(cls))
+            timestamps = np.concatenate([p[1] for p in pending])
+            camera_column = np.concatenate([np.full(len(p[1]), camera_ids[p[0]], dtype=np.uint16)
+                                            for p in pending])
+            meta = json.dumps({'cameras': cameras, 'names': names}).encode()
+            block = b''.join([
+                BLOCK_HEADER.pack(MAGIC, len(timestamps), int(timestamps.min()), int(timestamps.max()), len(meta)),
+                meta,
+                timestamps.tobytes(),
+                camera_column.tobytes(),
+                np.concatenate([p[2] for p in pending]).tobytes(),
+                np.concatenate([p[3] for p in pending]).tobytes(),
+                np.concatenate([p[4] for p in pending]).tobytes(),
+            ])
+            self._rotate()
+            self.file.write(block)
+            self.file.flush()
+            self.records += len(timestamps)
+
+    def _rotate(self):
+        now = time.time()
+        if self.file is not None and (self.file.tell() < self.max_bytes and now - self._file_started < self.max_age):
+            return
+        if self.file is not None:
+            self.file.close()
+        name = f"{FILE_PREFIX}{datetime.fromtimestamp(now).strftime(FILE_TIME_FORMAT)}{FILE_SUFFIX}"
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, 'ab')
+        self._file_started = now
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_blocks(path, start_ms=None, end_ms=None):
+    """The blocks of a log file as (meta, columns dict), skipping those outside [start_ms, end_ms]"""
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return
+            magic, rows, first_ms, last_ms, meta_len = BLOCK_HEADER.unpack(header)
+            if magic != MAGIC:
+                print(f"{path}: unreadable block, stopping")
+                return
+            body_size = meta_len + rows * (8 + 2 + 2 + 2 + 8)
+            if (start_ms is not None and last_ms < start_ms) or (end_ms is not None and first_ms > end_ms):
+                file.seek(body_size, os.SEEK_CUR)
+                continue
+            body = file.read(body_size)
+            if len(body) < body_size:
+                # Cut short by a crash while writing
+                return
+            meta = json.loads(body[:meta_len])
+            columns = {}
+            offset = meta_len
+            for column, dtype, width in (('timestamp_ms', np.int64, 1), ('camera', np.uint16, 1),
+                                         ('cls', np.uint16, 1), ('confidence', np.float16, 1),
+                                         ('xyxy', np.float16, 4)):
+                size = rows * width * np.dtype(dtype).itemsize
+                columns[column] = np.frombuffer(body, dtype=dtype, count=rows * width, offset=offset)
+                offset += size
+            columns['xyxy'] = columns['xyxy'].reshape(rows, 4)
+            yield meta, columns
+
+
+def query_detections(directory, camera: Optional[str] = None, cls=None, start: Optional[float] = None,
+                     end: Optional[float] = None, min_confidence: float = 0.0) -> np.ndarray:
+    """Records of the log in directory matching every given filter, as a RECORD_DTYPE array in time order
+
+    cls is a class id or name, start and end are seconds since the epoch.
+    """
+    start_ms = int(start * 1000) if start is not None else None
+    end_ms = int(end * 1000) if end is not None else None
+    parts = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{FILE_PREFIX}*{FILE_SUFFIX}"))):
+        # Blocks outside the range are skipped on their header, without reading them
+        for meta, columns in read_blocks(path, start_ms, end_ms):
+            cameras, names = meta['cameras'], meta['names']
+            keep = columns['confidence'] >= min_confidence
+            if start_ms is not None:
+                keep &= columns['timestamp_ms'] >= start_ms
+            if end_ms is not None:
+                keep &= columns['timestamp_ms'] <= end_ms
+            if camera is not None:
+                if camera not in cameras:
+                    continue
+                keep &= columns['camera'] == cameras.index(camera)
+            if cls is not None:
+                ids = [int(i) for i, name in names.items() if str(cls) in (i, name)]
+                keep &= np.isin(columns['cls'], ids)
+            if not keep.any():
+                continue
+            records = np.zeros(int(keep.sum()), dtype=RECORD_DTYPE)
+            records['camera'] = np.array(cameras)[columns['camera'][keep]]
+            records['timestamp_ms'] = columns['timestamp_ms'][keep]
+            records['cls'] = columns['cls'][keep]
+            records['name'] = [names.get(str(c), str(c)) for c in columns['cls'][keep].tolist()]
+            records['confidence'] = columns['confidence'][keep]
+            records['xyxy'] = columns['xyxy'][keep]
+            parts.append(records)
+    if not parts:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    records = np.concatenate(parts)
+    return records[np.argsort(records['timestamp_ms'], kind='stable')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the detection log")
+    parser.add_argument('directory', help="Directory of the detection log")
+    parser.add_argument('--camera', help="Camera name")
+    parser.add_argument('--class', dest='cls', help="Class name or id, e.g. person")
+    parser.add_argument('--from', dest='start', help="Start time, ISO format (e.g. 2024-05-01T14:00)")
+    parser.add_argument('--to', dest='end', help="End time, ISO format")
+    parser.add_argument('--min-confidence', type=float, default=0.0)
+    args = parser.parse_args()
+
+    records = query_detections(args.directory, camera=args.camera, cls=args.cls,
+                               start=datetime.fromisoformat(args.start).timestamp() if args.start else None,
+                               end=datetime.fromisoformat(args.end).timestamp() if args.end else None,
+                               min_confidence=args.min_confidence)
+    for record in records:
+        when = datetime.fromtimestamp(record['timestamp_ms'] / 1000).isoformat(timespec='milliseconds')
+        x1, y1, x2, y2 = record['xyxy'].tolist()
+        print(f"{when} {record['camera']} {record['name']} {record['confidence']:.2f} "
+              f"[{x1:.0f} {y1:.0f} {x2:.0f} {y2:.0f}]")
+    print(f"{len(records)} detections")
@@ -0,0 +1,152 @@
+"""
+Batched YOLO inference over the latest frame of every camera
+
+InferenceEngine takes the newest frame of each camera every `interval`
+seconds, stacks up to `batch_size` of them into a single forward pass and
+hands back one Detections per frame. The boxes stay on the inference device
+until something reads them: checking for a class is done on the device, and
+the box coordinates are copied to the CPU once per frame, only when they are
+drawn or logged.
+
+The latency of every forward pass is recorded, and summarized periodically
+so the batch size and cadence can be tuned to the number of cameras.
+"""
+
+import time
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# (camera, frame, capture time in seconds since the epoch)
+CameraFrame = Tuple[str, np.ndarray, float]
+
+
+class Detections:
+    """Boxes found in one camera frame, left on the inference device until read"""
+
+    def __init__(self, camera: str, frame: np.ndarray, captured_at: float, boxes, names: dict):
+        self.camera = camera
+        self.frame = frame
+        self.captured_at = captured_at
+        self.boxes = boxes  # ultralytics Boxes, data is x1 y1 x2 y2 [id] conf cls
+        self.names = names
+        self.track_ids: Optional[np.ndarray] = None  # Set by CameraTrackers.update (tracker.py)
+        self._data: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def has_class(self, cls: int) -> bool:
+        """Whether any box is of class cls, without copying the boxes off the device"""
+        return len(self.boxes) > 0 and bool((self.boxes.cls == cls).any())
+
+    @property
+    def data(self) -> np.ndarray:
+        """All boxes as an N x 6 (or 7 with track ids) array, copied to the CPU on first use"""
+        if self._data is None:
+            self._data = self.boxes.data.cpu().numpy()
+        return self._data
+
+    @property
+    def xyxy(self) -> np.ndarray:
+        return self.data[:, :4]
+
+    @property
+    def confidences(self) -> np.ndarray:
+        return self.data[:, -2]
+
+    @property
+    def classes(self) -> np.ndarray:
+        return self.data[:, -1].astype(np.int64)
+
+
+def draw_detections(frame: np.ndarray, detections: Detections) -> np.ndarray:
+    """Draw the boxes and class/confidence labels (and track ids if tracked) of detections onto frame, in place"""
+    track_ids = detections.track_ids.tolist() if detections.track_ids is not None else [0] * len(detections)
+    for (x_min, y_min, x_max, y_max), conf, cls, track_id in zip(detections.xyxy.astype(int).tolist(),
+                                                                 detections.confidences.tolist(),
+                                                                 detections.classes.tolist(), track_ids):
+        cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
+        label = f"{detections.names.get(cls, cls)}: {conf:.2f}"
+        if track_id:
+            label = f"#{track_id} {label}"
+        (w, h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+        cv2.rectangle(frame, (x_min, y_min - 20), (x_min + w, y_min), (0, 255, 0), -1)
+        cv2.putText(frame, label, (x_min, y_min - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+    return frame
+
+
+class BatchStats:
+    """Latency of the most recent forward passes"""
+
+    def __init__(self, history: int = 100):
+        self.batches = 0
+        self.frames = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=history)
+        self.sizes = deque(maxlen=history)
+
+    def add(self, size: int, seconds: float):
+        self.batches += 1
+        self.frames += size
+        self.busy_seconds += seconds
+        self.latencies.append(seconds)
+        self.sizes.append(size)
+
+    def summary(self) -> str:
+        if not self.latencies:
+            return "no batches yet"
+        latencies = np.array(self.latencies) * 1000.0
+        return (f"{self.batches} batches, {self.frames} frames, average batch {np.mean(self.sizes):.1f}, "
+                f"latency mean {latencies.mean():.0f}ms p95 {np.percentile(latencies, 95):.0f}ms "
+                f"max {latencies.max():.0f}ms, {self.frames / self.busy_seconds if self.busy_seconds else 0.0:.1f} "
+                f"frames/s while busy")
+
+
+class InferenceEngine:
+    """Runs a YOLO model on batches of the latest camera frames at a fixed cadence"""
+
+    def __init__(self, model, batch_size: int = 8, interval: float = 0.5, report_interval: float = 60.0):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.interval = interval                # Seconds between the starts of two inference rounds
+        self.report_interval = report_interval  # Seconds between printed latency summaries
+        self.stats = BatchStats()
+
+    def infer(self, frames: Sequence[CameraFrame]) -> List[Detections]:
+        """Detections for every frame, in batches of at most batch_size frames"""
+        detections = []
+        for start in range(0, len(frames), self.batch_size):
+            batch = frames[start:start + self.batch_size]
+            began = time.perf_counter()
+            results = self.model([frame for _, frame, _ in batch], verbose=False)
+            self.stats.add(len(batch), time.perf_counter() - began)
+            for (camera, frame, captured_at), result in zip(batch, results):
+                detections.append(Detections(camera, frame, captured_at, result.boxes, result.names))
+        return detections
+
+    def run(self, get_frames: Callable[[], Sequence[CameraFrame]],
+            on_detections: Callable[[List[Detections]], None],
+            should_stop: Callable[[], bool], on_report: Optional[Callable[[], None]] = None,
+            on_tick: Optional[Callable[[], None]] = None):
+        """Every interval, infer on get_frames() and pass the detections to on_detections, until should_stop()
+
+        on_report() is called after every printed latency summary, on_tick()
+        once per round, with or without frames.
+        """
+        last_report = time.monotonic()
+        while not should_stop():
+            began = time.monotonic()
+            frames = get_frames()
+            if frames:
+                on_detections(self.infer(frames))
+            if on_tick:
+                on_tick()
+            if began - last_report >= self.report_interval:
+                print(f"Inference: {self.stats.summary()}")
+                if on_report:
+                    on_report()
+                last_report = began
+            time.sleep(max(0.0, self.interval - (time.monotonic() - began)))
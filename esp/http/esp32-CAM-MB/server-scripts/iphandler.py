@@ -1,31 +1,200 @@
-import cv2
+"""
+Latest-frame readers for the camera streams
+
+IPStreamHandler reads one stream on its own thread. Every frame overwrites a
+single slot, so a slow consumer always gets the newest frame and never a
+backlog. The thread blocks on the socket between frames instead of
+spinning, and reconnects when the camera drops the connection.
+
+HTTP streams are read with MJPEGStream, which yields the JPEG bytes of each
+frame undecoded; they are only decoded for the frames handed to inference.
+Other sources (files, RTSP) go through cv2.VideoCapture.
+
+Listeners (e.g. StreamSaver.add_frame) are called with every StreamFrame
+from the reader thread, so recording shares the connection used for
+inference and copies the JPEG bytes as they arrived.
+
+StreamPool owns one IPStreamHandler per stream URL and hands out the frames
+that arrived since the consumer last asked, with per-stream fps and
+staleness for monitoring.
+"""
+
+import http.client
 import threading
-from queue import Queue
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from mjpeg_stream import MJPEGStream, StreamFrame
+
 
-# Check for CUDA device and set it
 class IPStreamHandler:
-    def __init__(self, ip_url):
+    def __init__(self, ip_url, reconnect_delay=2.0):
         self.ip_url = ip_url
-        self.frame_queue = Queue(maxsize=1)
-        self.cap = cv2.VideoCapture(self.ip_url)
+        self.reconnect_delay = reconnect_delay
         self.stopped = False
+        self.thread = None
+        self._lock = threading.Lock()
+        self._frame: Optional[StreamFrame] = None
+        self.sequence = 0  # Frames received so far, identifies the latest one
+        self.reconnects = 0
+        self._arrivals = deque(maxlen=30)
+        self.listeners = []  # Called with every StreamFrame
 
     def start(self):
-        threading.Thread(target=self.update, args=(), daemon=True).start()
+        self.thread = threading.Thread(target=self.update, args=(), daemon=True,
+                                       name=f"stream {self.ip_url}")
+        self.thread.start()
         return self
 
+    def frames(self):
+        """StreamFrames from one connection to the stream, until it closes"""
+        if self.ip_url.startswith(('http://', 'https://')):
+            with MJPEGStream(self.ip_url) as stream:
+                # Blocks on the socket until the camera sends the next frame
+                for frame in stream:
+                    yield frame
+                    if self.stopped:
+                        break
+        else:
+            cap = cv2.VideoCapture(self.ip_url)
+            # Keep OpenCV from queueing frames of its own
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            try:
+                while not self.stopped:
+                    ret, image = cap.read()
+                    if not ret:
+                        break
+                    yield StreamFrame(image=image, captured_at=time.time())
+            finally:
+                cap.release()
+
     def update(self):
         while not self.stopped:
-            if not self.frame_queue.full():
-                ret, frame = self.cap.read()
-                if not ret:
-                    self.stop()
-                else:
-                    self.frame_queue.put(frame)
+            try:
+                for frame in self.frames():
+                    self._publish(frame)
+            except (OSError, http.client.HTTPException) as e:
+                print(f"{self.ip_url}: {e}")
+            if not self.stopped:
+                self.reconnects += 1
+                time.sleep(self.reconnect_delay)
+
+    def _publish(self, frame: StreamFrame):
+        with self._lock:
+            self._frame = frame
+            self.sequence += 1
+            self._arrivals.append(frame.captured_at)
+        for listener in self.listeners:
+            listener(frame)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def read(self) -> Tuple[Optional[StreamFrame], int]:
+        """The latest frame and its sequence number (None, 0 before the first)"""
+        with self._lock:
+            return self._frame, self.sequence
+
+    def read_latest(self, since: int = 0) -> Optional[StreamFrame]:
+        """The latest frame if it is newer than sequence number `since`, otherwise None"""
+        frame, sequence = self.read()
+        return frame if sequence > since else None
 
-    def read(self):
-        return self.frame_queue.get()
+    @property
+    def fps(self) -> float:
+        """Frame rate over the last 30 frames"""
+        with self._lock:
+            if len(self._arrivals) < 2:
+                return 0.0
+            return (len(self._arrivals) - 1) / max(self._arrivals[-1] - self._arrivals[0], 1e-6)
+
+    @property
+    def staleness(self) -> float:
+        """Seconds since the latest frame arrived, infinite before the first"""
+        with self._lock:
+            return time.time() - self._frame.captured_at if self._frame is not None else float('inf')
 
     def stop(self):
         self.stopped = True
-        self.cap.release()
+        # The reader thread closes the connection once the next frame arrives
+
+
+class StreamPool:
+    """One IPStreamHandler per stream URL, started and stopped as URLs are added and removed"""
+
+    def __init__(self, reconnect_delay=2.0):
+        self.reconnect_delay = reconnect_delay
+        self.streams: Dict[str, IPStreamHandler] = {}
+        self._seen: Dict[str, int] = {}  # Sequence number last handed out per stream
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.streams)
+
+    def add(self, url: str) -> IPStreamHandler:
+        with self._lock:
+            stream = self.streams.get(url)
+            if stream is None:
+                stream = IPStreamHandler(url, self.reconnect_delay).start()
+                self.streams[url] = stream
+                self._seen[url] = 0
+            return stream
+
+    def remove(self, url: str):
+        with self._lock:
+            stream = self.streams.pop(url, None)
+            self._seen.pop(url, None)
+        if stream is not None:
+            stream.stop()
+
+    def sync(self, urls):
+        """Add the streams of urls that are missing, remove the ones not in urls"""
+        urls = set(urls)
+        for url in set(self.streams) - urls:
+            self.remove(url)
+        for url in urls:
+            self.add(url)
+
+    def latest_stream_frames(self) -> List[Tuple[str, StreamFrame]]:
+        """(url, StreamFrame) of every stream with a frame it has not handed out yet, not decoded"""
+        frames = []
+        with self._lock:
+            streams = list(self.streams.items())
+        for url, stream in streams:
+            frame, sequence = stream.read()
+            with self._lock:
+                # A stream removed meanwhile is left out, and gets no _seen entry back
+                if self.streams.get(url) is not stream or frame is None or sequence <= self._seen.get(url, 0):
+                    continue
+                self._seen[url] = sequence
+            frames.append((url, frame))
+        return frames
+
+    def latest_frames(self) -> List[Tuple[str, np.ndarray, float]]:
+        """(url, decoded image, arrival time) of every stream with a frame it has not handed out yet
+
+        Only these frames are decoded, the others are never looked at.
+        """
+        frames = []
+        for url, frame in self.latest_stream_frames():
+            image = frame.image
+            if image is not None:
+                frames.append((url, image, frame.captured_at))
+        return frames
+
+    def summary(self) -> List[str]:
+        """fps, staleness and reconnects of every stream, one line each"""
+        lines = []
+        for url, stream in list(self.streams.items()):
+            staleness = stream.staleness
+            stale = f"{staleness:.1f}s ago" if staleness != float('inf') else "no frames yet"
+            lines.append(f"{url}: {stream.fps:.1f} fps, last frame {stale}, {stream.reconnects} reconnects")
+        return lines
+
+    def stop(self):
+        for url in list(self.streams):
+            self.remove(url)
@@ -0,0 +1,175 @@
+"""
+Client for the multipart/x-mixed-replace MJPEG stream of the ESP32 firmware
+
+src/main.cpp serves /stream as
+
+    Content-Type: multipart/x-mixed-replace;boundary=frame
+
+    \\r\\n--frame\\r\\n
+    Content-Type: image/jpeg\\r\\nContent-Length: N\\r\\n\\r\\n
+    <N bytes of JPEG>
+
+MJPEGStream reads that straight off the socket and yields the JPEG bytes of
+every part with its arrival time, without decoding anything. StreamFrame
+decodes the pixels only when a consumer asks for them (inference), so
+recording a camera costs a memory copy, not a JPEG decode and re-encode.
+Parts without a Content-Length are split at the next boundary instead.
+"""
+
+import time
+import urllib.request
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+DEFAULT_BOUNDARY = b'frame'  # _STREAM_CONTENT_TYPE in src/main.cpp
+_READ_SIZE = 65536
+
+
+class StreamFrame:
+    """One frame of a stream: its JPEG bytes and/or its decoded pixels, each made on first use"""
+
+    def __init__(self, jpeg: Optional[bytes] = None, captured_at: float = 0.0,
+                 image: Optional[np.ndarray] = None, jpeg_quality: int = 90):
+        self._jpeg = jpeg
+        self._image = image
+        self.captured_at = captured_at  # Arrival time, seconds since the epoch
+        self.jpeg_quality = jpeg_quality
+
+    @property
+    def jpeg(self) -> bytes:
+        if self._jpeg is None:
+            ok, encoded = cv2.imencode('.jpg', self._image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            self._jpeg = encoded.tobytes() if ok else b''
+        return self._jpeg
+
+    @property
+    def image(self) -> Optional[np.ndarray]:
+        """BGR pixels, decoded once, None for a corrupt JPEG"""
+        if self._image is None and self._jpeg:
+            self._image = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+
+    @property
+    def decoded(self) -> bool:
+        return self._image is not None
+
+
+def jpeg_size(jpeg: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the JPEG's start-of-frame marker, without decoding it"""
+    position = 2
+    while position + 9 < len(jpeg):
+        if jpeg[position] != 0xFF:
+            return None
+        marker = jpeg[position + 1]
+        length = int.from_bytes(jpeg[position + 2:position + 4], 'big')
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(jpeg[position + 5:position + 7], 'big')
+            width = int.from_bytes(jpeg[position + 7:position + 9], 'big')
+            return width, height
+        position += 2 + length
+    return None
+
+
+def _boundary_of(content_type: str) -> bytes:
+    for parameter in content_type.split(';')[1:]:
+        name, _, value = parameter.strip().partition('=')
+        if name.lower() == 'boundary' and value:
+            return value.strip('"').encode()
+    return DEFAULT_BOUNDARY
+
+
+class MJPEGStream:
+    """Iterates over the JPEG parts of an MJPEG stream URL"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.response = None
+        self.frames_read = 0
+        self.bytes_read = 0
+
+    def open(self):
+        self.response = urllib.request.urlopen(self.url, timeout=self.timeout)
+        return self
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self) -> Iterator[StreamFrame]:
+        return self.frames()
+
+    def frames(self) -> Iterator[StreamFrame]:
+        """StreamFrames until the connection closes"""
+        if self.response is None:
+            self.open()
+        for jpeg in iter_parts(self.response, _boundary_of(self.response.headers.get('Content-Type', ''))):
+            self.frames_read += 1
+            self.bytes_read += len(jpeg)
+            yield StreamFrame(jpeg, time.time())
+
+
+def iter_parts(stream, boundary: bytes = DEFAULT_BOUNDARY) -> Iterator[bytes]:
+    """Bodies of the parts of a multipart stream read from a file-like object"""
+    delimiter = b'--' + boundary
+    buffer = bytearray()
+
+    def fill() -> bool:
+        data = stream.read1(_READ_SIZE) if hasattr(stream, 'read1') else stream.read(_READ_SIZE)
+        buffer.extend(data)
+        return bool(data)
+
+    while True:
+        # Up to and including the delimiter line
+        start = buffer.find(delimiter)
+        while start < 0:
+            # Keep a tail that could be the start of a split delimiter
+            del buffer[:max(0, len(buffer) - len(delimiter))]
+            if not fill():
+                return
+            start = buffer.find(delimiter)
+        del buffer[:start + len(delimiter)]
+
+        # Part headers, ending with an empty line
+        end = buffer.find(b'\r\n\r\n')
+        while end < 0:
+            if not fill():
+                return
+            end = buffer.find(b'\r\n\r\n')
+        headers = bytes(buffer[:end]).decode('latin-1').split('\r\n')
+        del buffer[:end + 4]
+        length = None
+        for line in headers:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    length = int(value.strip())
+                except ValueError:
+                    pass
+
+        if length is not None:
+            while len(buffer) < length:
+                if not fill():
+                    return
+            body = bytes(buffer[:length])
+            del buffer[:length]
+        else:
+            # No length, the body runs up to the next delimiter
+            end = buffer.find(b'\r\n' + delimiter)
+            while end < 0:
+                if not fill():
+                    return
+                end = buffer.find(b'\r\n' + delimiter)
+            body = bytes(buffer[:end])
+            del buffer[:end]
+        yield body
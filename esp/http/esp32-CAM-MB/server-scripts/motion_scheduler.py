@@ -0,0 +1,132 @@
+"""
+Motion-gated admission of camera frames to inference
+
+MotionScheduler sits between the StreamPool and the InferenceEngine. For
+every new frame of a camera it decodes a small grayscale version of the
+JPEG (cv2.IMREAD_REDUCED_GRAYSCALE_8 lets libjpeg scale down in the DCT
+domain) and compares it with the previous one. Only frames where enough
+pixels changed are decoded in full and sent to the model, so static scenes
+cost a fraction of a JPEG decode per frame instead of a forward pass.
+
+Each camera is still inferred at least every 1 / min_rate seconds, so a
+person standing still is not lost, and at most max_rate times a second
+however much motion there is, so one busy camera cannot take the batch
+from the others.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from inference_engine import CameraFrame
+from mjpeg_stream import StreamFrame
+
+# cv2.imdecode flags by scale denominator
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def small_gray(frame: StreamFrame, reduction: int = 8) -> Optional[np.ndarray]:
+    """Blurred grayscale frame at 1/reduction of its size, decoded from the JPEG when there is one"""
+    if frame.decoded:
+        image = frame.image
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (max(1, gray.shape[1] // reduction), max(1, gray.shape[0] // reduction)),
+                          interpolation=cv2.INTER_AREA)
+    else:
+        gray = cv2.imdecode(np.frombuffer(frame.jpeg, dtype=np.uint8), REDUCED_GRAYSCALE_FLAGS[reduction])
+        if gray is None:
+            return None
+    # Sensor noise and JPEG blocks should not count as motion
+    return cv2.GaussianBlur(gray, (3, 3), 0)
+
+
+def changed_fraction(previous: np.ndarray, current: np.ndarray, pixel_threshold: int = 25) -> float:
+    """Fraction of the pixels whose brightness changed by more than pixel_threshold"""
+    if previous.shape != current.shape:
+        return 1.0
+    return float(np.count_nonzero(cv2.absdiff(previous, current) > pixel_threshold)) / current.size
+
+
+class CameraSchedule:
+    """Motion and inference state of one camera"""
+
+    def __init__(self):
+        self.reference: Optional[np.ndarray] = None
+        self.last_inference = 0.0
+        self.last_motion = 0.0
+        self.checked = 0
+        self.moving = 0
+        self.admitted = 0
+        self.forced = 0  # Admitted by min_rate without motion
+
+
+class MotionScheduler:
+    """Admits the frames with motion to inference, within a minimum and maximum rate per camera"""
+
+    def __init__(self, min_area=0.005, pixel_threshold=25, min_rate=0.2, max_rate=2.0, reduction=8):
+        self.min_area = min_area                # Fraction of changed pixels that counts as motion
+        self.pixel_threshold = pixel_threshold  # Brightness change of a changed pixel, 0-255
+        self.min_rate = min_rate                # Inferences per second of every camera, motion or not
+        self.max_rate = max_rate                # Inferences per second of a camera, at most
+        self.reduction = reduction
+        self.cameras: Dict[str, CameraSchedule] = {}
+
+    def admit(self, camera: str, frame: StreamFrame, now: Optional[float] = None) -> bool:
+        """Whether this new frame of camera goes to inference"""
+        now = time.time() if now is None else now
+        state = self.cameras.setdefault(camera, CameraSchedule())
+        state.checked += 1
+        gray = small_gray(frame, self.reduction)
+        if gray is None:
+            return False
+        motion = (state.reference is None
+                  or changed_fraction(state.reference, gray, self.pixel_threshold) >= self.min_area)
+        state.reference = gray
+        if motion:
+            state.moving += 1
+            state.last_motion = now
+        since = now - state.last_inference
+        if self.max_rate > 0 and since < 1.0 / self.max_rate:
+            return False
+        if not motion:
+            if self.min_rate <= 0 or since < 1.0 / self.min_rate:
+                return False
+            state.forced += 1
+        state.admitted += 1
+        state.last_inference = now
+        return True
+
+    def select(self, frames: Sequence[Tuple[str, StreamFrame]],
+               on_skipped: Optional[Callable[[str, StreamFrame], None]] = None) -> List[CameraFrame]:
+        """(camera, decoded image, capture time) of the admitted frames, only these are decoded in full
+
+        on_skipped(camera, frame) is called with every frame left out.
+        """
+        selected = []
+        for camera, frame in frames:
+            if self.admit(camera, frame):
+                image = frame.image
+                if image is not None:
+                    selected.append((camera, image, frame.captured_at))
+            elif on_skipped:
+                on_skipped(camera, frame)
+        return selected
+
+    def forget(self, camera: str):
+        self.cameras.pop(camera, None)
+
+    def summary(self) -> List[str]:
+        """Frames checked, with motion and inferred of every camera, one line each"""
+        lines = []
+        for camera, state in list(self.cameras.items()):
+            share = 100.0 * state.admitted / state.checked if state.checked else 0.0
+            lines.append(f"{camera}: {state.checked} frames checked, {state.moving} with motion, "
+                         f"{state.admitted} inferred ({share:.0f}%, {state.forced} by minimum rate)")
+        return lines
@@ -1,73 +1,154 @@
-import cv2
+"""
+Event recording of a camera stream with pre-roll
+
+StreamSaver is fed every frame of a camera by the stream reader that is
+already open for inference (IPStreamHandler.add_listener), and keeps the
+last `pre_roll` seconds of them as JPEG bytes in a ring buffer. When an
+event starts a recording, the buffered frames are written first and the
+recording continues with the frames arriving from the same stream, so the
+moments before the detection are kept and the camera serves one connection.
+
+Detections drive a recording per camera through trigger(): the first one
+starts it, the following ones extend it while they keep coming, and it is
+closed once no detection arrived for `cooldown` seconds (or after
+`max_duration` seconds, the next detection then starting a new file).
+
+The JPEG bytes are copied into an AVI as received, with their arrival time
+in a TIMS chunk (see avi_recorder.py), without being decoded.
+"""
+
 import os
+import re
+import time
+from collections import deque
 from datetime import datetime
-from threading import Thread
+from threading import Condition, Thread
+
+from avi_recorder import TimsAVIWriter
+from mjpeg_stream import jpeg_size
 
 class StreamSaver():
 
-    def __init__(self, name):
+    def __init__(self, name, pre_roll=10.0, cooldown=15.0, max_duration=600.0):
         self.name = name
         self.is_recording = False
+        self.pre_roll = pre_roll  # Seconds of frames kept from before the event
+        self.cooldown = cooldown  # Seconds recorded after the last detection
+        self.max_duration = max_duration  # Longest single recording, in seconds
+        self._buffer = deque()  # (arrival time, JPEG bytes)
+        self._frames_ready = Condition()
+        self._record_started = 0.0
+        self._record_until = 0.0
+        self._thread = None
+        self.stopped = False
+        self.events = 0  # Recordings started
 
-    def save_stream_to_video(self, stream_url, output_dir, duration=60):
-        if self.is_recording :
-            return
-        self.is_recording = True
-        # Create and start the recording thread
-        thread = Thread(target=self.start_recording, args=[stream_url, output_dir, duration])
-        thread.daemon = True
-        thread.start()
+    def add_frame(self, frame):
+        """Append a StreamFrame of the stream, called by the stream reader for every frame"""
+        captured_at = frame.captured_at
+        with self._frames_ready:
+            self._buffer.append((captured_at, frame.jpeg))
+            if not self.is_recording:
+                # Only the pre-roll is kept between recordings
+                while self._buffer and self._buffer[0][0] < captured_at - self.pre_roll:
+                    self._buffer.popleft()
+            self._frames_ready.notify()
 
-    def start_recording(self, stream_url, output_dir, duration=60):
-        # Create the directory if it doesn't exist
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+    def trigger(self, output_dir="video-streams"):
+        """Start a recording for a detection, or extend the one in progress by the cooldown
 
-        # Get the current date and time for the filename
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        filename = f"{output_dir}/stream_{timestamp}.mp4"
+        Returns True if a recording was started.
+        """
+        return self._record(output_dir, self.cooldown)
 
-        # Capture the stream
-        cap = cv2.VideoCapture(stream_url)
+    def save_stream_to_video(self, stream_url=None, output_dir="video-streams", duration=60):
+        """Record the pre-roll and the next `duration` seconds of the stream, or extend the recording in progress
 
-        # Get the video stream properties
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        stream_url is not opened, the frames come from add_frame().
+        """
+        self._record(output_dir, duration)
 
-        # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
-
-        # Set a timer to stop recording after the specified duration (in seconds)
-        start_time = datetime.now()
+    def _record(self, output_dir, duration):
+        now = time.time()
+        with self._frames_ready:
+            if self.stopped:
+                return False
+            if self.is_recording:
+                # Extended, up to max_duration after its start
+                self._record_until = min(max(self._record_until, now + duration),
+                                         self._record_started + self.max_duration)
+                return False
+            self.is_recording = True
+            self.events += 1
+            self._record_started = now
+            self._record_until = min(now + duration, now + self.max_duration)
+        # Create and start the recording thread
+        self._thread = Thread(target=self.start_recording, args=[output_dir])
+        self._thread.daemon = True
+        self._thread.start()
+        return True
 
-        while (datetime.now() - start_time).seconds < duration:
-            ret, frame = cap.read()
+    def stop(self, timeout=10.0):
+        """End the recording in progress with the frames already received, and wait for its file to be closed"""
+        with self._frames_ready:
+            self.stopped = True
+            self._record_until = 0.0
+            self._frames_ready.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
 
-            if not ret:
-                print("Failed to grab frame")
-                break
+    def _next_frames(self):
+        """Take the buffered frames, waiting for new ones until the recording ends (empty list)"""
+        with self._frames_ready:
+            while not self._buffer:
+                remaining = self._record_until - time.time()
+                if remaining <= 0:
+                    self.is_recording = False
+                    return []
+                self._frames_ready.wait(timeout=min(remaining, 1.0))
+            frames = list(self._buffer)
+            self._buffer.clear()
+            return frames
 
-            # Write the frame to the video file
-            out.write(frame)
+    def start_recording(self, output_dir):
+        # Create the directory if it doesn't exist
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
 
-            """
-            # Display the frame (optional)
-            cv2.imshow('Stream', frame)
+        # Camera and time to the millisecond, cameras triggered in the same second write separate files
+        camera = re.sub(r'[^A-Za-z0-9_-]+', '_', self.name).strip('_') or 'camera'
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f')[:-3]
+        filename = f"{output_dir}/stream_{camera}_{timestamp}.avi"
 
-            # Stop if the 'q' key is pressed
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+        out = None
+        while True:
+            frames = self._next_frames()
+            if not frames:
                 break
-            """
+            for captured_at, jpeg in frames:
+                if out is None:
+                    size = jpeg_size(jpeg)
+                    if size is None:
+                        continue
+                    out = TimsAVIWriter(filename, *size)
+                # The JPEG bytes as received, with the arrival time as TIMS value
+                out.write(jpeg, int(captured_at * 1000))
+
         # Release everything if the job is finished
-        cap.release()
-        out.release()
-        cv2.destroyAllWindows()
-        print(f"Video saved: {filename}")
-        self.is_recording = False
+        if out is not None:
+            out.close()
+            print(f"Video saved: {filename} ({len(out)} frames)")
+        else:
+            print(f"No frames received from {self.name}, nothing saved")
 
 if __name__ == "__main__":
     # Example usage
-    stream_url = 'http://127.0.0.1'
-    StreamSaver(stream_url).start_recording(stream_url=stream_url, output_dir="video-streams", duration=60)
+    from iphandler import IPStreamHandler
+    stream_url = 'http://127.0.0.1/stream'
+    saver = StreamSaver(stream_url)
+    stream = IPStreamHandler(stream_url).start()
+    stream.add_listener(saver.add_frame)
+    time.sleep(saver.pre_roll)
+    saver.save_stream_to_video(output_dir="video-streams", duration=60)
+    time.sleep(61)
+    stream.stop()
@@ -0,0 +1,33 @@
+"""
+Tests of detection_log.py, run with: python3 -m pytest test_detection_log.py
+"""
+
+import numpy as np
+
+from detection_log import DetectionLog, query_detections
+
+NAMES = {0: 'person', 2: 'car'}
+
+
+def test_query_by_short_camera_name(tmp_path):
+    log = DetectionLog(str(tmp_path))
+    log.add('Camera2', 1700000000.0, [0, 2], [0.9, 0.5], [[1, 2, 3, 4], [5, 6, 7, 8]], NAMES)
+    log.add('Camera1', 1700000001.0, [0], [0.8], [[10, 20, 30, 40]], NAMES)
+    log.close()
+
+    records = query_detections(str(tmp_path), camera='Camera2', cls='person',
+                               start=1699999999.0, end=1700000002.0)
+    assert len(records) == 1
+    assert records[0]['camera'] == 'Camera2'
+    assert records[0]['name'] == 'person'
+    assert records[0]['timestamp_ms'] == 1700000000000
+    assert np.allclose(records[0]['xyxy'], [1, 2, 3, 4])
+
+
+def test_query_outside_time_range(tmp_path):
+    log = DetectionLog(str(tmp_path))
+    log.add('Camera2', 1700000000.0, [0], [0.9], [[1, 2, 3, 4]], NAMES)
+    log.close()
+
+    assert len(query_detections(str(tmp_path), camera='Camera2', start=1700000001.0)) == 0
+    assert len(query_detections(str(tmp_path), camera='Camera2._http._tcp.local.')) == 0
@@ -0,0 +1,178 @@
+"""
+IoU tracking of the detections of every camera
+
+The model is run in predict mode on frames picked by the MotionScheduler,
+so its boxes carry no identity. IoUTracker links the boxes of consecutive
+inferences of one camera into tracks with a stable id: every track moves at
+the velocity of its last observations, and a new box continues the track of
+the same class whose predicted box it overlaps most (IoU). A track that is
+not seen again for max_age seconds ends.
+
+Tracks let an event be handled once per object instead of once per frame:
+a person who stays in view for minutes is one new track, and a detection
+missed for a frame or two does not end it. Between two inferences,
+box_at() / boxes_at() interpolate where the tracks are, so inference can be
+run on only a fraction of the frames: draw_tracks() shows them on the frames
+left out (camera-stream.py in show mode).
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every box of a (N x 4, xyxy) with every box of b (M x 4)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-6)
+
+
+class Track:
+    """One object followed across the inferences of a camera"""
+
+    def __init__(self, track_id: int, cls: int, box: np.ndarray, confidence: float, seen_at: float):
+        self.track_id = track_id
+        self.cls = cls
+        self.box = np.asarray(box, dtype=np.float64)
+        self.velocity = np.zeros(4)  # Pixels per second of x1 y1 x2 y2
+        self.confidence = confidence
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+        self.hits = 1
+
+    def box_at(self, t: float, max_extrapolation: Optional[float] = None) -> np.ndarray:
+        """Where the box is at time t, moving at the track's velocity since it was last seen
+
+        The box stops moving max_extrapolation seconds after it was last seen,
+        a velocity held for longer sends it off the frame.
+        """
+        dt = t - self.last_seen
+        if max_extrapolation is not None:
+            dt = min(dt, max_extrapolation)
+        return self.box + self.velocity * dt
+
+    def update(self, box: np.ndarray, confidence: float, seen_at: float):
+        dt = seen_at - self.last_seen
+        if dt > 0:
+            # Smoothed, a single jittery box should not throw the prediction off
+            self.velocity = 0.5 * self.velocity + 0.5 * (np.asarray(box) - self.box) / dt
+        self.box = np.asarray(box, dtype=np.float64)
+        self.confidence = confidence
+        self.last_seen = seen_at
+        self.hits += 1
+
+    @property
+    def duration(self) -> float:
+        return self.last_seen - self.first_seen
+
+
+class IoUTracker:
+    """Tracks of one camera, updated with the boxes of every inference"""
+
+    def __init__(self, iou_threshold=0.3, max_age=3.0, min_confidence=0.25, max_extrapolation=1.0):
+        self.iou_threshold = iou_threshold          # Overlap with a predicted box to continue its track
+        self.max_age = max_age                      # Seconds a track lives on without being seen
+        self.min_confidence = min_confidence        # Lowest confidence of a box that starts a track
+        self.max_extrapolation = max_extrapolation  # Seconds a box keeps moving without being seen
+        self.tracks: List[Track] = []
+        self.next_id = 1
+
+    def update(self, seen_at: float, xyxy: np.ndarray, confidences: np.ndarray,
+               classes: np.ndarray) -> Tuple[np.ndarray, List[Track]]:
+        """Match the boxes of one inference to the tracks
+
+        Returns the track id of every box (0 for a box too weak to start a
+        track) and the tracks started by this update.
+        """
+        self.tracks = [track for track in self.tracks if seen_at - track.last_seen <= self.max_age]
+        xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        track_ids = np.zeros(len(xyxy), dtype=np.int64)
+        predicted = np.array([track.box_at(seen_at, self.max_extrapolation) for track in self.tracks]).reshape(-1, 4)
+        overlap = iou_matrix(predicted, xyxy)
+        # Only boxes of the track's class can continue it
+        track_classes = np.array([track.cls for track in self.tracks], dtype=np.int64)
+        overlap[track_classes[:, None] != np.asarray(classes, dtype=np.int64)[None, :]] = 0.0
+
+        # Greedily, most overlapping pairs first
+        matched_tracks = set()
+        for flat in np.argsort(overlap, axis=None)[::-1]:
+            t, d = np.unravel_index(flat, overlap.shape)
+            if overlap[t, d] < self.iou_threshold:
+                break
+            if t in matched_tracks or track_ids[d]:
+                continue
+            matched_tracks.add(t)
+            self.tracks[t].update(xyxy[d], float(confidences[d]), seen_at)
+            track_ids[d] = self.tracks[t].track_id
+
+        started = []
+        for d in np.flatnonzero(track_ids == 0):
+            if confidences[d] < self.min_confidence:
+                continue
+            track = Track(self.next_id, int(classes[d]), xyxy[d], float(confidences[d]), seen_at)
+            self.next_id += 1
+            self.tracks.append(track)
+            started.append(track)
+            track_ids[d] = track.track_id
+        return track_ids, started
+
+    def boxes_at(self, t: float) -> List[Tuple[int, int, np.ndarray]]:
+        """(track id, class, box) of every live track at time t, between or after inferences"""
+        return [(track.track_id, track.cls, track.box_at(t, self.max_extrapolation)) for track in self.tracks
+                if t - track.last_seen <= self.max_age]
+
+    def live_tracks(self, t: float, cls: Optional[int] = None) -> List[Track]:
+        """Tracks seen within max_age of t, of class cls if given"""
+        return [track for track in self.tracks
+                if t - track.last_seen <= self.max_age and (cls is None or track.cls == cls)]
+
+
+def draw_tracks(frame: np.ndarray, boxes: List[Tuple[int, int, np.ndarray]], names: dict) -> np.ndarray:
+    """Draw the (track id, class, box) of boxes_at() onto frame, in place, clipped to the frame"""
+    height, width = frame.shape[:2]
+    for track_id, cls, box in boxes:
+        x_min, x_max = np.clip(box[[0, 2]], 0, width - 1).astype(int).tolist()
+        y_min, y_max = np.clip(box[[1, 3]], 0, height - 1).astype(int).tolist()
+        if x_max <= x_min or y_max <= y_min:
+            # Moved out of the frame
+            continue
+        cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 200, 255), 2)
+        cv2.putText(frame, f"#{track_id} {names.get(cls, cls)}", (x_min, max(y_min - 5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 200, 255), 2)
+    return frame
+
+
+class CameraTrackers:
+    """One IoUTracker per camera"""
+
+    def __init__(self, **tracker_options):
+        self.tracker_options = tracker_options
+        self.trackers: Dict[str, IoUTracker] = {}
+
+    def __getitem__(self, camera: str) -> IoUTracker:
+        if camera not in self.trackers:
+            self.trackers[camera] = IoUTracker(**self.tracker_options)
+        return self.trackers[camera]
+
+    def update(self, detections) -> List[Track]:
+        """Track the boxes of a Detections, setting its track_ids, and return the tracks it started"""
+        tracker = self[detections.camera]
+        if len(detections) == 0:
+            detections.track_ids = np.zeros(0, dtype=np.int64)
+            tracker.update(detections.captured_at, np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+            return []
+        detections.track_ids, started = tracker.update(detections.captured_at, detections.xyxy,
+                                                       detections.confidences, detections.classes)
+        return started
+
+    def forget(self, camera: str):
+        self.trackers.pop(camera, None)